@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log
+
+# ------------------------------------------------------------------
+# Precomputed aggregates of consolidated_posts.json for the time-series and sentiment charts
+#
+# post-index.json: one slim row per post, as columns:
+#   {"id": [...], "createdAt": [epoch seconds], "topic": [topic_idx, -1 if none], "score": [body sentiment score],
+#    "comments": [numberOfComments]}
+# rollups.json: for every granularity (day, week, month) a "total" table keyed by period and a "by_topic"
+#   table keyed by (period, topic), each with the post count, mean / quartile body sentiment, and the
+#   total and mean comment counts, plus the topic labels:
+#   {"topics": {topic_idx: label}, "month": {"total": {"period": [...], "posts": [...], ...}, "by_topic": {...}}, ...}
+# Periods are UTC: "2022-05-03" (day), the Monday of the week "2022-05-02" (week), "2022-05" (month).
+#
+# Both are rebuilt incrementally: rows of posts that are new or changed since the last run are
+# replaced in the index, and only the periods those posts fall in (before and after the change) are
+# re-aggregated; the other periods are copied from the previous rollups. A post that disappeared from
+# the corpus, or --full, rebuilds everything.
+# ------------------------------------------------------------------
+
+GRANULARITIES = ["day", "week", "month"]
+INDEX_COLUMNS = ["id", "createdAt", "topic", "score", "comments"]
+STAT_COLUMNS = ["posts", "mean_score", "p25_score", "median_score", "p75_score", "comments", "mean_comments"]
+
+def slim_row(post_id, post):
+    sentiment = post.get("bodySentiment") or {}
+    topic = post.get("topic_idx")
+    return [
+        post_id,
+        post.get("createdAt", ""),
+        -1 if topic is None else int(topic),
+        sentiment.get("score"),
+        int(post.get("numberOfComments") or 0)
+    ]
+
+def epoch_seconds(created_at):
+    """ "2022-05-03T12:34:56.000Z" strings to epoch seconds (None where there is no date) """
+    dates = np.array([value.rstrip("Z") if value else "NaT" for value in created_at], dtype="datetime64[ms]")
+    seconds = dates.astype("datetime64[s]").astype(np.int64)
+    return [None if np.isnat(date) else int(s) for date, s in zip(dates, seconds)]
+
+def period_codes(seconds, granularity):
+    """ Integer period of every post (days or months since 1970; weeks as the day number of their Monday) """
+    days = np.floor_divide(seconds, 86400)
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        # 1970-01-01 was a Thursday
+        return days - (days + 3) % 7
+    if granularity == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"Unknown granularity {granularity!r}, expected one of {GRANULARITIES}")
+
+def period_label(code, granularity):
+    return str(np.datetime64(int(code), "M" if granularity == "month" else "D"))
+
+def round_or_none(value):
+    return None if np.isnan(value) else round(float(value), 3)
+
+def summarize(keys, scores, comments):
+    """ Stats of the posts grouped by keys (an (n_posts x k) int array); return (unique keys, stat columns) """
+    unique_keys, groups = np.unique(keys, axis=0, return_inverse=True)
+    groups = groups.ravel()
+    # posts sorted by group then score, so every group's scores are one sorted slice (NaNs last)
+    order = np.lexsort((scores, groups))
+    bounds = np.searchsorted(groups[order], np.arange(len(unique_keys) + 1))
+
+    stats = {column: [] for column in STAT_COLUMNS}
+    for g in range(len(unique_keys)):
+        members = order[bounds[g]:bounds[g + 1]]
+        group_scores = scores[members]
+        group_scores = group_scores[~np.isnan(group_scores)]
+        total_comments = int(comments[members].sum())
+        stats["posts"].append(len(members))
+        if len(group_scores):
+            stats["mean_score"].append(round(float(group_scores.mean()), 3))
+            for column, q in [("p25_score", 25), ("median_score", 50), ("p75_score", 75)]:
+                stats[column].append(round_or_none(np.percentile(group_scores, q)))
+        else:
+            for column in ["mean_score", "p25_score", "median_score", "p75_score"]:
+                stats[column].append(None)
+        stats["comments"].append(total_comments)
+        stats["mean_comments"].append(round(total_comments / len(members), 3))
+    return unique_keys, stats
+
+def rollup_tables(index, granularity, periods=None):
+    """ The total and by_topic tables of one granularity, for every period or only the given period codes """
+    dated = np.array([s is not None for s in index["createdAt"]], dtype=bool)
+    seconds = np.array([s if s is not None else 0 for s in index["createdAt"]], dtype=np.int64)[dated]
+    codes = period_codes(seconds, granularity)
+    topics = np.array(index["topic"], dtype=np.int64)[dated]
+    scores = np.array([np.nan if s is None else s for s in index["score"]], dtype=np.float64)[dated]
+    comments = np.array(index["comments"], dtype=np.int64)[dated]
+    if periods is not None:
+        keep = np.isin(codes, np.fromiter(periods, dtype=np.int64))
+        codes, topics, scores, comments = codes[keep], topics[keep], scores[keep], comments[keep]
+
+    tables = {}
+    for name, keys in [("total", codes[:, None]), ("by_topic", np.stack([codes, topics], axis=1))]:
+        unique_keys, stats = summarize(keys, scores, comments)
+        table = {"period": [period_label(code, granularity) for code in unique_keys[:, 0]]}
+        if name == "by_topic":
+            table["topic"] = unique_keys[:, 1].tolist()
+        table.update(stats)
+        tables[name] = table
+    return tables
+
+def merge_tables(old, new, granularity, dirty_periods):
+    """ old with the rows of dirty_periods replaced by the rows of new, sorted by (period, topic) """
+    dirty_labels = {period_label(code, granularity) for code in dirty_periods}
+    columns = list(new.keys())
+    rows = [tuple(old[c][i] for c in columns) for i in range(len(old["period"])) if old["period"][i] not in dirty_labels]
+    rows += [tuple(new[c][i] for c in columns) for i in range(len(new["period"]))]
+    rows.sort(key=lambda row: row[:2] if "topic" in columns else row[:1])
+    return {c: [row[j] for row in rows] for j, c in enumerate(columns)}
+
+def load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def write_compact(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def aggregate(posts_file, index_file, rollups_file, full=False):
+    """
+    Read the merged corpus once and (re)write the slim post index and the rollups.
+    Return the number of posts whose rows were added or changed.
+    """
+    with open(posts_file, "r") as f:
+        posts = json.load(f)
+
+    rows = [slim_row(post_id, post) for post_id, post in posts.items()]
+    for row, seconds in zip(rows, epoch_seconds([row[1] for row in rows])):
+        row[1] = seconds
+    topic_labels = {}
+    for post in posts.values():
+        if post.get("topic_idx") is not None:
+            topic_labels.setdefault(str(post["topic_idx"]), post.get("topic_label"))
+    del posts
+
+    old_index = None if full else load_json(index_file)
+    old_rollups = None if full else load_json(rollups_file)
+    previous = {}
+    if old_index is not None and old_rollups is not None:
+        previous = {post_id: [old_index[c][i] for c in INDEX_COLUMNS] for i, post_id in enumerate(old_index["id"])}
+        current_ids = {row[0] for row in rows}
+        if any(post_id not in current_ids for post_id in previous):
+            previous = {}
+            old_rollups = None
+
+    changed = [row for row in rows if previous.get(row[0]) != row]
+    index = {c: [row[j] for row in rows] for j, c in enumerate(INDEX_COLUMNS)}
+    write_compact(index_file, index)
+
+    rollups = {"topics": dict(sorted(topic_labels.items(), key=lambda item: int(item[0])))}
+    for granularity in GRANULARITIES:
+        if old_rollups is None:
+            rollups[granularity] = rollup_tables(index, granularity)
+            continue
+        # periods of the changed posts, where they are now and where they were before
+        touched = [row[1] for row in changed] + [previous[row[0]][1] for row in changed if row[0] in previous]
+        touched = np.array([s for s in touched if s is not None], dtype=np.int64)
+        dirty_periods = set(period_codes(touched, granularity).tolist())
+        new_tables = rollup_tables(index, granularity, dirty_periods)
+        rollups[granularity] = {name: merge_tables(old_rollups[granularity][name], new_tables[name], granularity, dirty_periods)
+                                for name in new_tables}
+    write_compact(rollups_file, rollups)
+    return len(changed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=str, default="../consolidated_posts.json")
+    parser.add_argument("--index", type=str, default="../post-index.json")
+    parser.add_argument("--rollups", type=str, default="../rollups.json")
+    parser.add_argument("--full", action="store_true", help="rebuild everything instead of only the periods of new or changed posts")
+    args = parser.parse_args()
+
+    n_changed = aggregate(args.posts, args.index, args.rollups, full=args.full)
+    log(1, f"{n_changed} new or changed posts aggregated into '{args.index}' and '{args.rollups}'.")
@@ -1,38 +1,219 @@
+import argparse
+import hashlib
+import heapq
 import json
+import os
+import sys
+import zlib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../../data"))
+from instrumentation import log
+
+CONFLICT_STRATEGIES = ["overwrite", "keep_original", "combine"]
+
+def combine_values(original, new):
+    """
+    Deep-combine two values: dicts are merged key by key (recursively), lists keep every item of the
+    original plus the items of the new list that aren't already in it, and for anything else the new value wins.
+    """
+    if isinstance(original, dict) and isinstance(new, dict):
+        combined = dict(original)
+        for key, value in new.items():
+            combined[key] = combine_values(combined[key], value) if key in combined else value
+        return combined
+    if isinstance(original, list) and isinstance(new, list):
+        combined = list(original)
+        seen = {json.dumps(item, sort_keys=True) for item in original}
+        for item in new:
+            serialized = json.dumps(item, sort_keys=True)
+            if serialized not in seen:
+                seen.add(serialized)
+                combined.append(item)
+        return combined
+    return new
+
+def merge_post(original, new, conflict_strategy):
+    """
+    Merge the fields of `new` into `original` (in place) and return it.
+    Fields only one side has are always kept; fields both sides have are resolved by conflict_strategy.
+    """
+    for key, value in new.items():
+        if key not in original:
+            original[key] = value
+        elif conflict_strategy == "overwrite":
+            original[key] = value
+        elif conflict_strategy == "combine":
+            original[key] = combine_values(original[key], value)
+        elif conflict_strategy != "keep_original":
+            raise ValueError(f"Unknown conflict strategy {conflict_strategy!r}, expected one of {CONFLICT_STRATEGIES}")
+    return original
+
+def read_posts(file):
+    """
+    Yield (post_id, post) from a post-keyed JSON file, or from a corpus_store directory without parsing
+    any JSON document. A store reads back exactly as `python -m corpus_store export` would write it.
+    """
+    if os.path.isdir(file):
+        from corpus_store import CorpusReader
+        yield from CorpusReader(file).iter_posts()
+        return
+    with open(file, 'r') as f:
+        data = json.load(f)
+    yield from data.items()
 
 # Function to merge data by ID with conflict resolution
 def merge_posts(files, conflict_strategy="overwrite"):
     consolidated_data = defaultdict(dict)
 
     for file in files:
-        with open(file, 'r') as f:
-            data = json.load(f)
-   
-            for post_id, post_data in data.items():
-                if post_id not in consolidated_data:
-                    consolidated_data[post_id] = post_data
-                else:
-                    # Handle conflicts for duplicate keys
-                    for key, value in post_data.items():
-                        if key not in consolidated_data[post_id]:
-                            consolidated_data[post_id][key] = value
-                        else:
-                            if conflict_strategy == "overwrite":
-                                consolidated_data[post_id][key] = value
-                            
+        for post_id, post_data in read_posts(file):
+            if post_id not in consolidated_data:
+                consolidated_data[post_id] = post_data
+            else:
+                # Handle conflicts for duplicate keys
+                merge_post(consolidated_data[post_id], post_data, conflict_strategy)
 
     return consolidated_data
 
-# List of files to consolidate
-input_files = ['main.json', 'sentiment.json', 'topic.json']
+# ------------------------------------------------------------------
+# Partitioned merge engine
+#
+# 1. map:    each input file is parsed in a worker process and split into n_partitions pieces by a
+#            stable hash of the post id. Each post remembers (input index, position) so the original
+#            first-seen order can be restored at the end.
+# 2. reduce: each partition is merged in a worker process, reading its piece of every input in input
+#            order, and written as JSON lines sorted by first-seen order.
+# 3. write:  the sorted partitions are k-way merged into the output file one post at a time.
+#
+# Every intermediate file is named after a hash of what it was built from (input path/size/mtime,
+# partition count, strategy) and written atomically, so an interrupted run picks up where it stopped
+# and adding one enrichment file only re-maps that file.
+# ------------------------------------------------------------------
+
+def partition_of(post_id, n_partitions):
+    return zlib.crc32(post_id.encode("utf-8")) % n_partitions
+
+def _input_key(file, n_partitions):
+    # a corpus store's manifest is written last, so it changes whenever the store is rebuilt
+    stat = os.stat(os.path.join(file, "manifest.json") if os.path.isdir(file) else file)
+    key = f"{os.path.abspath(file)}:{stat.st_size}:{stat.st_mtime_ns}:{n_partitions}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def _write_atomic(path, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def _map_input(file_index, file, map_dir, n_partitions):
+    """ Split one input file into partition pieces: map_dir/part-<p>.json, each {post_id: [position, post]} """
+    done_marker = os.path.join(map_dir, "done")
+    if os.path.exists(done_marker):
+        return map_dir
+
+    os.makedirs(map_dir, exist_ok=True)
+    pieces = [{} for _ in range(n_partitions)]
+    for position, (post_id, post_data) in enumerate(read_posts(file)):
+        pieces[partition_of(post_id, n_partitions)][post_id] = [position, post_data]
+
+    for p, piece in enumerate(pieces):
+        _write_atomic(os.path.join(map_dir, f"part-{p}.json"), lambda f: json.dump(piece, f))
+    _write_atomic(done_marker, lambda f: f.write(file))
+    return map_dir
+
+def _reduce_partition(p, map_dirs, output_path, conflict_strategy):
+    """ Merge partition p of every input into output_path as sorted JSON lines [input, position, post_id, post] """
+    if os.path.exists(output_path):
+        return output_path
+
+    merged = {}
+    for file_index, map_dir in enumerate(map_dirs):
+        with open(os.path.join(map_dir, f"part-{p}.json"), "r") as f:
+            piece = json.load(f)
+        for post_id, (position, post_data) in piece.items():
+            if post_id not in merged:
+                merged[post_id] = [file_index, position, post_id, post_data]
+            else:
+                merge_post(merged[post_id][3], post_data, conflict_strategy)
+
+    def write(f):
+        for entry in sorted(merged.values(), key=lambda entry: (entry[0], entry[1])):
+            f.write(json.dumps(entry) + "\n")
+    _write_atomic(output_path, write)
+    return output_path
+
+def _read_partition(path):
+    with open(path, "r") as f:
+        for line in f:
+            file_index, position, post_id, post_data = json.loads(line)
+            yield file_index, position, post_id, post_data
+
+def _write_posts(output_file, entries, indent):
+    """ Stream {post_id: post} formatted exactly like json.dump(..., indent=indent) """
+    def write(f):
+        if indent is None:
+            f.write("{")
+            for i, (_, _, post_id, post_data) in enumerate(entries):
+                f.write((", " if i > 0 else "") + json.dumps(post_id) + ": " + json.dumps(post_data))
+            f.write("}")
+            return
+        inner = "\n" + " " * indent
+        empty = True
+        for _, _, post_id, post_data in entries:
+            f.write(("{" if empty else ",") + inner)
+            f.write(json.dumps(post_id) + ": " + json.dumps(post_data, indent=indent).replace("\n", inner))
+            empty = False
+        f.write("{}" if empty else "\n}")
+    _write_atomic(output_file, write)
+
+def merge_posts_partitioned(files, output_file, conflict_strategy="overwrite", n_partitions=16, n_workers=None,
+                            work_dir=".merge-work", indent=4):
+    """
+    Merge post-keyed JSON files into output_file with the same result (and post order) as merge_posts,
+    parsing inputs and merging partitions in parallel worker processes and streaming the output.
+    Intermediate files in work_dir are reused by later runs with the same inputs.
+    """
+    if conflict_strategy not in CONFLICT_STRATEGIES:
+        raise ValueError(f"Unknown conflict strategy {conflict_strategy!r}, expected one of {CONFLICT_STRATEGIES}")
+
+    map_dirs = [os.path.join(work_dir, "map", _input_key(file, n_partitions)) for file in files]
+    reduce_key = hashlib.sha1(":".join(map_dirs + [conflict_strategy]).encode("utf-8")).hexdigest()[:16]
+    reduce_dir = os.path.join(work_dir, "reduce", reduce_key)
+    os.makedirs(reduce_dir, exist_ok=True)
+    reduce_paths = [os.path.join(reduce_dir, f"part-{p}.jsonl") for p in range(n_partitions)]
+
+    if n_workers == 1:
+        for i, file in enumerate(files):
+            _map_input(i, file, map_dirs[i], n_partitions)
+        for p in range(n_partitions):
+            _reduce_partition(p, map_dirs, reduce_paths[p], conflict_strategy)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(_map_input, range(len(files)), files, map_dirs, [n_partitions] * len(files)))
+            list(executor.map(_reduce_partition, range(n_partitions), [map_dirs] * n_partitions, reduce_paths,
+                              [conflict_strategy] * n_partitions))
+
+    entries = heapq.merge(*[_read_partition(path) for path in reduce_paths], key=lambda entry: (entry[0], entry[1]))
+    _write_posts(output_file, entries, indent)
 
-# Consolidate data with desired conflict resolution strategy
-# Options: "overwrite", "keep_original", "combine"
-consolidated_data = merge_posts(input_files, conflict_strategy="combine")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # List of files to consolidate
+    parser.add_argument("--inputs", nargs="+", default=['main.json', 'sentiment.json', 'topic.json'],
+                        help="post-keyed JSON files or corpus_store directories, in merge order")
+    parser.add_argument("--output", type=str, default='consolidated_posts.json')
+    # Options: "overwrite", "keep_original", "combine"
+    parser.add_argument("--strategy", type=str, choices=CONFLICT_STRATEGIES, default="combine")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--partitions", type=int, default=16, help="number of post id hash partitions")
+    parser.add_argument("--work-dir", type=str, default=".merge-work", help="where intermediate partitions are kept between runs")
+    args = parser.parse_args()
 
-# Save the consolidated data to a new file
-with open('consolidated_posts.json', 'w') as output_file:
-    json.dump(consolidated_data, output_file, indent=4)
+    # Consolidate data with desired conflict resolution strategy and save it to a new file
+    merge_posts_partitioned(args.inputs, args.output, conflict_strategy=args.strategy,
+                            n_partitions=args.partitions, n_workers=args.workers, work_dir=args.work_dir)
 
-print("Posts consolidated successfully into 'consolidated_posts.json'.")
+    log(1, f"Posts consolidated successfully into '{args.output}'.")
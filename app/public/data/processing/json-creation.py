@@ -1,9 +1,18 @@
+import argparse
 import csv
 import json
+import os
+import sqlite3
+import sys
+import tempfile
 from collections import defaultdict
 
-def process_csv_to_json(csv_file):
-    data = defaultdict(lambda: {
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log
+
+def empty_post():
+    return {
         "title": "",
         "body": "",
         "createdAt": "",
@@ -15,57 +24,147 @@ def process_csv_to_json(csv_file):
         "url": "",
         "username": "",
         "comments": []
-    })
+    }
 
+def read_rows(csv_file):
+    """
+    Yield (type, headers, row) for every row of the scraped CSV, with the BOM/quotes stripped from the headers.
+    """
     with open(csv_file, mode='r') as file:
         csv_reader = csv.DictReader(file)
         headers = [field.strip('\ufeff"') for field in csv_reader.fieldnames]
         csv_reader.fieldnames = headers 
         
         for row in csv_reader:
-            type = row["dataType"]
-            post_id = row["id"]
+            yield row["dataType"], headers, row
 
-            if type == "post":
+def post_fields(headers, row):
+    return {
+        "title": row["title"],
+        "body": row.get(headers[0], ""),
+        "createdAt": row["createdAt"],
+        "html": row.get("html", ""),
+        "numberOfComments": int(row.get("numberOfComments", 0)),
+        "upVoteRatio": float(row.get("upVoteRatio", 0)),
+        "upVotes": int(row.get("upVotes", 0)),
+        "url": row.get("url", ""),
+        "username": row.get("username", "")
+    }
 
-                # Populate the main post data
-                data[post_id].update({
-                    "title": row["title"],
-                    "body": row.get(headers[0], ""),
-                    "createdAt": row["createdAt"],
-                    "html": row.get("html", ""),
-                    "numberOfComments": int(row.get("numberOfComments", 0)),
-                    "upVoteRatio": float(row.get("upVoteRatio", 0)),
-                    "upVotes": int(row.get("upVotes", 0)),
-                    "url": row.get("url", ""),
-                    "username": row.get("username", "")
-                })
-                
-            elif type == "comment":
-                # Add comment to the post's comments array
-                comment = {
-                    "body": row.get(headers[0], ""),
-                    "parentID": row.get("postId", ""),
-                    "commentId": post_id,
-                    "url": row.get("url", ""),
-                    "username": row.get("username", ""),
-                    "createdAt": row["createdAt"]
-                }
-                data[row.get("postId")]["comments"].append(comment)
+def comment_fields(headers, row):
+    return {
+        "body": row.get(headers[0], ""),
+        "parentID": row.get("postId", ""),
+        "commentId": row["id"],
+        "url": row.get("url", ""),
+        "username": row.get("username", ""),
+        "createdAt": row["createdAt"]
+    }
 
-    # Convert defaultdict to regular dict
-    final_data = {"post": dict(data)}
+def process_csv_to_json(csv_file):
+    data = defaultdict(empty_post)
+
+    for type, headers, row in read_rows(csv_file):
+        post_id = row["id"]
+
+        if type == "post":
+            # Populate the main post data
+            data[post_id].update(post_fields(headers, row))
+            
+        elif type == "comment":
+            # Add comment to the post's comments array
+            data[row.get("postId")]["comments"].append(comment_fields(headers, row))
 
-    # Output JSON data
+    # Convert defaultdict to regular dict
     final_data = {"post": dict(data)}
     return final_data
 
-csv_file = "uncleaned-data.csv"
-json_result = process_csv_to_json(csv_file)
-output_file = "output.json"
+def stream_csv_to_json(csv_file, output_file):
+    """
+    Write the same document as json.dump(process_csv_to_json(csv_file), f) (no indent) without
+    holding the posts in memory.
+
+    The CSV is read once. Posts and comments are spilled into a temporary SQLite index keyed by post id,
+    which also remembers the order each post id was first seen in (a comment can show up before its
+    parent post). The JSON is then written post by post, streaming each post's comments out of the index.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = sqlite3.connect(os.path.join(tmp_dir, "index.sqlite"))
+        conn.execute("CREATE TABLE posts (ord INTEGER PRIMARY KEY, post_id TEXT UNIQUE NOT NULL, fields TEXT)")
+        conn.execute("CREATE TABLE comments (post_id TEXT NOT NULL, seq INTEGER NOT NULL, comment TEXT NOT NULL)")
+
+        for seq, (type, headers, row) in enumerate(read_rows(csv_file)):
+            if type == "post":
+                post_id = row["id"]
+                conn.execute("INSERT OR IGNORE INTO posts (post_id) VALUES (?)", (post_id,))
+                # later rows for the same post overwrite earlier ones, like dict.update
+                fields = json.loads(conn.execute("SELECT COALESCE(fields, '{}') FROM posts WHERE post_id = ?", (post_id,)).fetchone()[0])
+                fields.update(post_fields(headers, row))
+                conn.execute("UPDATE posts SET fields = ? WHERE post_id = ?", (json.dumps(fields), post_id))
+
+            elif type == "comment":
+                # json.dumps turns a missing (None) post id into the key "null"
+                parent_id = row.get("postId")
+                parent_id = "null" if parent_id is None else parent_id
+                conn.execute("INSERT OR IGNORE INTO posts (post_id) VALUES (?)", (parent_id,))
+                conn.execute("INSERT INTO comments VALUES (?, ?, ?)",
+                             (parent_id, seq, json.dumps(comment_fields(headers, row))))
+
+        conn.execute("CREATE INDEX comments_by_post ON comments (post_id, seq)")
+        conn.commit()
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write('{"post": {')
+            posts = conn.execute("SELECT post_id, COALESCE(fields, '{}') FROM posts ORDER BY ord")
+            for i, (post_id, fields) in enumerate(posts):
+                post = empty_post()
+                del post["comments"]
+                post.update(json.loads(fields))
+                if i > 0:
+                    f.write(", ")
+                # the post without its closing brace, then the comments array streamed after it
+                f.write(json.dumps(post_id) + ": " + json.dumps(post)[:-1] + ', "comments": [')
+                comments = conn.execute("SELECT comment FROM comments WHERE post_id = ? ORDER BY seq", (post_id,))
+                for j, (comment,) in enumerate(comments):
+                    if j > 0:
+                        f.write(", ")
+                    f.write(comment)
+                f.write("]}")
+            f.write("}}")
+        conn.close()
+
+def write_store(posts, store_path):
+    """
+    Write the posts returned by process_csv_to_json to a corpus_store directory, so later stages
+    (preprocess-data.py, generate.py, cleanup.py) can read them without parsing output.json.
+    """
+    from corpus_store import CorpusWriter
+    with CorpusWriter(store_path) as writer:
+        for post_id, post in posts["post"].items():
+            writer.add_post(post_id, post)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=str, default="uncleaned-data.csv")
+    parser.add_argument("--output", type=str, default="output.json")
+    parser.add_argument("--stream", action="store_true",
+                        help="convert with bounded memory through an on-disk index (output is not indented)")
+    parser.add_argument("--store", type=str, default=None, help="also write the posts to this corpus_store directory")
+    args = parser.parse_args()
+    if args.stream and args.store:
+        parser.error("--store needs the posts in memory and can't be combined with --stream")
+
+    if args.stream:
+        stream_csv_to_json(args.csv, args.output)
+    else:
+        json_result = process_csv_to_json(args.csv)
+
+        # Write JSON object directly to a file
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(json_result, f, indent=4)
 
-# Write JSON object directly to a file
-with open(output_file, 'w', encoding='utf-8') as f:
-    json.dump(json_result, f, indent=4)
+    log(1, f"JSON data has been written to {args.output}")
 
-print(f"JSON data has been written to {output_file}")
\ No newline at end of file
+    if args.store:
+        write_store(json_result, args.store)
+        log(1, f"Corpus store written to {args.store}")
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+import re
+
+# AFINN-165 scoring, the same as the `sentiment` npm package (v5) that analysis.js uses:
+#   - lowercase, turn newlines and punctuation into spaces, collapse runs of whitespace, split on spaces
+#   - every token in the lexicon adds its score, negated when the token right before it is a negator
+#   - comparative = score / number of tokens
+# The tokens are walked from last to first like the npm package does, so calculation / words /
+# positive / negative come out in the same (reversed) order. The npm package also scores emoji from
+# the Emoji Sentiment Ranking; those aren't in the AFINN lexicon and aren't scored here.
+
+NEGATORS = {"cant", "can't", "dont", "don't", "doesnt", "doesn't", "not", "non", "wont", "won't", "isnt", "isn't"}
+
+PUNCTUATION = re.compile(r'[.,/#!?$%^&*;:{}=_`"~()]')
+WHITESPACE_RUN = re.compile(r'\s\s+')
+
+# set in every process by loadLexicon
+labels = None
+
+def defaultLexiconFilepath():
+  # the lexicon file shipped with the afinn package (pip install afinn)
+  import afinn
+  return os.path.join(os.path.dirname(afinn.__file__), "data", "AFINN-en-165.txt")
+
+def loadLexicon(filepath=None):
+  """ Read a tab separated "word<TAB>score" AFINN file into the module's labels
+  """
+  global labels
+  labels = {}
+  with open(filepath or defaultLexiconFilepath(), "r", encoding="utf-8") as file:
+    for line in file:
+      word, score = line.rstrip("\n").rsplit("\t", 1)
+      labels[word] = int(score)
+  return labels
+
+def jsNumber(value):
+  # JSON.stringify writes 2.0 as 2, keep the output byte-compatible with results.json
+  return int(value) if float(value).is_integer() else value
+
+def tokenize(text):
+  text = PUNCTUATION.sub(" ", text.lower().replace("\n", " "))
+  return WHITESPACE_RUN.sub(" ", text).strip().split(" ")
+
+def analyze(text):
+  """ Score one text, returning the same object as the npm package's sentiment.analyze(text)
+  """
+  if labels is None:
+    loadLexicon()
+  tokens = tokenize(text or "")
+  score = 0
+  words = []
+  positive = []
+  negative = []
+  calculation = []
+  for i in range(len(tokens) - 1, -1, -1):
+    token = tokens[i]
+    if token not in labels:
+      continue
+    words.append(token)
+    tokenScore = labels[token]
+    if i > 0 and tokens[i - 1] in NEGATORS:
+      tokenScore = -tokenScore
+    if tokenScore > 0:
+      positive.append(token)
+    if tokenScore < 0:
+      negative.append(token)
+    score += tokenScore
+    calculation.append({token: tokenScore})
+
+  return {
+    "score": score,
+    "comparative": jsNumber(score / len(tokens)) if tokens else 0,
+    "calculation": calculation,
+    "tokens": tokens,
+    "words": words,
+    "positive": positive,
+    "negative": negative
+  }
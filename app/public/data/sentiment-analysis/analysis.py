@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from afinn_sentiment import analyze, jsNumber, loadLexicon
+from sentiment_cache import SentimentCache
+
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log
+
+# Python version of analysis.js + combine-data/test/preprocess.py:
+# scores the title, body and every comment of every post with AFINN-165 (see afinn_sentiment.py) and
+# writes {postId: {titleSentiment, bodySentiment, commentsSentiment, averageCommentScore, date}}, the
+# post-keyed shape combine-data/cleanup.py merges, directly.
+# Texts are scored in a process pool and cached by their hash, so a refresh only scores new texts.
+
+DEFAULT_CACHE_FILEPATH = "./cache/sentiment-cache.sqlite"
+DEFAULT_BATCH_SIZE = 256
+
+# bump this whenever the scoring changes so cached results get recomputed
+SCORER_VERSION = "afinn-165-1"
+
+def loadPosts(postsFilepath):
+  with open(postsFilepath, "r") as file:
+    return json.load(file)["post"]
+
+def postTexts(post):
+  yield post.get("title") or ""
+  yield post.get("body") or ""
+  for comment in post.get("comments") or []:
+    yield comment.get("body") or ""
+
+def scoreTexts(texts, nWorkers=None, batchSize=DEFAULT_BATCH_SIZE, lexiconFilepath=None):
+  """ Return {text: result} for the distinct texts, scored in nWorkers processes (1: in this process)
+  """
+  if nWorkers == 1:
+    loadLexicon(lexiconFilepath)
+    return {text: analyze(text) for text in texts}
+  with ProcessPoolExecutor(max_workers=nWorkers, initializer=loadLexicon, initargs=(lexiconFilepath,)) as executor:
+    return dict(zip(texts, executor.map(analyze, texts, chunksize=batchSize)))
+
+def postSentiment(post, results):
+  """ One post's entry, the same object analysis.js builds (minus the postId, which becomes the key)
+  """
+  entry = {
+    "titleSentiment": results[post.get("title") or ""],
+    "bodySentiment": results[post.get("body") or ""]
+  }
+  commentsSentiment = []
+  for index, comment in enumerate(post.get("comments") or []):
+    commentSentiment = {"commentId": index + 1}
+    if "username" in comment:
+      commentSentiment["username"] = comment["username"]
+    commentSentiment["sentiment"] = results[comment.get("body") or ""]
+    commentsSentiment.append(commentSentiment)
+  entry["commentsSentiment"] = commentsSentiment
+  totalCommentScore = sum(comment["sentiment"]["score"] for comment in commentsSentiment)
+  entry["averageCommentScore"] = jsNumber(totalCommentScore / len(commentsSentiment)) if commentsSentiment else 0
+  if "createdAt" in post:
+    entry["date"] = post["createdAt"]
+  return entry
+
+# writes {postId: entry} exactly like json.dump(..., indent=4), one post at a time
+def writeIndentedEntry(outputFile, postId, entry, first):
+  outputFile.write("{\n" if first else ",\n")
+  outputFile.write("    " + json.dumps(postId) + ": " + json.dumps(entry, indent=4).replace("\n", "\n    "))
+
+def run(postsFilepath, outputFilepath, nWorkers=None, batchSize=DEFAULT_BATCH_SIZE, cache=None, lexiconFilepath=None):
+  posts = loadPosts(postsFilepath)
+  if cache is None:
+    cache = SentimentCache(":memory:", SCORER_VERSION)
+
+  texts = list(dict.fromkeys(text for post in posts.values() for text in postTexts(post)))
+  results = cache.getMany(texts)
+  missing = [text for text in texts if text not in results]
+
+  start = time.perf_counter()
+  scored = scoreTexts(missing, nWorkers, batchSize, lexiconFilepath) if missing else {}
+  elapsed = time.perf_counter() - start
+  cache.putMany(scored)
+  cache.dropOtherVersions()
+  cache.commit()
+  results.update(scored)
+  log(1, f"Scored {len(missing)} new texts of {len(texts)} in {elapsed:.2f}s ({len(missing) / max(elapsed, 1e-9):.1f} texts/sec, workers={nWorkers})")
+
+  with open(outputFilepath, "w") as outputFile:
+    for i, (postId, post) in enumerate(posts.items()):
+      writeIndentedEntry(outputFile, postId, postSentiment(post, results), first=(i == 0))
+    outputFile.write("\n}" if posts else "{}")
+
+  stats = cache.stats()
+  log(1, f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+  log(1, f"Sentiment analysis results written to {outputFilepath}")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--posts", type=str, default="../output.json", help="posts json file ({\"post\": {postId: post}})")
+  parser.add_argument("--output", type=str, default="../processing/combine-data/sentiment.json", help="post-keyed output merged by cleanup.py")
+  parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU, 1: no pool)")
+  parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="texts sent to a worker at a time")
+  parser.add_argument("--lexicon", type=str, default=None, help="AFINN file (default: AFINN-en-165 from the afinn package)")
+  parser.add_argument("--cache", type=str, default=DEFAULT_CACHE_FILEPATH, help="sqlite file caching scored texts")
+  parser.add_argument("--no-cache", action="store_true", help="score every text without reading or writing the cache")
+  args = parser.parse_args()
+
+  cache = SentimentCache(":memory:" if args.no_cache else args.cache, SCORER_VERSION)
+  run(args.posts, args.output, nWorkers=args.workers, batchSize=args.batch_size, cache=cache, lexiconFilepath=args.lexicon)
+  cache.close()
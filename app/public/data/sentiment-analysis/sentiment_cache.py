@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+# persistent cache for analysis.py
+# each scored text (title, body or comment) is stored under (sha256 of the text, scorer version), so
+# a refresh only scores comments and posts that weren't seen before. Identical texts share one entry.
+
+def hashText(text):
+  return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class SentimentCache:
+  """ SQLite store of sentiment results keyed by text hash, with hit/miss counters for the current run
+  """
+
+  def __init__(self, path, scorerVersion):
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self.path = path
+    self.scorerVersion = scorerVersion
+    self.conn = sqlite3.connect(path)
+    self.conn.execute("""
+      CREATE TABLE IF NOT EXISTS scored (
+        text_hash TEXT NOT NULL,
+        version TEXT NOT NULL,
+        result TEXT NOT NULL,
+        PRIMARY KEY (text_hash, version)
+      )
+    """)
+    self.conn.commit()
+    self.hits = 0
+    self.misses = 0
+
+  def getMany(self, texts):
+    """ Return {text: cached result} for the texts that are cached, counting hits and misses
+    """
+    found = {}
+    for text in texts:
+      row = self.conn.execute(
+        "SELECT result FROM scored WHERE text_hash = ? AND version = ?",
+        (hashText(text), self.scorerVersion)).fetchone()
+      if row is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+        found[text] = json.loads(row[0])
+    return found
+
+  def putMany(self, results):
+    """ Store {text: result}
+    """
+    self.conn.executemany(
+      "INSERT OR REPLACE INTO scored VALUES (?, ?, ?)",
+      [(hashText(text), self.scorerVersion, json.dumps(result)) for text, result in results.items()])
+
+  def dropOtherVersions(self):
+    """ Results of an older scorer can never be hit again; returns how many were dropped
+    """
+    cursor = self.conn.execute("DELETE FROM scored WHERE version != ?", (self.scorerVersion,))
+    return max(cursor.rowcount, 0)
+
+  def stats(self):
+    entries = self.conn.execute("SELECT COUNT(*) FROM scored").fetchone()[0]
+    return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+  def commit(self):
+    self.conn.commit()
+
+  def close(self):
+    self.conn.commit()
+    self.conn.close()
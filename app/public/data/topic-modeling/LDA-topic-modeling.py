@@ -1,16 +1,31 @@
 # using scikit learn to do topic modeling 
+import argparse
 import json
+import os
+import sys
 from sklearn.feature_extraction.text import TfidfVectorizer # num occur in doc / num occur in all docs
 from sklearn.feature_extraction.text import CountVectorizer # num occur in doc only 
 from sklearn.decomposition import LatentDirichletAllocation # LDA, used for topic modeling 
 import matplotlib.pyplot as plt
 import numpy as np
+from topic_model_store import saveModel
+from topic_weights import ASSIGNMENTS_FILEPATHS, TOPIC_WEIGHTS_FILEPATHS, assignmentsJSON, saveTopicWeights, topK
 
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log, stage
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--root-words", type=str, default="../cleaned-root-words.json", help="root words of every letter, from preprocess-data.py")
+args = parser.parse_args()
 
 # STEP 1: load json file with cleaned root words 
-with open("../cleaned-root-words.json", "r") as rootwordsFile:
+with open(args.root_words, "r") as rootwordsFile:
   rootWords = json.load(rootwordsFile)
 
+postIds = list(rootWords.keys())
+
 # STEP 2: flatten the dictionary and turn it into a document for topic modeling
 # documents = ["all the words of letter 1", "all words of letter 2", ...] (array of joined strings)
 documents = [" ".join(words) for words in rootWords.values()]
@@ -21,32 +36,47 @@ documents = [" ".join(words) for words in rootWords.values()]
 # (col: terms, rows: documents, intersections: count of how many times the word shows up in doc)
 # vectorizer = TfidfVectorizer()
 vectorizer = CountVectorizer()
-dtm = vectorizer.fit_transform(documents)
+with stage("lda.vectorize", letters=len(documents)):
+  dtm = vectorizer.fit_transform(documents)
 words = vectorizer.get_feature_names_out() # the unique words over all the letters (cols in dtm)
 
-print(f"DTM shape: {dtm.shape}")  # Example: (3, 9) for 3 letters and 9 unique words
-print(f"Vocabulary: {words}")
+log(1, f"DTM shape: {dtm.shape}")  # Example: (3, 9) for 3 letters and 9 unique words
+log(2, f"Vocabulary: {words}")
 
 
 # STEP 4: run LDA 
 num_topics = 15
 lda = LatentDirichletAllocation(n_components=num_topics, random_state=42, max_iter=200)
-lda.fit(dtm)
+with stage("lda.fit", topics=num_topics, letters=dtm.shape[0], words=dtm.shape[1]) as fit:
+  lda.fit(dtm)
+  fit["iterations"] = int(lda.n_iter_)
 
 # STEP 5: extract the top topics for each letter (top themes from each letter)
 def extract_topics(model, featureNames, topWordsCt): 
-  for topicIdx, topic in enumerate(model.components_):
-    print(f"Topic {topicIdx}:")
-    print(" ".join([featureNames[i] for i in topic.argsort()[:-topWordsCt - 1:-1]]))
+  topWordIdx, _ = topK(model.components_, topWordsCt)
+  for topicIdx in range(model.components_.shape[0]):
+    log(2, f"Topic {topicIdx}:")
+    log(2, " ".join([featureNames[i] for i in topWordIdx[topicIdx]]))
 
 extract_topics(lda, words, topWordsCt=20)
 
+# save the fitted vectorizer + model so update-topics.py can fold new letters in with partial_fit
+saveModel("./results/lda-model.joblib", "lda", vectorizer, lda, dtm)
+
 # STEP 6: topic analysis 
-numLettersPerTopic = lda.transform(dtm)
+with stage("lda.transform"):
+  numLettersPerTopic = lda.transform(dtm)
 topTopics = np.argmax(numLettersPerTopic, axis=1)
 topicCounts = np.bincount(topTopics)
 letterTopics = {i: topTopics[i] for i in range(len(documents))}
 
+# LDA's own copy of the per-letter results (the NMF files are what the site reads), so update-topics.py
+# can append the topics of new letters to it
+topTopicIdx, topTopicWeights = topK(numLettersPerTopic, 2)
+with open(ASSIGNMENTS_FILEPATHS["lda"], "w") as resultsFile:
+  json.dump(assignmentsJSON(postIds, numLettersPerTopic, topTopicIdx, topTopicWeights), resultsFile, indent=4)
+saveTopicWeights(TOPIC_WEIGHTS_FILEPATHS["lda"], postIds, numLettersPerTopic, topTopicIdx)
+
 for topic_num, count in enumerate(topicCounts):
-    print(f"Topic {topic_num}: {count} letters")
+    log(2, f"Topic {topic_num}: {count} letters")
 
@@ -1,15 +1,33 @@
-git# using scikit learn to do topic modeling 
+# using scikit learn to do topic modeling 
+import argparse
 import json
+import os
+import sys
 from sklearn.feature_extraction.text import TfidfVectorizer # num occur in doc / num occur in all docs
 from sklearn.decomposition import NMF
 from sklearn.feature_extraction.text import CountVectorizer # num occur in doc only 
 from sklearn.decomposition import LatentDirichletAllocation # LDA, used for topic modeling 
 import matplotlib.pyplot as plt
 import numpy as np
+from topic_model_store import saveModel
+from topic_weights import TOPIC_WEIGHTS_FILEPATH, assignmentsJSON, saveTopicWeights, topK
 
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log, stage
+
+# how many topics to keep per letter (at least 2: the first two go into top_topics_with_weights.json,
+# all of them into topic-weights.npz) and how many words to keep per topic
+top_topics_count = 2
+top_words_count = 20
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--root-words", type=str, default="../cleaned-root-words.json", help="root words of every letter, from preprocess-data.py")
+args = parser.parse_args()
 
 # STEP 1: load json file with cleaned root words 
-with open("../cleaned-root-words.json", "r") as rootwordsFile:
+with open(args.root_words, "r") as rootwordsFile:
   rootWords = json.load(rootwordsFile)
 
 post_ids = list(rootWords.keys()) # getting all the post ids for saving later 
@@ -24,16 +42,19 @@ documents = [" ".join(words) for words in rootWords.values()]
 # dtm = document-term matrix 
 # (col: terms, rows: documents, intersections: count of how many times the word shows up in doc)
 vectorizer = TfidfVectorizer()
-dtm = vectorizer.fit_transform(documents)
+with stage("nmf.vectorize", letters=len(documents)):
+  dtm = vectorizer.fit_transform(documents)
 words = vectorizer.get_feature_names_out() # the unique words over all the letters (cols in dtm)
 
-print(f"DTM shape: {dtm.shape}")  # Example: (3, 9) for 3 letters and 9 unique words
-print(f"Vocabulary: {words}")
+log(1, f"DTM shape: {dtm.shape}")  # Example: (3, 9) for 3 letters and 9 unique words
+log(2, f"Vocabulary: {words}")
 
 # STEP 4: run LDA 
 num_topics = 15
 nmf = NMF(n_components=num_topics, random_state=42)
-nmf.fit(dtm)
+with stage("nmf.fit", topics=num_topics, letters=dtm.shape[0], words=dtm.shape[1]) as fit:
+  nmf.fit(dtm)
+  fit["iterations"] = int(nmf.n_iter_)
 # words = vectorizer.get_feature_names_out() # the unique words over all the letters (cols in dtm)
 
 
@@ -42,42 +63,29 @@ nmf.fit(dtm)
 # each row is a letter 
 # each column is one of the topics NMF discovered 
 # each val is strength/weight of topic in letter 
-topic_distribution = nmf.transform(dtm)
+with stage("nmf.transform"):
+  topic_distribution = nmf.transform(dtm)
 # print(topic_distribution)
 
 # array of indices with largest topic value for each letter
 dominant_topics = np.argmax(topic_distribution, axis=1) 
 # print(dominant_topics)
 
-# sorts topic weights in ascending order and gets top two largest 
-sorted_topic_indices = np.argsort(topic_distribution, axis=1)
-top_two_topic_idx = sorted_topic_indices[:, -2:][:, ::-1]
-print("sorted indices")
-print(sorted_topic_indices)
-
-# get the weights associated with top two topics
-top_two_weights = np.take_along_axis(topic_distribution, top_two_topic_idx, axis=1)
-
-print("Top two topics (indices):")
-print(top_two_topic_idx)
-print("Top two weights:")
-print(top_two_weights)
-
-results = []
-for i in range(len(post_ids)):
-  result = {
-    "post_id": post_ids[i],
-    "topics": {
-      "first": {"topic": int(top_two_topic_idx[i, 0]), "weight": float(top_two_weights[i, 0])},
-      "second": {"topic": int(top_two_topic_idx[i, 1]), "weight": float(top_two_weights[i, 1])}
-    },
-    "all_weights": topic_distribution[i].tolist()
-  }
-  results.append(result)
+# indices and weights of the top topics for each letter, largest first
+top_topic_idx, top_topic_weights = topK(topic_distribution, max(top_topics_count, 2))
+log(1, f"Top {top_topic_idx.shape[1]} topics picked for {len(post_ids)} letters")
+
+results = assignmentsJSON(post_ids, topic_distribution, top_topic_idx, top_topic_weights)
 
 # save results to a file 
-with open("./results/top_topics_with_weights.json", "w") as resultsFile:
-    json.dump(results, resultsFile, indent=4)
+with stage("nmf.save"):
+  with open("./results/top_topics_with_weights.json", "w") as resultsFile:
+      json.dump(results, resultsFile, indent=4)
+  # compact float32 copy for layout.py and clean-topic-assignments.py
+  saveTopicWeights(TOPIC_WEIGHTS_FILEPATH, post_ids, topic_distribution, top_topic_idx)
+
+  # save the fitted vectorizer + model so update-topics.py can assign topics to new letters without a refit
+  saveModel("./results/nmf-model.joblib", "nmf", vectorizer, nmf, dtm, W=topic_distribution)
 
 
 
@@ -88,12 +96,12 @@ topic_counts = np.bincount(dominant_topics)  # Count the occurrences of each top
 # STEP 6B : extract the top topics for each letter (top themes from each letter)
 topics = []
 def extract_topics(model, feature_names, top_words_count=20):
-  for topic_idx, topic in enumerate(model.components_):
-    print(f"Topic {topic_idx}:")
-    top_word_idx = topic.argsort()[-top_words_count:][::-1]  # Sort and get top words
-    top_words = [feature_names[i] for i in top_word_idx]  # Match words to indices
-    print(" ".join(top_words))
-    print()
+  top_word_idx, _ = topK(model.components_, top_words_count)  # top words of every topic at once
+  for topic_idx in range(model.components_.shape[0]):
+    log(2, f"Topic {topic_idx}:")
+    top_words = [feature_names[i] for i in top_word_idx[topic_idx]]  # Match words to indices
+    log(2, " ".join(top_words))
+    log(2)
     topic = {
       "topic": topic_idx, 
       "top_words": top_words,
@@ -101,7 +109,7 @@ def extract_topics(model, feature_names, top_words_count=20):
     }
     topics.append(topic)
 
-extract_topics(nmf, words)
+extract_topics(nmf, words, top_words_count)
 
 # save topics to a file
 with open("../topics_NMF_15.json", "w") as topicsFile:
@@ -1,9 +1,14 @@
 import json 
+import os
+import sys
+from topic_weights import loadTopicWeights
 
-# import the topic assignments file (the old cluttered one) 
-with open("./results/top_topics_with_weights.json", "r") as assignmentsFile:
-  topicAssignments = json.load(assignmentsFile)
-# print(topicAssignments)
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log, stage
+
+# import the topic assignments (compact copy of the old cluttered top_topics_with_weights.json)
+postIds, _, topTopics = loadTopicWeights()
 
 # import the topic ref file (will use to get all the text labels from it)
 with open("./results/topics_NMF_15.json", "r") as topicsRefFile:
@@ -12,15 +17,14 @@ with open("./results/topics_NMF_15.json", "r") as topicsRefFile:
 
 # create json structure for cleaned topic assignments
 assignmentsDict = {}
-for post in topicAssignments:
-  postIdx = post["topics"]["first"]["topic"]
+for postId, postIdx in zip(postIds, topTopics[:, 0].tolist()):
   postInfo = {
     "idx": postIdx,
     "label": topicsRef[postIdx]["label"]
   }
-  assignmentsDict[post["post_id"]] = postInfo
-print(assignmentsDict)
-print("number of total letters in dictionary: ", len(assignmentsDict))
+  assignmentsDict[postId] = postInfo
+log(2, assignmentsDict)
+log(1, "number of total letters in dictionary: ", len(assignmentsDict))
 
 # export to ./results/final-topic-assignments.json
 with open("./results/final-topic-assignments.json", "w") as cleanedAssignmentsFile:
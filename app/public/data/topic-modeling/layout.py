@@ -0,0 +1,258 @@
+# 2-D layouts of the letters' topic weights for the topic modeling visualizations
+# (replaces pca-reduction.py and tsne-reduction.py)
+#
+# methods (LAYOUT_METHODS, add a function there to add one):
+#   pca:            exact PCA
+#   randomized-pca: PCA with a randomized SVD, for large corpora
+#   tsne:           Barnes-Hut t-SNE on the kNN graph, initialized with the PCA layout
+#   knn-graph:      UMAP-style layout: spectral embedding of the fuzzy kNN graph
+#
+# the kNN graph is built once per run and cached in ./cache, keyed on the weights, so t-SNE and the
+# kNN-graph layout (and the next run) share it.
+#
+# with --place-new, letters added since the last full layout (e.g. by update-topics.py) are placed on
+# the existing map without moving any point: PCA layouts project them with the stored PCA, t-SNE and
+# kNN-graph layouts put them at the distance-weighted average position of their nearest laid-out
+# letters. Only the new points are written, to a delta file next to the layout.
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.sparse
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE, SpectralEmbedding
+from sklearn.neighbors import NearestNeighbors
+
+from topic_weights import loadTopicWeights
+
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log, stage
+
+DEFAULT_CACHE_DIR = "./cache"
+DEFAULT_PERPLEXITY = 30
+DEFAULT_KNN_GRAPH_NEIGHBORS = 15
+DEFAULT_PLACEMENT_NEIGHBORS = 10
+
+OUTPUT_FILEPATHS = {
+  "pca": "./results/reduced-data.json",
+  "randomized-pca": "./results/randomized-pca-reduced-data.json",
+  "tsne": "./results/tsne-reduced-data.json",
+  "knn-graph": "./results/knn-graph-reduced-data.json"
+}
+
+class Layouts:
+  """ What the layout methods share for one set of weights: seed, n_jobs, the fitted PCAs, the PCA layout and the kNN graph """
+
+  def __init__(self, weights, seed=42, nJobs=None, cacheDir=DEFAULT_CACHE_DIR,
+               perplexity=DEFAULT_PERPLEXITY, knnGraphNeighbors=DEFAULT_KNN_GRAPH_NEIGHBORS):
+    self.weights = np.ascontiguousarray(weights)
+    self.seed = seed
+    self.nJobs = nJobs
+    self.cacheDir = cacheDir
+    # t-SNE needs 3 * perplexity neighbors, and a perplexity below the number of letters
+    self.perplexity = min(perplexity, max((self.weights.shape[0] - 1) / 3, 1))
+    self.knnGraphNeighbors = knnGraphNeighbors
+    # one graph with enough neighbors for every method, whichever runs first
+    self.graphNeighbors = min(max(tsneNeighbors(self.perplexity), knnGraphNeighbors), self.weights.shape[0] - 1)
+    # the fitted PCA of each PCA method, kept for placing new letters later
+    self.pcas = {}
+    self.pcaLayout = None
+    self.graph = None
+
+  def knnGraph(self, k):
+    """ Sparse (letters x letters) euclidean distances to each letter's k nearest neighbors (itself excluded) """
+    if self.graph is None:
+      self.graph = self.loadOrBuildGraph()
+    return self.keepNearest(self.graph, min(k, self.graphNeighbors))
+
+  def loadOrBuildGraph(self):
+    cacheFilepath = None
+    if self.cacheDir is not None:
+      os.makedirs(self.cacheDir, exist_ok=True)
+      digest = hashlib.sha1(self.weights.tobytes() + str(self.weights.shape).encode("utf-8")).hexdigest()[:16]
+      cacheFilepath = os.path.join(self.cacheDir, f"knn-graph-{digest}-{self.graphNeighbors}.npz")
+      if os.path.exists(cacheFilepath):
+        return scipy.sparse.load_npz(cacheFilepath).tocsr()
+
+    with stage("layout.knn-graph", letters=self.weights.shape[0], neighbors=self.graphNeighbors):
+      nn = NearestNeighbors(n_neighbors=self.graphNeighbors, n_jobs=self.nJobs).fit(self.weights)
+      graph = nn.kneighbors_graph(mode="distance").tocsr()
+    if cacheFilepath is not None:
+      scipy.sparse.save_npz(cacheFilepath, graph)
+    return graph
+
+  @staticmethod
+  def keepNearest(graph, k):
+    """ The k nearest of each row's neighbors (kneighbors_graph stores every row's neighbors nearest first) """
+    starts = graph.indptr[:-1]
+    cols = (starts[:, None] + np.arange(k)[None, :]).ravel()
+    indptr = np.arange(0, graph.shape[0] * k + 1, k)
+    return scipy.sparse.csr_matrix((graph.data[cols], graph.indices[cols], indptr), shape=graph.shape)
+
+def tsneNeighbors(perplexity):
+  # sklearn's t-SNE uses the 3 * perplexity + 1 nearest neighbors, and asks a precomputed graph for
+  # one more (expecting the letter itself among them)
+  return int(3 * perplexity + 1) + 1
+
+# ----- layout methods: each takes a Layouts and returns (letters x 2) coordinates -----
+
+def pcaLayout(layouts):
+  if layouts.pcaLayout is None:
+    layouts.pcas["pca"] = PCA(n_components=2, svd_solver="full")
+    layouts.pcaLayout = layouts.pcas["pca"].fit_transform(layouts.weights)
+  return layouts.pcaLayout
+
+def randomizedPCALayout(layouts):
+  layouts.pcas["randomized-pca"] = PCA(n_components=2, svd_solver="randomized", random_state=layouts.seed)
+  return layouts.pcas["randomized-pca"].fit_transform(layouts.weights)
+
+def tsneLayout(layouts):
+  # sklearn's t-SNE works on squared euclidean distances
+  distances = layouts.knnGraph(tsneNeighbors(layouts.perplexity)).copy()
+  distances.data **= 2
+  # same initialization as init="pca" (which can't be combined with a precomputed graph)
+  init = pcaLayout(layouts).astype(np.float32)
+  init = init / max(np.std(init[:, 0]), 1e-12) * 1e-4
+  tsne = TSNE(n_components=2, perplexity=layouts.perplexity, metric="precomputed", init=init,
+              method="barnes_hut", random_state=layouts.seed, n_jobs=layouts.nJobs)
+  return tsne.fit_transform(distances)
+
+def knnGraphLayout(layouts):
+  distances = layouts.knnGraph(layouts.knnGraphNeighbors)
+  # UMAP's fuzzy membership: exp(-(d - d to the nearest neighbor) / sigma) per letter, then the
+  # fuzzy union A + A^T - A * A^T so the graph is symmetric
+  rows = np.repeat(np.arange(distances.shape[0]), np.diff(distances.indptr))
+  nearest = np.minimum.reduceat(distances.data, distances.indptr[:-1])[rows]
+  sigma = np.maximum(np.add.reduceat(distances.data, distances.indptr[:-1]) / np.diff(distances.indptr), 1e-12)[rows]
+  memberships = distances.copy()
+  memberships.data = np.exp(-np.maximum(distances.data - nearest, 0) / sigma)
+  affinity = memberships + memberships.T - memberships.multiply(memberships.T)
+  embedding = SpectralEmbedding(n_components=2, affinity="precomputed", random_state=layouts.seed, n_jobs=layouts.nJobs)
+  return embedding.fit_transform(affinity)
+
+LAYOUT_METHODS = {
+  "pca": pcaLayout,
+  "randomized-pca": randomizedPCALayout,
+  "tsne": tsneLayout,
+  "knn-graph": knnGraphLayout
+}
+
+# ----- placing new letters on an existing layout -----
+# a layout's state (<output>.state.npz) keeps the post ids, weights and coordinates it was computed
+# for, plus the PCA for the PCA layouts
+
+def statePath(outputFilepath):
+  return os.path.splitext(outputFilepath)[0] + ".state.npz"
+
+def deltaPath(outputFilepath):
+  return os.path.splitext(outputFilepath)[0] + "-delta.json"
+
+def saveState(filepath, postIds, weights, coords, pca=None):
+  state = {"post_ids": np.array(postIds), "weights": weights, "coords": np.asarray(coords, dtype=np.float64)}
+  if pca is not None:
+    state["pca_mean"] = pca.mean_
+    state["pca_components"] = pca.components_
+  np.savez(filepath, **state)
+
+def loadState(filepath):
+  with np.load(filepath) as saved:
+    return {key: saved[key] for key in saved.files}
+
+def projectPlacement(state, newWeights, placementNeighbors, nJobs):
+  return (newWeights - state["pca_mean"]) @ state["pca_components"].T
+
+def neighborPlacement(state, newWeights, placementNeighbors, nJobs):
+  k = min(placementNeighbors, state["weights"].shape[0])
+  nn = NearestNeighbors(n_neighbors=k, n_jobs=nJobs).fit(state["weights"])
+  distances, neighbors = nn.kneighbors(newWeights)
+  # inverse-distance weights; a letter identical to a laid-out one lands right on it
+  weights = 1 / np.maximum(distances, 1e-9)
+  weights /= weights.sum(axis=1, keepdims=True)
+  return np.einsum("nk,nkd->nd", weights, state["coords"][neighbors])
+
+PLACEMENT_METHODS = {
+  "pca": projectPlacement,
+  "randomized-pca": projectPlacement,
+  "tsne": neighborPlacement,
+  "knn-graph": neighborPlacement
+}
+
+def placeNew(method, postIds, weights, outputFilepath, placementNeighbors=DEFAULT_PLACEMENT_NEIGHBORS, nJobs=None):
+  """ Place the letters that aren't in the saved layout yet. Appends them to the layout (every other
+      point keeps its position) and writes just them to the delta file. Returns how many were placed.
+  """
+  state = loadState(statePath(outputFilepath))
+  laidOut = len(state["post_ids"])
+  if state["post_ids"].tolist() != postIds[:laidOut]:
+    raise ValueError(f"{statePath(outputFilepath)} doesn't match the current letters, run a full layout instead")
+
+  newPostIds = postIds[laidOut:]
+  coords = PLACEMENT_METHODS[method](state, weights[laidOut:], placementNeighbors, nJobs) if newPostIds else np.zeros((0, 2))
+
+  with open(deltaPath(outputFilepath), "w") as deltaFile:
+    deltaFile.write(json.dumps([{"index": laidOut + i, "post_id": postId, "x": x, "y": y}
+                                for i, (postId, (x, y)) in enumerate(zip(newPostIds, coords.tolist()))]))
+  if newPostIds:
+    with open(outputFilepath, "r") as reducedFile:
+      points = reducedFile.read()
+    # the layout is a flat JSON array, so appending is splicing the new points in before the "]"
+    newPoints = pointsJSON(coords)[1:-1]
+    with open(outputFilepath, "w") as reducedFile:
+      reducedFile.write(points[:-1] + (", " if laidOut else "") + newPoints + "]")
+    state["post_ids"] = np.array(postIds)
+    state["weights"] = np.vstack([state["weights"], weights[laidOut:]])
+    state["coords"] = np.vstack([state["coords"], coords])
+    np.savez(statePath(outputFilepath), **state)
+  return len(newPostIds)
+
+def pointsJSON(coords):
+  """ [{"x": ..., "y": ...}, ...] for the d3 visualizations """
+  return json.dumps([{"x": x, "y": y} for x, y in np.asarray(coords, dtype=np.float64).tolist()])
+
+def run(methods, seed=42, nJobs=None, cacheDir=DEFAULT_CACHE_DIR, perplexity=DEFAULT_PERPLEXITY,
+        knnGraphNeighbors=DEFAULT_KNN_GRAPH_NEIGHBORS, outputFilepaths=OUTPUT_FILEPATHS):
+  postIds, weights, _ = loadTopicWeights()
+  layouts = Layouts(weights, seed, nJobs, cacheDir, perplexity, knnGraphNeighbors)
+  for method in methods:
+    start = time.perf_counter()
+    with stage(f"layout.{method}", letters=weights.shape[0]):
+      coords = LAYOUT_METHODS[method](layouts)
+    with stage(f"layout.{method}.save"):
+      with open(outputFilepaths[method], "w") as reducedFile:
+        reducedFile.write(pointsJSON(coords))
+      saveState(statePath(outputFilepaths[method]), postIds, layouts.weights, coords, layouts.pcas.get(method))
+    log(1, f"{method}: {weights.shape[0]} letters in {time.perf_counter() - start:.2f}s -> {outputFilepaths[method]}")
+
+def runPlacement(methods, placementNeighbors=DEFAULT_PLACEMENT_NEIGHBORS, nJobs=None, outputFilepaths=OUTPUT_FILEPATHS):
+  postIds, weights, _ = loadTopicWeights()
+  for method in methods:
+    with stage(f"layout.{method}.place-new") as placement:
+      placed = placeNew(method, postIds, weights, outputFilepaths[method], placementNeighbors, nJobs)
+      placement["placed"] = placed
+    log(1, f"{method}: placed {placed} new letters -> {deltaPath(outputFilepaths[method])}")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--methods", nargs="+", choices=list(LAYOUT_METHODS), default=["pca", "tsne"])
+  parser.add_argument("--seed", type=int, default=42)
+  parser.add_argument("--n-jobs", type=int, default=None, help="parallel jobs for the kNN search, t-SNE and spectral embedding (-1: all CPUs)")
+  parser.add_argument("--perplexity", type=float, default=DEFAULT_PERPLEXITY)
+  parser.add_argument("--knn-graph-neighbors", type=int, default=DEFAULT_KNN_GRAPH_NEIGHBORS)
+  parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR)
+  parser.add_argument("--no-cache", action="store_true", help="don't read or write the cached kNN graph")
+  parser.add_argument("--place-new", action="store_true",
+                      help="keep the existing layouts and only place letters added since they were computed")
+  parser.add_argument("--placement-neighbors", type=int, default=DEFAULT_PLACEMENT_NEIGHBORS,
+                      help="laid-out letters a new letter's t-SNE / kNN-graph position is interpolated from")
+  args = parser.parse_args()
+
+  if args.place_new:
+    runPlacement(args.methods, args.placement_neighbors, args.n_jobs)
+  else:
+    run(args.methods, args.seed, args.n_jobs, None if args.no_cache else args.cache_dir,
+        args.perplexity, args.knn_graph_neighbors)
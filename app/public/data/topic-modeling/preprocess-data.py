@@ -4,10 +4,31 @@ from spacy.lang.en import English
 
 import re
 import json
+import time
+import argparse
 import contractions
 import string
 
-nlp = spacy.load("en_core_web_sm")
+import os
+import sys
+
+from preprocess_cache import PreprocessCache
+
+# shared python packages (corpus_store, instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log, stage
+
+# only is_stop, is_punct, is_space and lemma_ are used below, so skip the dependency parser and NER.
+# the lemmatizer still needs tok2vec + tagger + attribute_ruler for part-of-speech tags.
+UNUSED_PIPES = ["parser", "ner"]
+nlp = spacy.load("en_core_web_sm", exclude=UNUSED_PIPES)
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_N_PROCESS = 1
+DEFAULT_CACHE_FILEPATH = "./cache/preprocess-cache.sqlite"
+
+# bump this whenever processTexts changes so cached posts get reprocessed
+PIPELINE_VERSION = f"1-{nlp.meta['name']}-{nlp.meta['version']}"
 
 def addApostrophes(text):
   return text.replace('\u2018', "'").replace('\u2019', "'")
@@ -16,11 +37,16 @@ def expandContractions(text):
    # need to pass in text without unicode (\u2019 need to be changed to ')
   return contractions.fix(text)
 
+def lowercaseAndStrip(text):
+  # change to lowercase and remove any leading hyphens
+  return re.sub(r'[^a-zA-Z0-9\s]', '', text).lower()  # Remove leading hyphen
+
 # use spaCy tokenizer, lemma, and stop word tools 
 def tokenizeAndRemoveStopWords(text):
-  # change to lowercase and remove any leading hyphens
-  lowercaseText = re.sub(r'[^a-zA-Z0-9\s]', '', text).lower()  # Remove leading hyphen
-  doc = nlp(lowercaseText)
+  doc = nlp(lowercaseAndStrip(text))
+  return filterTokens(doc)
+
+def filterTokens(doc):
   tokens = []
   lemmas = []
   # only add tokens that are not punctuation, spaces, or stop words (and, a ... )
@@ -31,42 +57,107 @@ def tokenizeAndRemoveStopWords(text):
       
   return tokens, lemmas
 
-# decode unicode and expand contractions 
-# return rootwords of relevant words in letter 
-def processText(text):
-  withApostrophes = addApostrophes(text) # 
-  contractionsExpanded = expandContractions(withApostrophes)
-  words, rootWords = tokenizeAndRemoveStopWords(contractionsExpanded)
-  return rootWords
+# decode unicode and expand contractions, then stream the texts through nlp.pipe in batches
+# (and optionally several worker processes) instead of calling nlp once per post.
+# yields the root words of the relevant words in each letter, in the same order as texts
+def processTexts(texts, batchSize=DEFAULT_BATCH_SIZE, nProcess=DEFAULT_N_PROCESS):
+  cleanedTexts = (lowercaseAndStrip(expandContractions(addApostrophes(text))) for text in texts)
+  for doc in nlp.pipe(cleanedTexts, batch_size=batchSize, n_process=nProcess):
+    words, rootWords = filterTokens(doc)
+    yield rootWords
 
-# open and load data from the posts json file:
-postsFilepath = "../output.json"
-with open(postsFilepath, "r") as file:
-  data = json.load(file)
-  posts = data["post"]
+# return rootwords of relevant words in one letter (run streams all of them through processTexts instead)
+def processText(text):
+  return next(processTexts([text]))
 
-# loop through all posts and process the text 
-processedPosts = {}
+# writes {postId: [rootWords...]} exactly like json.dump(..., indent=4), one post at a time,
+# so the whole dictionary never needs to be held in memory
+def writeIndentedEntry(outputFile, postId, rootWords, first):
+  outputFile.write("{\n" if first else ",\n")
+  entry = json.dumps(rootWords, indent=4).replace("\n", "\n    ")
+  outputFile.write("    " + json.dumps(postId) + ": " + entry)
 
-# export bag of words 
-bagOfWordsFilepath = "../cleaned-bag-of-words.txt"
+# yields (postId, body) for every post, either from the posts json file
+# or, when storePath is set, from the body column of a corpus_store directory (postsFilepath is then unused)
+def loadBodies(postsFilepath, storePath=None):
+  if storePath is not None:
+    from corpus_store import CorpusReader
+    reader = CorpusReader(storePath)
+    yield from zip(reader.post_ids, reader.column("body"))
+    return
 
-with open(bagOfWordsFilepath, "w") as bagOfWordsFile:
+  # open and load data from the posts json file:
+  with open(postsFilepath, "r") as file:
+    data = json.load(file)
+    posts = data["post"]
   for postId, postData in posts.items():
-    body = postData.get("body")
+    yield postId, postData.get("body")
 
-    # set array of words as value of post_id dictionary
+def run(postsFilepath, bagOfWordsFilepath, outputFilepath, batchSize=DEFAULT_BATCH_SIZE, nProcess=DEFAULT_N_PROCESS,
+        cache=None, cacheMaxAgeDays=None, cacheMaxBytes=None, storePath=None):
+  # only posts with a body that isn't just a link get processed
+  postIds = []
+  bodies = []
+  for postId, body in loadBodies(postsFilepath, storePath):
     if (body and not body.startswith("URL:")):
-      processedBody = processText(body)
-      processedPosts[postId] = processedBody
+      postIds.append(postId)
+      bodies.append(body)
+
+  if cache is None:
+    cache = PreprocessCache(":memory:", PIPELINE_VERSION)
+
+  # only run the pipeline over posts that are new, edited, or were processed by an older pipeline
+  missIds = []
+  missBodies = []
+  for postId, body in zip(postIds, bodies):
+    if not cache.has(postId, body):
+      missIds.append(postId)
+      missBodies.append(body)
+
+  start = time.perf_counter()
+  with stage("preprocess.processTexts", posts=len(missIds), batch_size=batchSize, n_process=nProcess):
+    for postId, body, processedBody in zip(missIds, missBodies, processTexts(missBodies, batchSize, nProcess)):
+      cache.put(postId, body, processedBody)
+  elapsed = time.perf_counter() - start
+  cache.commit()
+
+  log(1, "Number of posts without URLs as body text: ", len(postIds))
+  log(1, f"Processed {len(missIds)} new or changed posts in {elapsed:.2f}s ({len(missIds) / max(elapsed, 1e-9):.1f} posts/sec, batch_size={batchSize}, n_process={nProcess})")
+
+  # rebuild both outputs from the cache in one pass over the posts
+  with stage("preprocess.write", posts=len(postIds)), open(bagOfWordsFilepath, "w") as bagOfWordsFile, open(outputFilepath, "w") as outputFile:
+    for i, (postId, body) in enumerate(zip(postIds, bodies)):
+      processedBody = cache.get(postId, body)
+
+      # set array of words as value of post_id dictionary
+      writeIndentedEntry(outputFile, postId, processedBody, first=(i == 0))
 
       # dump words into txt file 
       for word in processedBody:
         bagOfWordsFile.write(word + "\n")
+    outputFile.write("\n}" if postIds else "{}")
+
+  cache.evict(maxAgeDays=cacheMaxAgeDays, maxBytes=cacheMaxBytes)
+  stats = cache.stats()
+  log(1, f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, {stats['entries']} entries ({stats['bytes'] / 1e6:.2f} MB)")
 
-print("Number of posts without URLs as body text: ", len(processedPosts))
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="number of posts per nlp.pipe batch")
+  parser.add_argument("--n-process", type=int, default=DEFAULT_N_PROCESS, help="number of worker processes for nlp.pipe")
+  parser.add_argument("--cache", type=str, default=DEFAULT_CACHE_FILEPATH, help="sqlite file caching processed posts")
+  parser.add_argument("--no-cache", action="store_true", help="process every post without reading or writing the cache")
+  parser.add_argument("--cache-max-age-days", type=float, default=None, help="evict cache entries unused for this many days")
+  parser.add_argument("--cache-max-mb", type=float, default=None, help="evict least recently used cache entries above this size")
+  source = parser.add_mutually_exclusive_group()
+  source.add_argument("--posts", type=str, default="../output.json", help="posts json file to read the post bodies from")
+  source.add_argument("--store", type=str, default=None, help="read post bodies from a corpus_store directory instead of the posts json file")
+  args = parser.parse_args()
 
-# export labeled structure to file 
-outputFilepath = "../cleaned-root-words.json"
-with open(outputFilepath, "w") as outputFile:
-  json.dump(processedPosts, outputFile, indent=4)
+  cache = PreprocessCache(":memory:" if args.no_cache else args.cache, PIPELINE_VERSION)
+  run(None if args.store else args.posts, "../cleaned-bag-of-words.txt", "../cleaned-root-words.json",
+      batchSize=args.batch_size, nProcess=args.n_process, cache=cache,
+      cacheMaxAgeDays=args.cache_max_age_days,
+      cacheMaxBytes=None if args.cache_max_mb is None else int(args.cache_max_mb * 1e6),
+      storePath=args.store)
+  cache.close()
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# persistent cache for preprocess-data.py
+# each processed post is stored under (post_id, sha256 of the body, pipeline version), so a post is only
+# run through contractions + regex cleanup + spaCy again when it is new, its body was edited, or the
+# pipeline itself changed (new version string / new spaCy model).
+
+def hashBody(body):
+  return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+class PreprocessCache:
+  """ SQLite store of processed posts with hit/miss/eviction counters for the current run
+  """
+
+  def __init__(self, path, pipelineVersion):
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self.path = path
+    self.pipelineVersion = pipelineVersion
+    self.conn = sqlite3.connect(path)
+    self.conn.execute("""
+      CREATE TABLE IF NOT EXISTS processed (
+        post_id TEXT NOT NULL,
+        body_hash TEXT NOT NULL,
+        version TEXT NOT NULL,
+        root_words TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        PRIMARY KEY (post_id, body_hash, version)
+      )
+    """)
+    self.conn.execute("CREATE INDEX IF NOT EXISTS processed_last_used ON processed (last_used)")
+    self.conn.commit()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def _key(self, postId, body):
+    return (postId, hashBody(body), self.pipelineVersion)
+
+  def has(self, postId, body):
+    """ Check whether a post is cached, counting it as a hit or a miss and refreshing its last-used time
+    """
+    key = self._key(postId, body)
+    cursor = self.conn.execute(
+      "UPDATE processed SET last_used = ? WHERE post_id = ? AND body_hash = ? AND version = ?",
+      (time.time(),) + key)
+    if cursor.rowcount:
+      self.hits += 1
+      return True
+    self.misses += 1
+    return False
+
+  def get(self, postId, body):
+    """ Return the cached root words for a post, or None. Does not touch the stats.
+    """
+    row = self.conn.execute(
+      "SELECT root_words FROM processed WHERE post_id = ? AND body_hash = ? AND version = ?",
+      self._key(postId, body)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+  def put(self, postId, body, rootWords):
+    """ Store the root words for a post. Older entries for the same post (edited body or old pipeline
+        version) can never be hit again, so they are dropped and counted as evictions.
+    """
+    postId, bodyHash, version = self._key(postId, body)
+    cursor = self.conn.execute(
+      "DELETE FROM processed WHERE post_id = ? AND NOT (body_hash = ? AND version = ?)",
+      (postId, bodyHash, version))
+    self.evictions += max(cursor.rowcount, 0)
+
+    serialized = json.dumps(rootWords)
+    now = time.time()
+    self.conn.execute(
+      "INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?, ?)",
+      (postId, bodyHash, version, serialized, len(serialized), now, now))
+
+  def evict(self, maxAgeDays=None, maxBytes=None):
+    """ Drop entries not used within maxAgeDays, then drop least recently used entries until the stored
+        root words take up at most maxBytes. Returns the number of entries evicted by this call.
+    """
+    evicted = 0
+    if maxAgeDays is not None:
+      cutoff = time.time() - maxAgeDays * 24 * 60 * 60
+      cursor = self.conn.execute("DELETE FROM processed WHERE last_used < ?", (cutoff,))
+      evicted += max(cursor.rowcount, 0)
+
+    if maxBytes is not None:
+      total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM processed").fetchone()[0]
+      if total > maxBytes:
+        staleRowIds = []
+        for rowId, size in self.conn.execute("SELECT rowid, size FROM processed ORDER BY last_used ASC"):
+          if total <= maxBytes:
+            break
+          staleRowIds.append((rowId,))
+          total -= size
+        self.conn.executemany("DELETE FROM processed WHERE rowid = ?", staleRowIds)
+        evicted += len(staleRowIds)
+
+    self.evictions += evicted
+    return evicted
+
+  def stats(self):
+    entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM processed").fetchone()
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "evictions": self.evictions,
+      "entries": entries,
+      "bytes": size
+    }
+
+  def commit(self):
+    self.conn.commit()
+
+  def close(self):
+    self.conn.commit()
+    self.conn.close()
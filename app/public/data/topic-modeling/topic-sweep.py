@@ -0,0 +1,207 @@
+# sweep over topic model settings (number of topics, priors, iterations) for NMF and LDA
+# instead of editing num_topics in NMF-topic-modeling.py / LDA-topic-modeling.py and re-running them one by one
+import argparse
+import csv
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse
+from sklearn.feature_extraction.text import TfidfVectorizer # num occur in doc / num occur in all docs
+from sklearn.feature_extraction.text import CountVectorizer # num occur in doc only
+from sklearn.decomposition import NMF
+from sklearn.decomposition import LatentDirichletAllocation # LDA, used for topic modeling
+
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log
+
+# LDA switches from batch to online variational Bayes above this many letters
+ONLINE_LDA_MIN_DOCS = 5000
+COHERENCE_TOP_WORDS = 10
+
+# STEP 1: vectorize the cleaned root words once, in the parent process
+# NMF uses tf-idf weights (like NMF-topic-modeling.py), LDA raw counts (like LDA-topic-modeling.py)
+def vectorize(rootWordsFilepath, workDir):
+  with open(rootWordsFilepath, "r") as rootwordsFile:
+    rootWords = json.load(rootwordsFile)
+  documents = [" ".join(words) for words in rootWords.values()]
+
+  counts = CountVectorizer().fit_transform(documents)
+  tfidf = TfidfVectorizer().fit_transform(documents)
+
+  # workers load the document-term matrices from disk once instead of receiving a pickled copy per task
+  paths = {"lda": os.path.join(workDir, "dtm-counts.npz"), "nmf": os.path.join(workDir, "dtm-tfidf.npz")}
+  scipy.sparse.save_npz(paths["lda"], counts.tocsr())
+  scipy.sparse.save_npz(paths["nmf"], tfidf.tocsr())
+  log(1, f"DTM shape: {counts.shape}")
+  return paths
+
+# peak resident memory of this process while a fit runs, sampled from a background thread
+# (tracemalloc would be exact for numpy allocations but slows LDA down several times over)
+class PeakRSS:
+  def __init__(self, interval=0.01):
+    self.interval = interval
+    self.peak = 0
+    self.stopped = threading.Event()
+
+  @staticmethod
+  def current():
+    try:
+      with open("/proc/self/statm", "r") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+      # no /proc (macOS): fall back to the lifetime peak, reported in bytes there
+      return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+  def sample(self):
+    while not self.stopped.is_set():
+      self.peak = max(self.peak, self.current())
+      self.stopped.wait(self.interval)
+
+  def __enter__(self):
+    self.peak = self.current()
+    self.thread = threading.Thread(target=self.sample, daemon=True)
+    self.thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self.stopped.set()
+    self.thread.join()
+    self.peak = max(self.peak, self.current())
+
+workerDTMs = {}
+
+def loadDTMs(paths):
+  for model, path in paths.items():
+    workerDTMs[model] = scipy.sparse.load_npz(path).tocsr()
+  # coherence is measured on which words appear in which letters
+  workerDTMs["binary"] = (workerDTMs["lda"] > 0).astype(np.float64).tocsc()
+
+# UMass coherence of each topic's top words, averaged over topics (closer to 0 is better)
+def umassCoherence(components, topWordsCt=COHERENCE_TOP_WORDS):
+  binary = workerDTMs["binary"]
+  docFreq = np.asarray(binary.sum(axis=0)).ravel()
+  scores = []
+  for topic in components:
+    top = np.argpartition(-topic, topWordsCt - 1)[:topWordsCt]
+    top = top[np.argsort(-topic[top])]
+    cols = binary[:, top]
+    coDocFreq = (cols.T @ cols).toarray()
+    score = 0.0
+    for i in range(1, len(top)):
+      for j in range(i):
+        score += np.log((coDocFreq[i, j] + 1) / max(docFreq[top[j]], 1))
+    scores.append(score)
+  return float(np.mean(scores))
+
+# STEP 2: fit one chain of models with the same (model, k, alpha, beta) and increasing max_iter.
+# each fit continues from the previous one (NMF: init="custom" from its W and H; online LDA: more
+# partial_fit passes), so the whole chain costs about as much as its longest fit.
+def runChain(task):
+  model, k, alpha, beta, maxIters, seed = task
+  dtm = workerDTMs[model]
+  # an unset alpha means sklearn's default: 0 for NMF's alpha_W, 1 / k for LDA's priors
+  alphaW = 0.0 if alpha is None else alpha
+  rows = []
+  W = H = lda = None
+  doneIters = 0
+  totalSeconds = 0.0
+
+  for maxIter in sorted(maxIters):
+    with PeakRSS() as memory:
+      start = time.perf_counter()
+
+      if model == "nmf":
+        if W is None:
+          nmf = NMF(n_components=k, alpha_W=alphaW, random_state=seed, max_iter=maxIter)
+          W = nmf.fit_transform(dtm)
+        else:
+          nmf = NMF(n_components=k, alpha_W=alphaW, random_state=seed, max_iter=maxIter - doneIters, init="custom")
+          W = nmf.fit_transform(dtm, W=W, H=H)
+        H = nmf.components_
+        components = H
+        quality = {"reconstruction_error": float(nmf.reconstruction_err_)}
+      else:
+        online = dtm.shape[0] >= ONLINE_LDA_MIN_DOCS
+        if lda is None or not online:
+          lda = LatentDirichletAllocation(n_components=k, doc_topic_prior=alpha, topic_word_prior=beta,
+                                          learning_method="online" if online else "batch",
+                                          max_iter=maxIter, random_state=seed)
+          lda.fit(dtm)
+        else:
+          for _ in range(maxIter - doneIters):
+            lda.partial_fit(dtm)
+        components = lda.components_
+        quality = {"perplexity": float(lda.perplexity(dtm))}
+
+      seconds = time.perf_counter() - start
+    totalSeconds += seconds
+    doneIters = maxIter
+
+    rows.append({
+      "model": model,
+      "k": k,
+      "alpha": alpha,
+      "beta": beta if model == "lda" else None,
+      "max_iter": maxIter,
+      "seconds": round(seconds, 3),
+      "cumulative_seconds": round(totalSeconds, 3),
+      "peak_rss_mb": round(memory.peak / 1e6, 2),
+      "reconstruction_error": quality.get("reconstruction_error"),
+      "perplexity": quality.get("perplexity"),
+      "coherence_umass": round(umassCoherence(components), 4)
+    })
+  return rows
+
+def buildTasks(models, ks, alphas, betas, maxIters, seed):
+  tasks = []
+  for model, k, alpha in itertools.product(models, ks, alphas):
+    # beta is an LDA prior; NMF gets one chain per (k, alpha)
+    for beta in (betas if model == "lda" else [None]):
+      tasks.append((model, k, alpha, beta, maxIters, seed))
+  return tasks
+
+def sweep(rootWordsFilepath, models, ks, alphas, betas, maxIters, workers=None, seed=42):
+  with tempfile.TemporaryDirectory() as workDir:
+    paths = vectorize(rootWordsFilepath, workDir)
+    tasks = buildTasks(models, ks, alphas, betas, maxIters, seed)
+    log(1, f"Fitting {len(tasks)} model chains ({len(tasks) * len(maxIters)} fits)")
+    with ProcessPoolExecutor(max_workers=workers, initializer=loadDTMs, initargs=(paths,)) as executor:
+      results = [row for rows in executor.map(runChain, tasks) for row in rows]
+  return results
+
+# STEP 3: one results table for every fit
+def saveResults(results, outputFilepath):
+  with open(outputFilepath, "w", newline="") as resultsFile:
+    writer = csv.DictWriter(resultsFile, fieldnames=list(results[0].keys()))
+    writer.writeheader()
+    writer.writerows(results)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--root-words", type=str, default="../cleaned-root-words.json")
+  parser.add_argument("--models", nargs="+", choices=["nmf", "lda"], default=["nmf", "lda"])
+  parser.add_argument("--k", nargs="+", type=int, default=[5, 10, 15, 20, 25], help="numbers of topics")
+  parser.add_argument("--alpha", nargs="+", type=float, default=[None], help="LDA doc_topic_prior / NMF alpha_W (default: sklearn's)")
+  parser.add_argument("--beta", nargs="+", type=float, default=[None], help="LDA topic_word_prior (default: sklearn's)")
+  parser.add_argument("--max-iter", nargs="+", type=int, default=[50, 100, 200])
+  parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+  parser.add_argument("--output", type=str, default="./results/topic-sweep.csv")
+  args = parser.parse_args()
+
+  results = sweep(args.root_words, args.models, args.k, args.alpha, args.beta, args.max_iter, args.workers)
+  saveResults(results, args.output)
+
+  for row in sorted(results, key=lambda row: (row["model"], row["k"], row["max_iter"])):
+    quality = f"err={row['reconstruction_error']:.4f}" if row["model"] == "nmf" else f"perplexity={row['perplexity']:.1f}"
+    log(1, f"{row['model']} k={row['k']} alpha={row['alpha']} beta={row['beta']} max_iter={row['max_iter']}: "
+           f"{row['seconds']}s, {row['peak_rss_mb']} MB, {quality}, coherence={row['coherence_umass']}")
+  log(1, f"Results written to {args.output}")
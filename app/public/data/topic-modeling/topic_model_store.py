@@ -0,0 +1,56 @@
+import joblib
+import numpy as np
+
+# saving / loading fitted topic models so new letters can be assigned topics without refitting.
+# a saved model is a dict: {"kind": "nmf" | "lda", "vectorizer", "model", "baseline_error", "n_docs"}
+
+def relativeErrors(dtm, W, H):
+  """ ||x - wH|| / ||x|| for every letter (row of the sparse dtm), without building the dense reconstruction:
+      ||x - wH||^2 = ||x||^2 - 2 x.(wH) + w (H H^T) w
+  """
+  squaredNorms = np.asarray(dtm.multiply(dtm).sum(axis=1)).ravel()
+  crossTerms = np.asarray((dtm @ H.T) * W).sum(axis=1)
+  reconstructionNorms = ((W @ (H @ H.T)) * W).sum(axis=1)
+  squaredErrors = np.maximum(squaredNorms - 2 * crossTerms + reconstructionNorms, 0)
+  return np.sqrt(squaredErrors) / np.maximum(np.sqrt(squaredNorms), 1e-12)
+
+def wordPerplexity(dtm, docTopic, components):
+  """ exp(-average log p(word | letter)) with p(word | letter) = sum over topics of p(topic | letter) p(word | topic).
+      Unlike LatentDirichletAllocation.perplexity this doesn't include the corpus-level prior term,
+      so a handful of new letters can be compared against the whole training set.
+  """
+  topicWord = components / components.sum(axis=1, keepdims=True)
+  docTopic = docTopic / np.maximum(docTopic.sum(axis=1, keepdims=True), 1e-12)
+  coo = dtm.tocoo()
+  wordProbs = np.einsum("nk,nk->n", docTopic[coo.row], topicWord.T[coo.col])
+  return float(np.exp(-(coo.data * np.log(np.maximum(wordProbs, 1e-12))).sum() / max(coo.data.sum(), 1e-12)))
+
+def driftError(kind, model, dtm, W):
+  """ The error update-topics.py tracks for a set of letters: the median relative reconstruction error
+      for NMF, the per-word perplexity for LDA. W is the letters' topic distribution.
+  """
+  if kind == "nmf":
+    return float(np.median(relativeErrors(dtm, W, model.components_)))
+  return wordPerplexity(dtm, W, model.components_)
+
+def baselineError(kind, model, dtm, W=None):
+  """ What "normal" looks like for the letters the model was fit on """
+  if W is None:
+    W = model.transform(dtm)
+  return driftError(kind, model, dtm, W)
+
+def saveModel(filepath, kind, vectorizer, model, dtm, W=None):
+  """ Save a model right after fitting it on dtm """
+  writeModel(filepath, {
+    "kind": kind,
+    "vectorizer": vectorizer,
+    "model": model,
+    "baseline_error": baselineError(kind, model, dtm, W),
+    "n_docs": dtm.shape[0]
+  })
+
+def writeModel(filepath, saved):
+  joblib.dump(saved, filepath)
+
+def loadModel(filepath):
+  return joblib.load(filepath)
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+
+# top-k extraction for the document-topic / topic-word matrices, and a compact binary copy of
+# top_topics_with_weights.json for the scripts that only need the weight matrix.
+# topic-weights.npz holds three arrays:
+#   post_ids:   the letters' post ids, in the same order as top_topics_with_weights.json
+#   weights:    (letters x topics) float32 topic distribution
+#   top_topics: (letters x k) indices of each letter's top k topics, largest first
+
+TOPIC_WEIGHTS_FILEPATH = "./results/topic-weights.npz"
+# where each kind of model keeps its per-letter results (LDA topics aren't NMF topics, so they get their own files)
+ASSIGNMENTS_FILEPATHS = {"nmf": "./results/top_topics_with_weights.json", "lda": "./results/lda_top_topics_with_weights.json"}
+TOPIC_WEIGHTS_FILEPATHS = {"nmf": TOPIC_WEIGHTS_FILEPATH, "lda": "./results/lda-topic-weights.npz"}
+
+def topK(matrix, k):
+  """ Column indices of the k largest values in each row, largest first, and those values.
+      np.partition finds each row's k-th largest value without sorting the whole row, then only the
+      k winners get sorted. Ties go to the lower column index: NMF weights have lots of exact zeros,
+      so this decides many second topics, and argsort / argpartition leave it up to the platform.
+  """
+  k = min(k, matrix.shape[1])
+  kth = -np.partition(-matrix, k - 1, axis=1)[:, k - 1:k]
+  above = matrix > kth
+  tied = matrix == kth
+  keep = above | (tied & (np.cumsum(tied, axis=1) <= k - above.sum(axis=1, keepdims=True)))
+  topIdx = np.nonzero(keep)[1].reshape(-1, k)
+  topValues = np.take_along_axis(matrix, topIdx, axis=1)
+  order = np.argsort(-topValues, axis=1, kind="stable")
+  return np.take_along_axis(topIdx, order, axis=1), np.take_along_axis(topValues, order, axis=1)
+
+def assignmentsJSON(postIds, topicDistribution, topIdx, topWeights):
+  """ Entries of top_topics_with_weights.json: the first two topics and every topic's weight per letter """
+  topIdx = topIdx.tolist()
+  topWeights = topWeights.tolist()
+  allWeights = topicDistribution.tolist()
+  return [{
+    "post_id": postId,
+    "topics": {
+      "first": {"topic": topIdx[i][0], "weight": topWeights[i][0]},
+      "second": {"topic": topIdx[i][1], "weight": topWeights[i][1]}
+    },
+    "all_weights": allWeights[i]
+  } for i, postId in enumerate(postIds)]
+
+def saveTopicWeights(filepath, postIds, topicDistribution, topIdx):
+  np.savez(filepath, post_ids=np.array(postIds), weights=np.asarray(topicDistribution, dtype=np.float32),
+           top_topics=topIdx.astype(np.int16))
+
+def loadTopicWeights(filepath=TOPIC_WEIGHTS_FILEPATH, assignmentsFilepath=ASSIGNMENTS_FILEPATHS["nmf"]):
+  """ (post ids, float32 weights, top topic indices). Falls back to top_topics_with_weights.json when
+      the binary file hasn't been written yet (results from before it existed).
+  """
+  try:
+    with np.load(filepath) as saved:
+      return saved["post_ids"].tolist(), saved["weights"], saved["top_topics"]
+  except FileNotFoundError:
+    with open(assignmentsFilepath, "r") as assignmentsFile:
+      topicAssignments = json.load(assignmentsFile)
+    return ([post["post_id"] for post in topicAssignments],
+            np.array([post["all_weights"] for post in topicAssignments], dtype=np.float32),
+            np.array([[post["topics"]["first"]["topic"], post["topics"]["second"]["topic"]]
+                      for post in topicAssignments], dtype=np.int16))
@@ -0,0 +1,140 @@
+# assign topics to newly scraped letters without refitting the topic model
+#
+# only letters in cleaned-root-words.json that the model hasn't assigned yet are vectorized (with the
+# saved vocabulary) and given topic weights by the saved model:
+#   NMF: transform with the fitted components held fixed
+#   LDA: partial_fit on the new letters (one online update) once they pass the drift check, then transform
+# the results are appended to the model's own files:
+#   NMF: top_topics_with_weights.json, topic-weights.npz and final-topic-assignments.json (labels from topics_NMF_15.json)
+#   LDA: lda_top_topics_with_weights.json and lda-topic-weights.npz (LDA topics have no labels)
+#
+# if the new letters no longer look like the ones the model was fit on (too many words outside the
+# saved vocabulary, or reconstruction error / perplexity well above the model's baseline) the model
+# is refit from scratch by re-running NMF-topic-modeling.py / LDA-topic-modeling.py on the same root words instead.
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from topic_model_store import driftError, loadModel, writeModel
+from topic_weights import ASSIGNMENTS_FILEPATHS, TOPIC_WEIGHTS_FILEPATHS, assignmentsJSON, loadTopicWeights, saveTopicWeights, topK
+
+# shared python packages (instrumentation, ...) live in the repo's top-level data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../../../data"))
+from instrumentation import log
+
+DEFAULT_MAX_OOV_RATE = 0.2
+DEFAULT_MAX_ERROR_RATIO = 1.25
+REFIT_SCRIPTS = {"nmf": "NMF-topic-modeling.py", "lda": "LDA-topic-modeling.py"}
+# the results folder (and the refit scripts' working directory) are next to this script, whatever the current directory
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def findNewLetters(rootWords, topicAssignments):
+  assigned = {post["post_id"] for post in topicAssignments}
+  return [postId for postId in rootWords if postId not in assigned]
+
+# drift metrics for the new letters
+# oovRate: share of their words the saved vocabulary has never seen
+# errorRatio: their reconstruction error (NMF, median) or per-word perplexity (LDA) relative to the model's baseline
+def measureDrift(saved, documents, dtm, topicDistribution):
+  analyzer = saved["vectorizer"].build_analyzer()
+  vocabulary = saved["vectorizer"].vocabulary_
+  tokens = [token for document in documents for token in analyzer(document)]
+  oovRate = sum(token not in vocabulary for token in tokens) / max(len(tokens), 1)
+
+  error = driftError(saved["kind"], saved["model"], dtm, topicDistribution)
+  return oovRate, error / saved["baseline_error"]
+
+def refit(kind, rootWordsFilepath):
+  # the topic-modeling scripts write their results relative to the current directory,
+  # and refit on the same root words the update was given
+  subprocess.run([sys.executable, REFIT_SCRIPTS[kind], "--root-words", os.path.abspath(rootWordsFilepath)],
+                 cwd=SCRIPT_DIR, check=True)
+
+def update(modelFilepath, rootWordsFilepath, finalAssignmentsFilepath=os.path.join(SCRIPT_DIR, "results/final-topic-assignments.json"),
+           topicsRefFilepath=os.path.join(SCRIPT_DIR, "results/topics_NMF_15.json"), maxOOVRate=DEFAULT_MAX_OOV_RATE, maxErrorRatio=DEFAULT_MAX_ERROR_RATIO):
+  saved = loadModel(modelFilepath)
+  kind = saved["kind"]
+  assignmentsFilepath = os.path.normpath(os.path.join(SCRIPT_DIR, ASSIGNMENTS_FILEPATHS[kind]))
+  weightsFilepath = os.path.normpath(os.path.join(SCRIPT_DIR, TOPIC_WEIGHTS_FILEPATHS[kind]))
+
+  with open(rootWordsFilepath, "r") as rootwordsFile:
+    rootWords = json.load(rootwordsFile)
+  with open(assignmentsFilepath, "r") as assignmentsFile:
+    topicAssignments = json.load(assignmentsFile)
+
+  newPostIds = findNewLetters(rootWords, topicAssignments)
+  if not newPostIds:
+    log(1, "No new letters to assign")
+    return "unchanged"
+
+  model = saved["model"]
+  documents = [" ".join(rootWords[postId]) for postId in newPostIds]
+  dtm = saved["vectorizer"].transform(documents)
+
+  # everything is checked before the first file is rewritten
+  postIds, weights, topTopics = loadTopicWeights(weightsFilepath, assignmentsFilepath)
+  if weights.shape[1] != model.n_components:
+    raise ValueError(f"{weightsFilepath} has {weights.shape[1]} topics but {modelFilepath} has {model.n_components}; "
+                     f"re-run {REFIT_SCRIPTS[kind]}")
+
+  # drift is measured with the saved model: after an LDA update the new letters would be part of
+  # what the model was trained on, and their perplexity would look lower than it is
+  topicDistribution = model.transform(dtm)
+  oovRate, errorRatio = measureDrift(saved, documents, dtm, topicDistribution)
+  log(1, f"{len(newPostIds)} new letters: {oovRate:.1%} out-of-vocabulary words, error {errorRatio:.2f}x baseline")
+  if oovRate > maxOOVRate or errorRatio > maxErrorRatio:
+    log(1, "Drift threshold crossed, refitting the topic model on the full corpus")
+    refit(kind, rootWordsFilepath)
+    return "refit"
+
+  if kind == "lda":
+    # the online update weighs the batch against the size of the whole corpus
+    model.set_params(total_samples=saved["n_docs"] + dtm.shape[0])
+    model.partial_fit(dtm)
+    topicDistribution = model.transform(dtm)
+    # the online LDA update changed the model, keep it for the next run
+    saved["n_docs"] += dtm.shape[0]
+    writeModel(modelFilepath, saved)
+
+  topIdx, topWeights = topK(topicDistribution, 2)
+  # (top topic columns beyond the first two are dropped)
+  saveTopicWeights(weightsFilepath, postIds + newPostIds, np.vstack([weights, topicDistribution]),
+                   np.vstack([topTopics[:, :2], topIdx]))
+
+  topicAssignments.extend(assignmentsJSON(newPostIds, topicDistribution, topIdx, topWeights))
+  with open(assignmentsFilepath, "w") as assignmentsFile:
+    json.dump(topicAssignments, assignmentsFile, indent=4)
+
+  if kind == "nmf":
+    # same structure clean-topic-assignments.py builds, for just the new letters
+    with open(topicsRefFilepath, "r") as topicsRefFile:
+      topicsRef = json.load(topicsRefFile)
+    with open(finalAssignmentsFilepath, "r") as finalAssignmentsFile:
+      assignmentsDict = json.load(finalAssignmentsFile)
+    for i, postId in enumerate(newPostIds):
+      postIdx = int(topIdx[i, 0])
+      assignmentsDict[postId] = {
+        "idx": postIdx,
+        "label": topicsRef[postIdx]["label"]
+      }
+    with open(finalAssignmentsFilepath, "w") as finalAssignmentsFile:
+      json.dump(assignmentsDict, finalAssignmentsFile, indent=4)
+
+  log(1, f"Appended topics for {len(newPostIds)} letters to {assignmentsFilepath}")
+  return "appended"
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--model", type=str, default=os.path.join(SCRIPT_DIR, "results/nmf-model.joblib"), help="saved model (nmf-model.joblib or lda-model.joblib)")
+  parser.add_argument("--root-words", type=str, default=os.path.join(SCRIPT_DIR, "../cleaned-root-words.json"))
+  parser.add_argument("--max-oov-rate", type=float, default=DEFAULT_MAX_OOV_RATE,
+                      help="refit when more than this share of the new letters' words is outside the saved vocabulary")
+  parser.add_argument("--max-error-ratio", type=float, default=DEFAULT_MAX_ERROR_RATIO,
+                      help="refit when the new letters' reconstruction error / perplexity exceeds the baseline by this factor")
+  args = parser.parse_args()
+
+  update(args.model, args.root_words, maxOOVRate=args.max_oov_rate, maxErrorRatio=args.max_error_ratio)
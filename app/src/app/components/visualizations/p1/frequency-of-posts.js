@@ -17,21 +17,16 @@ const PostFrequencyChart = ({
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const response = await fetch("/data/consolidated_posts.json");
-        const json = await response.json();
-
-        const parsedData = Object.entries(json).map(([, post]) => ({
-          date: d3.timeParse("%Y-%m-%dT%H:%M:%S.%LZ")(post.createdAt),
-        }));
-
-        const groupedData = d3.rollups(
-          parsedData,
-          (values) => values.length,
-          (d) => d3.timeMonth.floor(d.date)
-        );
-
-        let totalPostsData = groupedData
-          .map(([date, count]) => ({ date, totalPosts: count }))
+        // monthly post counts precomputed by processing/aggregate.py
+        const response = await fetch("/data/rollups.json");
+        const rollups = await response.json();
+        const monthly = rollups.month.total;
+
+        let totalPostsData = monthly.period
+          .map((period, i) => ({
+            date: d3.timeParse("%Y-%m")(period),
+            totalPosts: monthly.posts[i],
+          }))
           .sort((a, b) => a.date - b.date);
 
         let accumulatedTotal = 0;
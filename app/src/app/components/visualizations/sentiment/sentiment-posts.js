@@ -9,14 +9,14 @@ const SentimentBarChartHorizontal = () => {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const response = await fetch("/data/consolidated_posts.json");
-        const json = await response.json();
+        // slim per-post index written by processing/aggregate.py (columns: id, createdAt, topic, score, comments)
+        const response = await fetch("/data/post-index.json");
+        const index = await response.json();
 
         // Process data into categories by sentiment
-        const processedData = Object.entries(json).map(([postId, post]) => ({
+        const processedData = index.id.map((postId, i) => ({
           postId,
-          title: post.title,
-          bodyScore: post.bodySentiment.score,
+          bodyScore: index.score[i],
         }));
 
         setData(processedData);
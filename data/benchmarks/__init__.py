@@ -0,0 +1,7 @@
+""" Benchmarks of the pipeline's hot functions on seeded synthetic corpora of any size.
+
+    Run `python -m benchmarks` from the data folder; every result is appended to history.jsonl with the
+    commit it was measured on, and results more than --threshold slower than the previous one are flagged.
+"""
+from .cases import CASES, Case, Skip
+from .synthetic import SyntheticCorpus
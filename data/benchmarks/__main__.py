@@ -0,0 +1,140 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from .cases import CASES, CASES_BY_NAME, REPO_ROOT, Skip
+from .synthetic import SyntheticCorpus
+
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, "data", "benchmarks", "cache")
+DEFAULT_HISTORY = os.path.join(REPO_ROOT, "data", "benchmarks", "history.jsonl")
+# slowdowns smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.01
+
+def corpus_dir(cache_dir, n_posts, seed):
+    return os.path.join(cache_dir, f"{n_posts}-posts-seed{seed}")
+
+def run_one(name, n_posts, seed, repeat, cache_dir):
+    """ Set up and time one case in this process; return its result (seconds are the fastest of repeat runs) """
+    # imported here so the parent process stays small: peak RSS is measured per case
+    from instrumentation import peak_rss_mb
+
+    corpus = SyntheticCorpus(corpus_dir(cache_dir, n_posts, seed), n_posts, seed)
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as work_dir:
+        try:
+            run = CASES_BY_NAME[name].setup(corpus, work_dir)
+        except Skip as e:
+            return {"status": "skipped", "reason": str(e)}
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    rss = peak_rss_mb()
+    return {"status": "ran", "seconds": round(min(times), 4), "runs": [round(t, 4) for t in times],
+            "peak_rss_mb": None if rss is None else round(rss, 1)}
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def previous_result(history, record):
+    """ The latest earlier result of the same case, size and machine """
+    for past in reversed(history):
+        if (past["case"], past["posts"], past["machine"]) == (record["case"], record["posts"], record["machine"]) \
+                and past.get("status") == "ran":
+            return past
+    return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="corpus sizes in posts (e.g. 1000 10000 100000 1000000)")
+    parser.add_argument("--cases", type=str, nargs="+", default=[case.name for case in CASES], choices=list(CASES_BY_NAME))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic corpora")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="where the synthetic corpora are written and reused")
+    parser.add_argument("--history", type=str, default=DEFAULT_HISTORY, help="JSON-lines file every result is appended to")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown against the previous result reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if any case regressed")
+    parser.add_argument("--run-one", type=str, nargs=2, metavar=("CASE", "POSTS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        # child process: print the result of one case as the last line of output
+        result = run_one(args.run_one[0], int(args.run_one[1]), args.seed, args.repeat, args.cache_dir)
+        print(json.dumps(result))
+        raise SystemExit(0)
+
+    commit, dirty = git_revision()
+    history = read_history(args.history)
+    regressions = []
+    for n_posts in args.sizes:
+        # written once, before any case is timed
+        print(f"[benchmarks] synthetic corpus of {n_posts} posts in {corpus_dir(args.cache_dir, n_posts, args.seed)}")
+        for name in args.cases:
+            case = CASES_BY_NAME[name]
+            record = {
+                "case": name,
+                "posts": n_posts,
+                "commit": commit,
+                "dirty": dirty,
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.node() + "/" + platform.machine(),
+                "repeat": args.repeat,
+                "seed": args.seed
+            }
+            if case.max_posts is not None and n_posts > case.max_posts:
+                record.update(status="skipped", reason=f"more than {case.max_posts} posts")
+            else:
+                # one process per case, so its peak RSS is its own and nothing is cached between cases
+                process = subprocess.run([sys.executable, "-m", "benchmarks", "--run-one", name, str(n_posts), "--seed", str(args.seed),
+                                          "--repeat", str(args.repeat), "--cache-dir", args.cache_dir],
+                                         cwd=os.path.join(REPO_ROOT, "data"), capture_output=True, text=True,
+                                         env=dict(os.environ, PIPELINE_VERBOSITY="0"))
+                if process.returncode == 0:
+                    record.update(json.loads(process.stdout.strip().splitlines()[-1]))
+                else:
+                    record.update(status="failed", reason=process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "")
+
+            line = f"{name:>36} {n_posts:>8} posts  "
+            if record["status"] == "ran":
+                line += f"{record['seconds']:9.3f}s {record['peak_rss_mb'] or 0:9.1f} MB"
+                previous = previous_result(history, record)
+                if previous is not None:
+                    change = record["seconds"] / previous["seconds"] - 1 if previous["seconds"] > 0 else 0
+                    record["change"] = round(change, 4)
+                    line += f"  {change:+7.1%} vs {(previous['commit'] or '?')[:8]}"
+                    if change > args.threshold and record["seconds"] - previous["seconds"] > MIN_REGRESSION_SECONDS:
+                        regressions.append(record)
+                        line += "  REGRESSION"
+            else:
+                line += f"{record['status']}: {record['reason']}"
+            print(line)
+
+            history.append(record)
+            os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+            with open(args.history, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    if regressions:
+        print(f"{len(regressions)} case(s) more than {args.threshold:.0%} slower than their previous result")
+        if args.fail_on_regression:
+            raise SystemExit(1)
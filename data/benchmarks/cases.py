@@ -0,0 +1,186 @@
+import importlib.util
+import itertools
+import json
+import os
+import sys
+
+# Each case prepares its inputs from a SyntheticCorpus (untimed) and returns the function to time.
+# The pipeline scripts are loaded straight from their files, so a case always measures the code in the
+# working tree. A case whose dependencies aren't installed (gensim, spaCy and its model, ...) raises
+# Skip from its setup, and cases that don't scale (processText(s), t-SNE) say how many posts they handle at most.
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+PROCESSING_DIR = os.path.join(REPO_ROOT, "app", "public", "data", "processing")
+TOPIC_MODELING_DIR = os.path.join(REPO_ROOT, "app", "public", "data", "topic-modeling")
+EMBEDDINGS_DIR = os.path.join(REPO_ROOT, "data", "embeddings")
+
+class Skip(Exception):
+    """ Raised by a case's setup when the case can't run here """
+
+def load_script(path):
+    """ Import a pipeline script by path (most have dashes in their names), with its folder on sys.path """
+    name = os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except (ImportError, OSError) as e:
+        # missing packages, or spacy.load() not finding its model
+        raise Skip(f"{os.path.basename(path)}: {e}")
+    sys.modules[name] = module
+    return module
+
+class Case:
+    """ A benchmark: setup(corpus, work_dir) returns a function of no arguments, which is what gets timed """
+
+    def __init__(self, name, setup, max_posts=None):
+        self.name = name
+        self.setup = setup
+        self.max_posts = max_posts
+
+# ----- setups -----
+
+def process_csv_to_json(corpus, work_dir):
+    json_creation = load_script(os.path.join(PROCESSING_DIR, "json-creation.py"))
+    csv_path = corpus.csv_path()
+    return lambda: json_creation.process_csv_to_json(csv_path)
+
+def merge_posts(corpus, work_dir):
+    cleanup = load_script(os.path.join(PROCESSING_DIR, "combine-data", "cleanup.py"))
+    files = corpus.merge_input_paths()
+    return lambda: cleanup.merge_posts(files, conflict_strategy="combine")
+
+def merge_posts_partitioned(corpus, work_dir):
+    cleanup = load_script(os.path.join(PROCESSING_DIR, "combine-data", "cleanup.py"))
+    files = corpus.merge_input_paths()
+    # a fresh work dir per run, since the partitions of an earlier run would be reused
+    runs = iter(range(sys.maxsize))
+    def run():
+        i = next(runs)
+        cleanup.merge_posts_partitioned(files, os.path.join(work_dir, f"consolidated-{i}.json"), conflict_strategy="combine",
+                                        work_dir=os.path.join(work_dir, f"merge-work-{i}"))
+    return run
+
+def process_text(corpus, work_dir):
+    preprocess = load_script(os.path.join(TOPIC_MODELING_DIR, "preprocess-data.py"))
+    bodies = [post["body"] for _, post, _ in corpus.posts()]
+    return lambda: [preprocess.processText(body) for body in bodies]
+
+def process_texts(corpus, work_dir):
+    # what preprocess-data.py's run does: every body through nlp.pipe in batches
+    preprocess = load_script(os.path.join(TOPIC_MODELING_DIR, "preprocess-data.py"))
+    bodies = [post["body"] for _, post, _ in corpus.posts()]
+    return lambda: list(preprocess.processTexts(bodies))
+
+def read_corpus(corpus, work_dir):
+    generate = load_script(os.path.join(EMBEDDINGS_DIR, "generate.py"))
+    posts_fname = corpus.output_json_path()
+    corpus_fname = os.path.join(work_dir, "corpus.json")
+
+    def run():
+        # read_corpus loads a saved corpus if there is one, so every run starts without it
+        if os.path.exists(corpus_fname):
+            os.remove(corpus_fname)
+        return generate.read_corpus(corpus.n_posts, corpus_fname, posts_fname=posts_fname)
+    return run
+
+def tokenized_posts(corpus, n_posts=None):
+    from cooccurrence import tokenize_post
+    return [tokenize_post(post["title"], post["body"]) for _, post, _ in itertools.islice(corpus.posts(), n_posts)]
+
+def compute_co_occurrence_matrix(corpus, work_dir):
+    generate = load_script(os.path.join(EMBEDDINGS_DIR, "generate.py"))
+    # the dense matrix is words x words (about 6 GB at 1000 posts), so it only ever gets generate.py's
+    # default sample of posts, whatever the corpus size
+    posts = tokenized_posts(corpus, generate.NUM_SAMPLES)
+    dict_fname = os.path.join(work_dir, "word2ind.json")
+    matrix_fname = os.path.join(work_dir, "co-occurrence_matrix.npy")
+
+    def run():
+        for path in (dict_fname, matrix_fname):
+            if os.path.exists(path):
+                os.remove(path)
+        return generate.compute_co_occurrence_matrix(posts, 4, dict_fname, matrix_fname)
+    return run
+
+def compute_sparse_co_occurrence_matrix(corpus, work_dir):
+    generate = load_script(os.path.join(EMBEDDINGS_DIR, "generate.py"))
+    posts = tokenized_posts(corpus)
+    dict_fname = os.path.join(work_dir, "word2ind.json")
+    # a fresh prefix per run, since a saved matrix would be loaded instead of counted
+    runs = iter(range(sys.maxsize))
+    return lambda: generate.compute_sparse_co_occurrence_matrix(posts, 4, dict_fname,
+                                                                os.path.join(work_dir, f"co-occurrence-{next(runs)}"))
+
+def compute_sharded_co_occurrence_matrix(corpus, work_dir):
+    cooccurrence = load_script(os.path.join(EMBEDDINGS_DIR, "cooccurrence.py"))
+    posts = [(post["title"], post["body"]) for _, post, _ in corpus.posts()]
+    return lambda: cooccurrence.compute_sharded_co_occurrence_matrix(posts, window_size=4)
+
+def reduce_to_k_dim(corpus, work_dir):
+    generate = load_script(os.path.join(EMBEDDINGS_DIR, "generate.py"))
+    M, _ = generate.compute_sparse_co_occurrence_matrix(tokenized_posts(corpus), 4, os.path.join(work_dir, "word2ind.json"),
+                                                        os.path.join(work_dir, "co-occurrence"))
+    return lambda: generate.reduce_to_k_dim(M, k=2, random_state=0)
+
+def reweight_ppmi(corpus, work_dir):
+    generate = load_script(os.path.join(EMBEDDINGS_DIR, "generate.py"))
+    from weighting import reweight
+    M, _ = generate.compute_sparse_co_occurrence_matrix(tokenized_posts(corpus), 4, os.path.join(work_dir, "word2ind.json"),
+                                                        os.path.join(work_dir, "co-occurrence"))
+    return lambda: reweight(M, "ppmi")
+
+def nmf_fit(corpus, work_dir):
+    # same model as NMF-topic-modeling.py, which runs at import time and so can't be loaded here
+    from sklearn.decomposition import NMF
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    with open(corpus.root_words_path(), "r") as f:
+        root_words = json.load(f)
+    dtm = TfidfVectorizer().fit_transform([" ".join(words) for words in root_words.values()])
+    return lambda: NMF(n_components=15, random_state=42).fit(dtm)
+
+def pca_layout(corpus, work_dir):
+    layout = load_script(os.path.join(TOPIC_MODELING_DIR, "layout.py"))
+    weights = corpus.topic_weights()
+    return lambda: layout.pcaLayout(layout.Layouts(weights, cacheDir=None))
+
+def randomized_pca_layout(corpus, work_dir):
+    layout = load_script(os.path.join(TOPIC_MODELING_DIR, "layout.py"))
+    weights = corpus.topic_weights()
+    return lambda: layout.randomizedPCALayout(layout.Layouts(weights, cacheDir=None))
+
+def tsne_layout(corpus, work_dir):
+    layout = load_script(os.path.join(TOPIC_MODELING_DIR, "layout.py"))
+    weights = corpus.topic_weights()
+    # the kNN graph is part of the run: without a cache dir every Layouts builds its own
+    return lambda: layout.tsneLayout(layout.Layouts(weights, cacheDir=None))
+
+def knn_graph_layout(corpus, work_dir):
+    layout = load_script(os.path.join(TOPIC_MODELING_DIR, "layout.py"))
+    weights = corpus.topic_weights()
+    return lambda: layout.knnGraphLayout(layout.Layouts(weights, cacheDir=None))
+
+CASES = [
+    Case("process_csv_to_json", process_csv_to_json),
+    Case("merge_posts", merge_posts),
+    Case("merge_posts_partitioned", merge_posts_partitioned),
+    Case("processText", process_text, max_posts=10000),
+    Case("processTexts", process_texts, max_posts=10000),
+    Case("read_corpus", read_corpus),
+    Case("compute_co_occurrence_matrix", compute_co_occurrence_matrix),
+    Case("compute_sparse_co_occurrence_matrix", compute_sparse_co_occurrence_matrix),
+    Case("compute_sharded_co_occurrence_matrix", compute_sharded_co_occurrence_matrix),
+    Case("reduce_to_k_dim", reduce_to_k_dim),
+    Case("reweight_ppmi", reweight_ppmi),
+    Case("nmf_fit", nmf_fit, max_posts=100000),
+    Case("pca_layout", pca_layout),
+    Case("randomized_pca_layout", randomized_pca_layout),
+    Case("tsne_layout", tsne_layout, max_posts=100000),
+    Case("knn_graph_layout", knn_graph_layout, max_posts=100000),
+]
+CASES_BY_NAME = {case.name: case for case in CASES}
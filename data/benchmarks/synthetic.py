@@ -0,0 +1,264 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+# ------------------------------------------
+# Synthetic love letters corpora of any size
+# ------------------------------------------
+#
+# Posts and comments are drawn from a Zipfian vocabulary: a head of real stop words and love letter
+# words followed by made-up words, word i drawn with probability proportional to 1 / (i + 1)^s. Post,
+# title and comment lengths are log-normal and comment counts geometric, tuned to the real corpus
+# (about 2.6 comments and 250 words per post). Everything comes from one seeded generator, so a
+# (n_posts, seed) pair always gives the same corpus.
+#
+# Files are written on first use, streamed post by post, and reused by later runs:
+#   uncleaned-data.csv        the scraped CSV (same 27 columns, BOM and quoting)
+#   output.json               what json-creation.py writes: {"post": {post_id: post}}
+#   main.json, sentiment.json, topic.json
+#                             the inputs combine-data/cleanup.py merges
+#   consolidated_posts.json   what cleanup.py writes from them
+#   cleaned-root-words.json   what preprocess-data.py writes: {post_id: [root words]}
+#   topic-weights.npy         (n_posts x 15) document-topic weights, for the layouts
+
+CSV_HEADERS = ["body", "category", "communityName", "createdAt", "dataType", "flair", "html", "id", "isAd", "isVideo",
+               "link", "numberOfComments", "numberOfreplies", "over18", "parentId", "parsedCommunityName", "parsedId",
+               "postId", "scrapedAt", "thumbnailUrl", "title", "upVoteRatio", "upVotes", "url", "userId", "username",
+               "videoUrl"]
+
+STOP_WORDS = ["i", "you", "the", "to", "and", "a", "my", "of", "me", "it", "that", "in", "is", "for", "your", "was",
+              "but", "so", "with", "be", "have", "this", "we", "just", "not", "on", "all", "are", "what", "i'm",
+              "at", "as", "do", "if", "know", "like", "can", "me.", "one", "will", "would", "still", "there", "when",
+              "from", "about", "an", "or", "been", "our", "how", "even", "because", "they", "out", "it's", "never"]
+CONTENT_WORDS = ["love", "miss", "want", "hope", "heart", "time", "feel", "think", "always", "life", "day", "back",
+                 "sorry", "together", "forever", "happy", "hurt", "goodbye", "remember", "friend", "home", "beautiful",
+                 "wish", "dream", "kiss", "hold", "tonight", "tomorrow", "years", "boyfriend", "girlfriend", "husband",
+                 "wife", "mom", "dad", "baby", "letter", "moment", "smile", "night", "thank", "sad", "alone", "world"]
+TOPIC_LABELS = ["Hopeful Goodbyes", "Lost Love", "Longing", "Gratitude", "Family", "Heartbreak", "New Love",
+                "Regret", "Distance", "Friendship", "Memories", "Self Love", "Grief", "Marriage", "Waiting"]
+SYLLABLES = ["ka", "lo", "mi", "re", "sa", "tu", "ne", "vi", "do", "ra", "el", "an", "or", "is", "um", "ta", "li",
+             "ber", "con", "den", "fal", "gor", "hin", "jas", "mor", "pel", "quin", "ster", "tal", "wen"]
+
+N_TOPICS = len(TOPIC_LABELS)
+START_DATE = np.datetime64("2023-01-01T00:00:00")
+DATE_RANGE_SECONDS = 700 * 24 * 3600
+
+def make_vocabulary(size, seed=0):
+    """ size distinct words: the stop and content words first, then made-up words of 2-4 syllables """
+    rng = np.random.default_rng(seed)
+    words = list(dict.fromkeys(STOP_WORDS + CONTENT_WORDS))
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(SYLLABLES[i] for i in rng.integers(0, len(SYLLABLES), rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words[:size]
+
+class SyntheticCorpus:
+    """ A seeded synthetic corpus of n_posts posts, written into directory in the pipeline's formats on first use
+    """
+
+    def __init__(self, directory, n_posts, seed=0, vocab_size=50000, zipf_exponent=1.07):
+        self.directory = directory
+        self.n_posts = n_posts
+        self.seed = seed
+        self.words = np.array(make_vocabulary(vocab_size, seed), dtype=object)
+        ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+        self.cumulative = np.cumsum(ranks ** -zipf_exponent)
+        self.cumulative /= self.cumulative[-1]
+        self.is_stop = np.zeros(vocab_size, dtype=bool)
+        self.is_stop[:len(STOP_WORDS)] = True
+        # AFINN-like valences: a few content words are positive or negative
+        valence_rng = np.random.default_rng(seed + 1)
+        self.valence = np.where(valence_rng.random(vocab_size) < 0.08, valence_rng.integers(-5, 6, vocab_size), 0)
+        self.valence[:len(STOP_WORDS)] = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    # ----- generation -----
+
+    def _draw(self, rng, n):
+        return np.searchsorted(self.cumulative, rng.random(n))
+
+    def _text(self, rng, ids):
+        """ Words with a period every few words and a paragraph break every few sentences """
+        words = self.words[ids].tolist()
+        if not words:
+            return ""
+        ends = np.cumsum(rng.integers(6, 18, len(words)))
+        ends = ends[ends < len(words)]
+        parts = []
+        start = 0
+        for i, end in enumerate(ends.tolist() + [len(words)]):
+            sentence = " ".join(words[start:end])
+            parts.append(sentence[:1].upper() + sentence[1:] + ".")
+            parts.append("\n\n" if i % 4 == 3 else " ")
+            start = end
+        return "".join(parts[:-1])
+
+    def _sentiment(self, ids):
+        """ The analysis.py result object for a text made of these word ids """
+        tokens = self.words[ids].tolist()
+        scores = self.valence[ids]
+        scored = np.flatnonzero(scores)[::-1]
+        score = int(scores.sum())
+        return {
+            "score": score,
+            "comparative": score / len(tokens) if tokens else 0,
+            "calculation": [{tokens[i]: int(scores[i])} for i in scored],
+            "tokens": tokens,
+            "words": [tokens[i] for i in scored],
+            "positive": [tokens[i] for i in scored if scores[i] > 0],
+            "negative": [tokens[i] for i in scored if scores[i] < 0]
+        }
+
+    def posts(self):
+        """ Yield (post_id, post, extras) for every post. post has the fields json-creation.py writes;
+            extras holds the word ids of the title / body / comments, the sentiment and the topic.
+        """
+        rng = np.random.default_rng(self.seed)
+        for i in range(self.n_posts):
+            post_id = f"t3_{i:07x}"
+            created = START_DATE + np.timedelta64(int(rng.integers(0, DATE_RANGE_SECONDS)), "s")
+            created_at = str(created) + ".000Z"
+            title_ids = self._draw(rng, int(rng.integers(2, 9)))
+            body_ids = self._draw(rng, max(1, int(rng.lognormal(5.0, 0.9))))
+            n_comments = int(rng.geometric(1 / 3.6)) - 1
+            comment_ids = [self._draw(rng, max(1, int(rng.lognormal(3.2, 0.8)))) for _ in range(n_comments)]
+            username = f"user_{int(rng.integers(0, max(self.n_posts // 2, 1))):x}"
+
+            body = self._text(rng, body_ids)
+            url = f"https://www.reddit.com/r/LoveLetters/comments/{post_id[3:]}/letter/"
+            comments = []
+            for c, ids in enumerate(comment_ids):
+                comment_id = f"t1_{i:07x}{c:02x}"
+                comments.append({
+                    "body": self._text(rng, ids),
+                    "parentID": post_id,
+                    "commentId": comment_id,
+                    "url": url + comment_id[3:] + "/",
+                    "username": f"user_{int(rng.integers(0, max(self.n_posts // 2, 1))):x}",
+                    "createdAt": created_at
+                })
+            post = {
+                "title": self._text(rng, title_ids).rstrip("."),
+                "body": body,
+                "createdAt": created_at,
+                "topics": [],
+                "html": "&lt;!-- SC_OFF --&gt;&lt;div class=\"md\"&gt;&lt;p&gt;" + body.replace("\n\n", "&lt;/p&gt;\n\n&lt;p&gt;")
+                        + "&lt;/p&gt;\n&lt;/div&gt;&lt;!-- SC_ON --&gt;",
+                "numberOfComments": n_comments,
+                "upVoteRatio": round(float(rng.uniform(0.5, 1.0)), 2),
+                "upVotes": int(rng.geometric(0.1)),
+                "url": url,
+                "username": username,
+                "comments": comments
+            }
+            extras = {
+                "title_ids": title_ids,
+                "body_ids": body_ids,
+                "comment_ids": comment_ids,
+                "topic_idx": int(rng.integers(0, N_TOPICS))
+            }
+            yield post_id, post, extras
+
+    # ----- files -----
+
+    def _write(self, name, write):
+        """ Write a file once (atomically) and return its path """
+        path = self.path(name)
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        return path
+
+    def csv_path(self):
+        def write(f):
+            f.write("﻿")
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(CSV_HEADERS)
+            for post_id, post, _ in self.posts():
+                row = dict.fromkeys(CSV_HEADERS, "")
+                row.update(body=post["body"], communityName="r/LoveLetters", createdAt=post["createdAt"], dataType="post",
+                           html=post["html"], id=post_id, isAd="false", isVideo="false", link=post["url"],
+                           numberOfComments=post["numberOfComments"], over18="false", parsedCommunityName="LoveLetters",
+                           parsedId=post_id[3:], scrapedAt=post["createdAt"], title=post["title"],
+                           upVoteRatio=post["upVoteRatio"], upVotes=post["upVotes"], url=post["url"],
+                           userId="t2_" + post["username"][5:], username=post["username"])
+                writer.writerow([row[h] for h in CSV_HEADERS])
+                for comment in post["comments"]:
+                    row = dict.fromkeys(CSV_HEADERS, "")
+                    row.update(body=comment["body"], category="LoveLetters", communityName="r/LoveLetters",
+                               createdAt=comment["createdAt"], dataType="comment",
+                               html="&lt;div class=\"md\"&gt;&lt;p&gt;" + comment["body"] + "&lt;/p&gt;\n&lt;/div&gt;",
+                               id=comment["commentId"], numberOfreplies=0, parentId=post_id, parsedId=comment["commentId"][3:],
+                               postId=post_id, scrapedAt=comment["createdAt"], upVotes=1, url=comment["url"],
+                               userId="t2_" + comment["username"][5:], username=comment["username"])
+                    writer.writerow([row[h] for h in CSV_HEADERS])
+        return self._write("uncleaned-data.csv", write)
+
+    def output_json_path(self):
+        def write(f):
+            f.write('{"post": {')
+            for i, (post_id, post, _) in enumerate(self.posts()):
+                f.write((", " if i > 0 else "") + json.dumps(post_id) + ": " + json.dumps(post))
+            f.write("}}")
+        return self._write("output.json", write)
+
+    def _post_keyed(self, name, entry):
+        def write(f):
+            f.write("{")
+            for i, (post_id, post, extras) in enumerate(self.posts()):
+                f.write((", " if i > 0 else "") + json.dumps(post_id) + ": " + json.dumps(entry(post, extras)))
+            f.write("}")
+        return self._write(name, write)
+
+    def _sentiment_entry(self, post, extras):
+        comments = [{"commentId": c + 1, "username": comment["username"], "sentiment": self._sentiment(ids)}
+                    for c, (comment, ids) in enumerate(zip(post["comments"], extras["comment_ids"]))]
+        return {
+            "titleSentiment": self._sentiment(extras["title_ids"]),
+            "bodySentiment": self._sentiment(extras["body_ids"]),
+            "commentsSentiment": comments,
+            "averageCommentScore": sum(c["sentiment"]["score"] for c in comments) / len(comments) if comments else 0,
+            "date": post["createdAt"]
+        }
+
+    @staticmethod
+    def _topic_entry(extras):
+        return {"topic_idx": extras["topic_idx"], "topic_label": TOPIC_LABELS[extras["topic_idx"]]}
+
+    def merge_input_paths(self):
+        """ [main.json, sentiment.json, topic.json] """
+        return [
+            self._post_keyed("main.json", lambda post, extras: post),
+            self._post_keyed("sentiment.json", self._sentiment_entry),
+            self._post_keyed("topic.json", lambda post, extras: self._topic_entry(extras))
+        ]
+
+    def consolidated_path(self):
+        return self._post_keyed("consolidated_posts.json", lambda post, extras: dict(
+            post, **self._sentiment_entry(post, extras), **self._topic_entry(extras)))
+
+    def root_words_path(self):
+        # lowercased content words, the way preprocess-data.py leaves them (minus the lemmatization)
+        return self._post_keyed("cleaned-root-words.json", lambda post, extras: [
+            w for w, stop in zip(self.words[extras["body_ids"]].tolist(), self.is_stop[extras["body_ids"]].tolist()) if not stop])
+
+    def topic_weights(self):
+        """ (n_posts x 15) float32 document-topic weights, peaked on each post's topic """
+        path = self.path("topic-weights.npy")
+        if not os.path.exists(path):
+            rng = np.random.default_rng(self.seed + 2)
+            weights = rng.dirichlet(np.full(N_TOPICS, 0.3), self.n_posts).astype(np.float32)
+            topics = np.array([extras["topic_idx"] for _, _, extras in self.posts()], dtype=np.int64)
+            weights[np.arange(self.n_posts), topics] += 0.5
+            np.save(path, weights)
+        return np.load(path)
@@ -0,0 +1,8 @@
+""" Columnar, memory-mapped storage for the love letters corpus.
+
+    Posts, comments, processed tokens and topic weights live in one directory of .npy / raw byte
+    columns, so pipeline stages can read just the fields they need by post id instead of parsing
+    output.json / main.json / consolidated_posts.json in full.
+"""
+from .store import CorpusReader, CorpusWriter, StringColumn
+from .export import build_store, export_posts, export_root_words
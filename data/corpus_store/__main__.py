@@ -0,0 +1,37 @@
+import argparse
+
+from instrumentation import log
+
+from .export import build_store, export_posts, export_root_words
+from .store import CorpusReader
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m corpus_store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="build a store from the pipeline's JSON files")
+    build.add_argument("store", type=str)
+    build.add_argument("--posts", type=str, required=True, help="output.json, main.json or consolidated_posts.json")
+    build.add_argument("--root-words", type=str, help="cleaned-root-words.json")
+    build.add_argument("--topic-weights", type=str, help="top_topics_with_weights.json")
+
+    export = subparsers.add_parser("export", help="write JSON files back out of a store")
+    export.add_argument("store", type=str)
+    export.add_argument("--posts", type=str, help="where to write the posts")
+    export.add_argument("--wrap", type=str, help='wrap the posts in an object under this key ("post" for output.json)')
+    export.add_argument("--root-words", type=str, help="where to write the tokens of each post")
+    export.add_argument("--indent", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_store(args.store, args.posts, args.root_words, args.topic_weights)
+        log(1, f"Corpus store written to {args.store}")
+    else:
+        reader = CorpusReader(args.store)
+        indent = args.indent if args.indent > 0 else None
+        if args.posts:
+            export_posts(reader, args.posts, indent=indent, wrap=args.wrap)
+            log(1, f"Posts written to {args.posts}")
+        if args.root_words:
+            export_root_words(reader, args.root_words, indent=indent)
+            log(1, f"Root words written to {args.root_words}")
@@ -0,0 +1,74 @@
+import json
+
+from .store import CorpusWriter
+
+# Builds stores from the JSON files the pipeline already produces, and writes those JSON files back
+# out of a store (the Next.js app still fetches the JSON versions).
+
+def _write_items(f, items, indent, level):
+    """ Stream a JSON object from (key, value) pairs, formatted exactly like json.dump(dict(items), indent=indent)
+        nested `level` objects deep.
+    """
+    if indent is None:
+        f.write("{")
+        for i, (key, value) in enumerate(items):
+            if i > 0:
+                f.write(", ")
+            f.write(json.dumps(key) + ": " + json.dumps(value))
+        f.write("}")
+        return
+
+    inner = "\n" + " " * (indent * (level + 1))
+    empty = True
+    for key, value in items:
+        f.write("{" + inner if empty else "," + inner)
+        f.write(json.dumps(key) + ": " + json.dumps(value, indent=indent).replace("\n", inner))
+        empty = False
+    f.write("{}" if empty else "\n" + " " * (indent * level) + "}")
+
+def _write_document(path, items, indent, wrap):
+    with open(path, "w", encoding="utf-8") as f:
+        if wrap is None:
+            _write_items(f, items, indent, 0)
+        else:
+            # {"<wrap>": {...}}, e.g. output.json's {"post": {...}}
+            f.write("{" if indent is None else "{\n" + " " * indent)
+            f.write(json.dumps(wrap) + ": ")
+            _write_items(f, items, indent, 0 if indent is None else 1)
+            f.write("}" if indent is None else "\n}")
+
+def export_posts(reader, path, indent=4, wrap=None, with_comments=True):
+    """ Write every post, e.g. main.json / consolidated_posts.json (wrap=None) or output.json (wrap="post")
+    """
+    _write_document(path, reader.iter_posts(with_comments), indent, wrap)
+
+def export_root_words(reader, path, indent=4):
+    """ Write {post_id: [tokens]} for posts that have tokens, like cleaned-root-words.json
+    """
+    items = ((post_id, reader.tokens(post_id)) for post_id in reader.post_ids
+             if reader.token_ids(post_id) is not None)
+    _write_document(path, items, indent, None)
+
+def build_store(path, posts_json, root_words_json=None, topic_weights_json=None):
+    """ Create a store from a posts file (output.json with its "post" wrapper, or a post-keyed
+        file like main.json / consolidated_posts.json), plus optional tokens and topic weights.
+    """
+    with open(posts_json, "r") as f:
+        posts = json.load(f)
+    if set(posts.keys()) == {"post"}:
+        posts = posts["post"]
+
+    with CorpusWriter(path) as writer:
+        for post_id, post in posts.items():
+            writer.add_post(post_id, post)
+        del posts
+
+        if root_words_json is not None:
+            with open(root_words_json, "r") as f:
+                for post_id, tokens in json.load(f).items():
+                    writer.set_tokens(post_id, tokens)
+
+        if topic_weights_json is not None:
+            with open(topic_weights_json, "r") as f:
+                for entry in json.load(f):
+                    writer.set_topic_weights(entry["post_id"], entry["all_weights"])
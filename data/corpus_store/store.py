@@ -0,0 +1,356 @@
+import json
+import os
+from array import array
+
+import numpy as np
+
+# On-disk layout of a corpus store directory:
+#
+#   manifest.json                   counts, column names, format version
+#   <col>.bytes + <col>.offsets.npy string column: utf-8 bytes of every value back to back, and n+1 offsets
+#   <col>.npy                       numeric column
+#   comment_offsets.npy             comments of post i are rows comment_offsets[i]:comment_offsets[i+1]
+#   token_vocab.*, token_ids.npy,   tokens of post i are token_vocab[token_ids[token_offsets[i]:token_offsets[i+1]]]
+#   token_offsets.npy, token_mask.npy
+#   topic_weights.npy, topic_mask.npy  float32 (n_posts, n_topics) document-topic weights
+#
+# Everything is opened with mmap, so reading one field of one post only touches the pages it needs.
+
+FORMAT_VERSION = 1
+
+POST_STRING_FIELDS = ["title", "body", "createdAt", "html", "url", "username"]
+POST_NUMERIC_FIELDS = {"numberOfComments": np.int64, "upVoteRatio": np.float64, "upVotes": np.int64}
+# the key order posts have in output.json / main.json
+POST_FIELD_ORDER = ["title", "body", "createdAt", "topics", "html", "numberOfComments",
+                    "upVoteRatio", "upVotes", "url", "username"]
+COMMENT_STRING_FIELDS = ["body", "parentID", "commentId", "url", "username", "createdAt"]
+# key of the 'extra' blob listing the column fields (and "comments") a post or comment didn't have,
+# which are stored as ""/0 but left out again when it is read back
+ABSENT_KEY = "__absent__"
+
+def _column_path(path, name, suffix):
+    return os.path.join(path, name + suffix)
+
+class StringColumnWriter:
+    """ Appends utf-8 strings to <name>.bytes as they arrive; offsets are written on close
+    """
+
+    def __init__(self, path, name):
+        self.file = open(_column_path(path, name, ".bytes"), "wb")
+        self.offsets_path = _column_path(path, name, ".offsets.npy")
+        self.offsets = array("q", [0])
+
+    def append(self, value):
+        encoded = value.encode("utf-8")
+        self.file.write(encoded)
+        self.offsets.append(self.offsets[-1] + len(encoded))
+
+    def close(self):
+        self.file.close()
+        np.save(self.offsets_path, np.frombuffer(self.offsets, dtype=np.int64))
+
+    def abort(self):
+        self.file.close()
+
+class StringColumn:
+    """ Read-only, memory-mapped string column. Values are decoded on access.
+    """
+
+    def __init__(self, path, name):
+        self.offsets = np.load(_column_path(path, name, ".offsets.npy"), mmap_mode="r")
+        bytes_path = _column_path(path, name, ".bytes")
+        if os.path.getsize(bytes_path) == 0:
+            self.data = np.zeros(0, dtype=np.uint8)
+        else:
+            self.data = np.memmap(bytes_path, dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class CorpusWriter:
+    """ Builds a corpus store directory.
+
+        Posts (with their comments) are streamed straight to the column files as they are added.
+        Tokens and topic weights can come from other files in any order and are aligned to the
+        post order when the writer is closed.
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.post_ids = StringColumnWriter(path, "post_id")
+        self.post_columns = {name: StringColumnWriter(path, name) for name in POST_STRING_FIELDS}
+        self.post_numeric = {name: [] for name in POST_NUMERIC_FIELDS}
+        self.post_extra = StringColumnWriter(path, "post_extra")
+        self.comment_columns = {name: StringColumnWriter(path, "comment_" + name) for name in COMMENT_STRING_FIELDS}
+        self.comment_extra = StringColumnWriter(path, "comment_extra")
+        self.comment_offsets = array("q", [0])
+        self.index = {}
+        self.tokens = {}
+        self.topic_weights = {}
+
+    def add_post(self, post_id, post):
+        """ Add one post in the output.json / consolidated_posts.json shape (comments included).
+            Keys that have no column (sentiment, topic labels, ...) and values whose type doesn't
+            fit their column are kept in a per-post JSON 'extra' blob, and column fields the post doesn't
+            have are listed there too, so the post reads back with exactly its own keys and values.
+        """
+        if post_id in self.index:
+            raise ValueError(f"Post {post_id} was already added")
+        self.index[post_id] = len(self.index)
+        self.post_ids.append(post_id)
+
+        extra = {}
+        absent = [name for name in POST_STRING_FIELDS + list(POST_NUMERIC_FIELDS) + ["comments"] if name not in post]
+        if absent:
+            extra[ABSENT_KEY] = absent
+        for name in POST_STRING_FIELDS:
+            value = post.get(name, "")
+            if not isinstance(value, str):
+                extra[name] = value
+                value = ""
+            self.post_columns[name].append(value)
+        for name, dtype in POST_NUMERIC_FIELDS.items():
+            python_type = float if dtype == np.float64 else int
+            value = post.get(name, python_type())
+            if type(value) is not python_type:
+                extra[name] = value
+                value = 0
+            self.post_numeric[name].append(value)
+        for key, value in post.items():
+            if key not in POST_STRING_FIELDS and key not in POST_NUMERIC_FIELDS and key != "comments":
+                extra[key] = value
+        self.post_extra.append(json.dumps(extra))
+
+        comments = post.get("comments", [])
+        for comment in comments:
+            comment_extra = {}
+            absent = [name for name in COMMENT_STRING_FIELDS if name not in comment]
+            if absent:
+                comment_extra[ABSENT_KEY] = absent
+            for name in COMMENT_STRING_FIELDS:
+                value = comment.get(name, "")
+                if not isinstance(value, str):
+                    comment_extra[name] = value
+                    value = ""
+                self.comment_columns[name].append(value)
+            for key, value in comment.items():
+                if key not in COMMENT_STRING_FIELDS:
+                    comment_extra[key] = value
+            self.comment_extra.append(json.dumps(comment_extra))
+        self.comment_offsets.append(self.comment_offsets[-1] + len(comments))
+
+    def set_tokens(self, post_id, tokens):
+        """ Attach the processed tokens (e.g. lemmas from cleaned-root-words.json) of a post
+        """
+        self.tokens[post_id] = tokens
+
+    def set_topic_weights(self, post_id, weights):
+        """ Attach the document-topic weights (e.g. all_weights from top_topics_with_weights.json) of a post
+        """
+        self.topic_weights[post_id] = weights
+
+    def close(self):
+        n_posts = len(self.index)
+        for writer in [self.post_ids, self.post_extra, self.comment_extra,
+                       *self.post_columns.values(), *self.comment_columns.values()]:
+            writer.close()
+        for name, dtype in POST_NUMERIC_FIELDS.items():
+            np.save(_column_path(self.path, name, ".npy"), np.array(self.post_numeric[name], dtype=dtype))
+        np.save(_column_path(self.path, "comment_offsets", ".npy"), np.frombuffer(self.comment_offsets, dtype=np.int64))
+
+        # tokens: integer-encode against one vocabulary, in post order
+        vocab = {}
+        vocab_writer = StringColumnWriter(self.path, "token_vocab")
+        token_ids = array("i")
+        token_offsets = array("q", [0])
+        token_mask = np.zeros(n_posts, dtype=bool)
+        for post_id, i in self.index.items():
+            tokens = self.tokens.get(post_id)
+            if tokens is not None:
+                token_mask[i] = True
+                for token in tokens:
+                    if token not in vocab:
+                        vocab[token] = len(vocab)
+                        vocab_writer.append(token)
+                    token_ids.append(vocab[token])
+            token_offsets.append(len(token_ids))
+        vocab_writer.close()
+        np.save(_column_path(self.path, "token_ids", ".npy"), np.frombuffer(token_ids, dtype=np.int32))
+        np.save(_column_path(self.path, "token_offsets", ".npy"), np.frombuffer(token_offsets, dtype=np.int64))
+        np.save(_column_path(self.path, "token_mask", ".npy"), token_mask)
+
+        n_topics = max((len(w) for w in self.topic_weights.values()), default=0)
+        topic_weights = np.full((n_posts, n_topics), np.nan, dtype=np.float32)
+        topic_mask = np.zeros(n_posts, dtype=bool)
+        for post_id, weights in self.topic_weights.items():
+            if post_id in self.index:
+                i = self.index[post_id]
+                topic_weights[i, :len(weights)] = weights
+                topic_mask[i] = True
+        np.save(_column_path(self.path, "topic_weights", ".npy"), topic_weights)
+        np.save(_column_path(self.path, "topic_mask", ".npy"), topic_mask)
+
+        with open(os.path.join(self.path, "manifest.json"), "w") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "n_posts": n_posts,
+                "n_comments": int(self.comment_offsets[-1]),
+                "n_tokens": len(token_ids),
+                "n_vocab": len(vocab),
+                "n_topics": n_topics
+            }, f, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """ Close the open column files without finishing the store (it gets no manifest, so it can't be opened) """
+        for writer in [self.post_ids, self.post_extra, self.comment_extra,
+                       *self.post_columns.values(), *self.comment_columns.values()]:
+            writer.abort()
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.abort()
+
+class CorpusReader:
+    """ Lazy, memory-mapped access to a corpus store directory.
+
+        Columns are only opened the first time they are used, and single values are decoded on demand,
+        so pulling e.g. the title of one post never parses the rest of the corpus.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported corpus store version {self.manifest['version']} in {path}")
+        self._columns = {}
+        self._index = None
+
+    def __len__(self):
+        return self.manifest["n_posts"]
+
+    def _string_column(self, name):
+        if name not in self._columns:
+            self._columns[name] = StringColumn(self.path, name)
+        return self._columns[name]
+
+    def _array(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(_column_path(self.path, name, ".npy"), mmap_mode="r")
+        return self._columns[name]
+
+    @property
+    def post_ids(self):
+        return list(self._string_column("post_id"))
+
+    def index_of(self, post_id):
+        """ Row number of a post id (raises KeyError for unknown ids)
+        """
+        if self._index is None:
+            self._index = {post_id: i for i, post_id in enumerate(self._string_column("post_id"))}
+        return self._index[post_id]
+
+    def column(self, name):
+        """ A whole post column: a StringColumn for text fields, a memory-mapped array for numeric ones
+        """
+        if name in POST_STRING_FIELDS:
+            return self._string_column(name)
+        if name in POST_NUMERIC_FIELDS:
+            return self._array(name)
+        raise KeyError(f"No column named {name}")
+
+    def _extra(self, i):
+        return json.loads(self._string_column("post_extra")[i])
+
+    def get(self, post_id, field):
+        """ One field of one post (KeyError if the post was stored without it)
+        """
+        i = self.index_of(post_id)
+        extra = self._extra(i)
+        if field in extra.get(ABSENT_KEY, ()):
+            raise KeyError(f"Post {post_id} has no {field}")
+        if field == "comments":
+            return self.comments(post_id)
+        if field in extra:
+            return extra[field]
+        value = self.column(field)[i]
+        return value if field in POST_STRING_FIELDS else value.item()
+
+    def comments(self, post_id):
+        i = self.index_of(post_id)
+        offsets = self._array("comment_offsets")
+        comments = []
+        for c in range(offsets[i], offsets[i + 1]):
+            extra = json.loads(self._string_column("comment_extra")[c])
+            absent = extra.pop(ABSENT_KEY, ())
+            comment = {name: self._string_column("comment_" + name)[c] for name in COMMENT_STRING_FIELDS if name not in absent}
+            comment.update(extra)
+            comments.append(comment)
+        return comments
+
+    def post(self, post_id, with_comments=True):
+        """ A post rebuilt in the output.json shape, plus any extra keys it was stored with
+        """
+        i = self.index_of(post_id)
+        extra = self._extra(i)
+        absent = extra.pop(ABSENT_KEY, ())
+        post = {}
+        for name in POST_FIELD_ORDER:
+            if name in absent:
+                continue
+            if name in extra:
+                post[name] = extra.pop(name)
+            elif name in POST_STRING_FIELDS:
+                post[name] = self._string_column(name)[i]
+            elif name in POST_NUMERIC_FIELDS:
+                post[name] = self._array(name)[i].item()
+        if with_comments and "comments" not in absent:
+            post["comments"] = self.comments(post_id)
+        post.update(extra)
+        return post
+
+    def iter_posts(self, with_comments=True):
+        for post_id in self._string_column("post_id"):
+            yield post_id, self.post(post_id, with_comments)
+
+    def token_ids(self, post_id):
+        """ Integer-encoded tokens of a post as a memory-mapped int32 view, or None if it has none
+        """
+        i = self.index_of(post_id)
+        if not self._array("token_mask")[i]:
+            return None
+        offsets = self._array("token_offsets")
+        return self._array("token_ids")[offsets[i]:offsets[i + 1]]
+
+    def tokens(self, post_id):
+        ids = self.token_ids(post_id)
+        if ids is None:
+            return None
+        vocab = self._string_column("token_vocab")
+        return [vocab[t] for t in ids]
+
+    def topic_weights(self, post_id):
+        i = self.index_of(post_id)
+        if not self._array("topic_mask")[i]:
+            return None
+        return self._array("topic_weights")[i]
+
+    def topic_weight_matrix(self):
+        """ (post ids, float32 matrix) for every post that has topic weights, in store order
+        """
+        mask = np.asarray(self._array("topic_mask"))
+        ids = self._string_column("post_id")
+        return [ids[i] for i in np.flatnonzero(mask)], self._array("topic_weights")[mask]
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import scipy as sp
+import scipy.sparse
+
+# shared python packages (instrumentation, ...) live in the parent data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from instrumentation import log
+
+# ------------------------------------------
+# Cache of intermediate results for generate.py
+# ------------------------------------------
+#
+# Every artifact (corpus, co-occurrence matrix, SVD output, ...) is stored under a key that hashes
+# its name together with everything it was computed from: the dataset's contents, the sample count,
+# the window size, k / n_iter, and the keys of the artifacts it was built from. Changing any of those
+# gives a new key, so a stale artifact is never picked up. A manifest records each artifact's files,
+# size and last use, and the least recently used artifacts are deleted once the cache goes over budget.
+
+def file_hash(fname, chunk_size=1 << 20):
+    """ sha256 of a file's contents (or, for a directory, of every file in it) """
+    h = hashlib.sha256()
+    fnames = [fname]
+    if os.path.isdir(fname):
+        fnames = sorted(os.path.join(root, f) for root, _, files in os.walk(fname) for f in files)
+    for name in fnames:
+        h.update(os.path.relpath(name, fname).encode("utf-8"))
+        with open(name, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def save_csr(prefix, M):
+    """ Save a sparse matrix as plain .npy arrays (unlike .npz these can be memory-mapped) """
+    M = M.tocsr()
+    np.save(prefix + "-data.npy", M.data)
+    np.save(prefix + "-indices.npy", M.indices)
+    np.save(prefix + "-indptr.npy", M.indptr)
+    np.save(prefix + "-shape.npy", np.array(M.shape, dtype=np.int64))
+
+def load_csr(prefix, mmap_mode="r"):
+    shape = tuple(np.load(prefix + "-shape.npy"))
+    data = np.load(prefix + "-data.npy", mmap_mode=mmap_mode)
+    indices = np.load(prefix + "-indices.npy", mmap_mode=mmap_mode)
+    indptr = np.load(prefix + "-indptr.npy", mmap_mode=mmap_mode)
+    return sp.sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+def csr_exists(prefix):
+    return all(os.path.exists(prefix + suffix) for suffix in ["-data.npy", "-indices.npy", "-indptr.npy", "-shape.npy"])
+
+class ArtifactStore:
+    """ Content-keyed cache directory with LRU eviction under a disk budget
+    """
+
+    def __init__(self, cache_dir, budget_bytes=None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.manifest_fname = os.path.join(cache_dir, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_fname):
+            with open(self.manifest_fname, "r") as f:
+                self.manifest = json.load(f)
+
+    def key(self, name, **params):
+        """ Key for artifact 'name' computed from params (values must be JSON serializable) """
+        payload = json.dumps({"name": name, "params": params}, sort_keys=True)
+        return name + "-" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def path(self, key):
+        """ Path prefix for the files of an artifact; callers append their own suffix """
+        return os.path.join(self.cache_dir, key)
+
+    def _files(self, key):
+        prefix = os.path.basename(self.path(key))
+        return [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.startswith(prefix)]
+
+    def record(self, key, **params):
+        """ Register (or refresh) an artifact after its files were written, then enforce the budget """
+        files = self._files(key)
+        self.manifest[key] = {
+            "files": [os.path.basename(f) for f in files],
+            "size": sum(os.path.getsize(f) for f in files),
+            "last_used": time.time(),
+            "params": params
+        }
+        self.evict(keep=key)
+
+    def touch(self, key):
+        """ Mark an artifact as just used (artifacts written before the manifest existed get registered) """
+        if key in self.manifest:
+            self.manifest[key]["last_used"] = time.time()
+            self._save_manifest()
+        else:
+            self.record(key)
+
+    def evict(self, keep=None):
+        """ Delete least recently used artifacts until the cache fits the budget. Never deletes 'keep'. """
+        if self.budget_bytes is not None:
+            total = sum(entry["size"] for entry in self.manifest.values())
+            for key in sorted(self.manifest, key=lambda k: self.manifest[k]["last_used"]):
+                if total <= self.budget_bytes:
+                    break
+                if key == keep:
+                    continue
+                log(1, "Evicting cached artifact", key)
+                for f in self.manifest[key]["files"]:
+                    fname = os.path.join(self.cache_dir, f)
+                    if os.path.exists(fname):
+                        os.remove(fname)
+                total -= self.manifest.pop(key)["size"]
+        self._save_manifest()
+
+    def _save_manifest(self):
+        tmp_fname = self.manifest_fname + ".tmp"
+        with open(tmp_fname, "w") as f:
+            json.dump(self.manifest, f, indent=4)
+        os.replace(tmp_fname, self.manifest_fname)
+
+    # ----- dense arrays -----
+
+    def load_array(self, key):
+        """ Memory-mapped array artifact, or None if it isn't cached """
+        fname = self.path(key) + ".npy"
+        if not os.path.exists(fname):
+            return None
+        log(1, "Loading cached", key)
+        self.touch(key)
+        return np.load(fname, mmap_mode="r")
+
+    def save_array(self, key, M, **params):
+        log(1, "Caching", key)
+        np.save(self.path(key) + ".npy", M)
+        self.record(key, **params)
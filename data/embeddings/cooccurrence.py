@@ -0,0 +1,207 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy as sp
+import scipy.sparse
+
+# shared python packages (instrumentation, ...) live in the parent data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from instrumentation import log
+
+# ------------------------------------------
+# Co-occurrence counting, in one process or sharded over worker processes
+# ------------------------------------------
+#
+# Sharded mode is a map-reduce over the posts:
+#   1. tokenize: each shard of shard_size posts is tokenized in a worker, which returns the shard's
+#      word counts and keeps its tokens as ids into the shard's own vocabulary.
+#   2. the shard vocabularies are merged into the shared, sorted vocabulary (same order as distinct_words).
+#   3. count: the parent maps each shard vocabulary onto the shared one (so only that id array, not the
+#      whole vocabulary, is sent to a worker) and the worker counts the windows into a sparse partial matrix.
+#   4. reduce: partials are summed pairwise, in parallel, until one matrix is left.
+# With spill_dir, tokens and partial matrices live on disk as .npz files between steps (and the
+# workers read their posts straight from a corpus_store), so only a couple of shards are ever in memory.
+# They go in a private temporary folder inside spill_dir, which is removed afterwards.
+
+START_TOKEN = '<START>'
+END_TOKEN = '<END>'
+NON_WORD = re.compile(r'[^\w]')
+
+def tokenize_post(title, body):
+    """ Tokens of one post: lowercased words with non-word characters removed, between start and end tags """
+    return [START_TOKEN] + [NON_WORD.sub('', w.lower()) for w in (title + " " + body).split(" ")] + [END_TOKEN]
+
+def count_windows(flat, lengths, n_words, window_size=4, distance_weighting=False):
+    """ Co-occurrence counts of the integer-encoded documents concatenated in flat (lengths: document lengths).
+
+        For every offset 1..window_size the flat array is compared against itself shifted by that offset;
+        pairs whose two positions fall in the same document are co-occurrences, counted in both directions.
+        With distance_weighting a pair offset words apart counts 1 / offset instead of 1.
+    """
+    doc_ids = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    rows = []
+    cols = []
+    weights = []
+    for offset in range(1, window_size + 1):
+        if offset >= len(flat):
+            break
+        # positions i and i + offset co-occur only if they come from the same document
+        same_doc = doc_ids[:-offset] == doc_ids[offset:]
+        left = flat[:-offset][same_doc]
+        right = flat[offset:][same_doc]
+        rows.append(left)
+        cols.append(right)
+        rows.append(right)
+        cols.append(left)
+        weights.append(np.full(2 * len(left), 1 / offset if distance_weighting else 1.0))
+
+    if rows:
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        data = np.concatenate(weights)
+    else:
+        rows = np.zeros(0, dtype=np.int64)
+        cols = np.zeros(0, dtype=np.int64)
+        data = np.zeros(0, dtype=np.float64)
+
+    # COO -> CSR sums duplicate (row, col) entries, which gives the counts
+    return sp.sparse.coo_matrix((data, (rows, cols)), shape=(n_words, n_words)).tocsr()
+
+# ----- map-reduce workers (module level so they can be pickled) -----
+
+def _shard_posts(shard, store_path):
+    """ (title, body) pairs of a shard: given directly, or a (start, end) range of a corpus_store """
+    if store_path is None:
+        return shard
+    from corpus_store import CorpusReader
+    reader = CorpusReader(store_path)
+    titles = reader.column("title")
+    bodies = reader.column("body")
+    start, end = shard
+    return [(titles[i], bodies[i]) for i in range(start, end)]
+
+def _tokenize_shard(shard_index, shard, store_path, spill_dir):
+    """ Tokenize one shard. Returns (its word counts, its tokens) with the tokens as (ids into the shard
+        vocabulary, document lengths), or as the path of an .npz holding them when spilling. The shard
+        vocabulary is the keys of the word counts, in id order.
+    """
+    local_ids = {}
+    ids = []
+    lengths = []
+    for title, body in _shard_posts(shard, store_path):
+        doc = tokenize_post(title, body)
+        ids.extend(local_ids.setdefault(w, len(local_ids)) for w in doc)
+        lengths.append(len(doc))
+    vocab = list(local_ids)
+    ids = np.array(ids, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.int64)
+    counts = dict(zip(vocab, np.bincount(ids, minlength=len(vocab)).tolist()))
+
+    if spill_dir is None:
+        return counts, (ids, lengths)
+    path = os.path.join(spill_dir, f"tokens-{shard_index}.npz")
+    np.savez(path, ids=ids, lengths=lengths)
+    return counts, path
+
+def _load_tokens(tokens):
+    if isinstance(tokens, str):
+        with np.load(tokens) as saved:
+            return saved["ids"], saved["lengths"]
+    return tokens
+
+def _count_shard(shard_index, tokens, to_global, n_words, window_size, distance_weighting, spill_dir):
+    """ Count one shard's windows. to_global maps the shard vocabulary's ids to the shared vocabulary's """
+    ids, lengths = _load_tokens(tokens)
+    M = count_windows(to_global[ids], lengths, n_words, window_size, distance_weighting)
+    if spill_dir is None:
+        return M
+    path = os.path.join(spill_dir, f"partial-0-{shard_index}.npz")
+    sp.sparse.save_npz(path, M, compressed=False)
+    return path
+
+def _load_partial(partial):
+    return sp.sparse.load_npz(partial).tocsr() if isinstance(partial, str) else partial
+
+def _sum_partials(level, index, a, b, spill_dir):
+    M = _load_partial(a) + _load_partial(b)
+    if spill_dir is None:
+        return M
+    path = os.path.join(spill_dir, f"partial-{level}-{index}.npz")
+    sp.sparse.save_npz(path, M, compressed=False)
+    for partial in (a, b):
+        os.remove(partial)
+    return path
+
+def _map_reduce(shards, store_path, window_size, distance_weighting, n_workers, spill_dir):
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        n = len(shards)
+        tokenized = list(executor.map(_tokenize_shard, range(n), shards, [store_path] * n, [spill_dir] * n))
+
+        counts = {}
+        for shard_counts, _ in tokenized:
+            for w, c in shard_counts.items():
+                counts[w] = counts.get(w, 0) + c
+        words = sorted(counts)
+        word2ind = {words[i]: i for i in range(len(words))}
+
+        to_global = [np.array([word2ind[w] for w in shard_counts], dtype=np.int64) for shard_counts, _ in tokenized]
+        partials = list(executor.map(_count_shard, range(n), [tokens for _, tokens in tokenized], to_global,
+                                     [len(words)] * n, [window_size] * n, [distance_weighting] * n, [spill_dir] * n))
+        del tokenized
+
+        # tree reduction: sum neighbouring pairs of partials in parallel until one is left
+        level = 1
+        while len(partials) > 1:
+            pairs = len(partials) // 2
+            summed = list(executor.map(_sum_partials, [level] * pairs, range(pairs), partials[0:2 * pairs:2],
+                                       partials[1:2 * pairs:2], [spill_dir] * pairs))
+            partials = summed + partials[2 * pairs:]
+            level += 1
+
+    if not partials:
+        M = sp.sparse.csr_matrix((len(words), len(words)))
+    else:
+        M = _load_partial(partials[0])
+    return M, word2ind, counts
+
+def compute_sharded_co_occurrence_matrix(posts=None, store_path=None, n_samples=None, window_size=4, shard_size=256,
+                                         n_workers=None, spill_dir=None, distance_weighting=False):
+    """ Same counts and word2ind as generate.compute_sparse_co_occurrence_matrix, computed as a map-reduce
+        over shards of shard_size posts in n_workers processes.
+        Params:
+            posts (list of (title, body) pairs): the posts, or None to read them from store_path
+            store_path (string): corpus_store directory the workers read their shards from
+            n_samples (int): with store_path, only the first n_samples posts
+            spill_dir (string): keep tokens and partial matrices in a temporary folder in here (as .npz)
+                instead of in memory
+        Return:
+            (M, word2ind, counts): the csr co-occurrence matrix, its vocabulary and each word's corpus frequency
+    """
+    if posts is not None:
+        n_posts = len(posts)
+        shards = [posts[start:start + shard_size] for start in range(0, n_posts, shard_size)]
+        store_path = None
+    else:
+        from corpus_store import CorpusReader
+        n_posts = len(CorpusReader(store_path))
+        if n_samples is not None:
+            n_posts = min(n_posts, n_samples)
+        shards = [(start, min(start + shard_size, n_posts)) for start in range(0, n_posts, shard_size)]
+    if spill_dir is not None:
+        os.makedirs(spill_dir, exist_ok=True)
+        # a private folder, so the cleanup below never touches anything else in spill_dir
+        spill_dir = tempfile.mkdtemp(prefix="cooccurrence-", dir=spill_dir)
+    log(1, "Counting co-occurrences of %i posts in %i shards" % (n_posts, len(shards)))
+
+    try:
+        M, word2ind, counts = _map_reduce(shards, store_path, window_size, distance_weighting, n_workers, spill_dir)
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+    return M, word2ind, counts
+
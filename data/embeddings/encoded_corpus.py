@@ -0,0 +1,117 @@
+import json
+import os
+from array import array
+
+import numpy as np
+
+from cooccurrence import tokenize_post
+
+# ------------------------------------------
+# Integer-encoded corpus
+# ------------------------------------------
+#
+# Posts are tokenized one at a time and each document is stored as int32 word ids, all of them in
+# one flat array plus offsets (document i is tokens[offsets[i]:offsets[i + 1]]). The vocabulary grows
+# while reading and counts every word, and is sorted once at the end so ids follow the same order as
+# distinct_words. Saved as
+#   <prefix>-tokens.npy   int32 word ids
+#   <prefix>-offsets.npy  int64 document boundaries (n_docs + 1)
+#   <prefix>-vocab.json   {"words": [...], "counts": [...]}
+# and loaded memory-mapped, so later stages never tokenize or hash a string again.
+
+class Vocabulary:
+    """ Word ids in first-seen order, with the number of times each word was seen """
+
+    def __init__(self):
+        self.word2id = {}
+        self.counts = array('q')
+
+    def __len__(self):
+        return len(self.word2id)
+
+    def encode(self, tokens):
+        ids = array('I')
+        for w in tokens:
+            i = self.word2id.get(w)
+            if i is None:
+                i = len(self.word2id)
+                self.word2id[w] = i
+                self.counts.append(0)
+            self.counts[i] += 1
+            ids.append(i)
+        return ids
+
+    def words(self):
+        words = [None] * len(self.word2id)
+        for w, i in self.word2id.items():
+            words[i] = w
+        return words
+
+def encode_posts(posts, vocab):
+    """ Yield each (title, body) post as an array('I') of ids, growing vocab as new words show up """
+    for title, body in posts:
+        yield vocab.encode(tokenize_post(title, body))
+
+class EncodedCorpus:
+
+    def __init__(self, tokens, offsets, words, counts):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.words = words
+        self.counts = counts
+
+    @classmethod
+    def build(cls, posts):
+        """ Encode an iterable of (title, body) posts, holding only the flat id array in memory """
+        vocab = Vocabulary()
+        flat = array('I')
+        offsets = array('q', [0])
+        for doc in encode_posts(posts, vocab):
+            flat.extend(doc)
+            offsets.append(len(flat))
+
+        # renumber the words in sorted order
+        words = vocab.words()
+        order = sorted(range(len(words)), key=words.__getitem__)
+        rank = np.empty(len(words), dtype=np.int32)
+        rank[order] = np.arange(len(words), dtype=np.int32)
+        tokens = rank[np.frombuffer(flat, dtype=np.uint32)] if len(flat) else np.zeros(0, dtype=np.int32)
+        counts = np.frombuffer(vocab.counts, dtype=np.int64)[order] if len(words) else np.zeros(0, dtype=np.int64)
+        return cls(tokens, np.frombuffer(offsets, dtype=np.int64).copy(), [words[i] for i in order], counts)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def doc(self, i):
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.doc(i)
+
+    def word2ind(self):
+        return {w: i for i, w in enumerate(self.words)}
+
+    def word_counts(self):
+        return dict(zip(self.words, self.counts.tolist()))
+
+    def save(self, prefix):
+        np.save(prefix + "-tokens.npy", self.tokens)
+        np.save(prefix + "-offsets.npy", self.offsets)
+        with open(prefix + "-vocab.json", "w") as f:
+            json.dump({"words": self.words, "counts": self.counts.tolist()}, f)
+
+    @classmethod
+    def load(cls, prefix, mmap_mode="r"):
+        with open(prefix + "-vocab.json", "r") as f:
+            vocab = json.load(f)
+        return cls(np.load(prefix + "-tokens.npy", mmap_mode=mmap_mode), np.load(prefix + "-offsets.npy", mmap_mode=mmap_mode),
+                   vocab["words"], np.array(vocab["counts"], dtype=np.int64))
+
+    @staticmethod
+    def exists(prefix):
+        return all(os.path.exists(prefix + suffix) for suffix in ["-tokens.npy", "-offsets.npy", "-vocab.json"])
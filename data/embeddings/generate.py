@@ -2,8 +2,6 @@ import sys
 assert sys.version_info[0] == 3
 assert sys.version_info[1] >= 8
 
-from gensim.models import KeyedVectors
-from gensim.test.utils import datapath
 import pprint
 import matplotlib.pyplot as plt
 plt.rcParams['figure.figsize'] = [10, 5]
@@ -11,28 +9,36 @@ plt.rcParams['figure.figsize'] = [10, 5]
 import json
 import os 
 dir_path = os.path.dirname(os.path.realpath(__file__))
-love_letters_dataset = []
-with open(dir_path + "/../../app/public/data/consolidated_posts.json", "r") as f:
-    love_letters_dataset = json.load(f)
+love_letters_fname = dir_path + "/../../app/public/data/consolidated_posts.json"
+sys.path.append(dir_path + "/..")
 
-import re
 import numpy as np
 import random
 import scipy as sp
+import scipy.sparse
 from sklearn.decomposition import TruncatedSVD
 from sklearn.decomposition import PCA
+from threadpoolctl import threadpool_limits
 
 import argparse
 parser = argparse.ArgumentParser()
 
-START_TOKEN = '<START>'
-END_TOKEN = '<END>'
+from artifacts import ArtifactStore, file_hash, save_csr, load_csr, csr_exists
+from tiles import DTYPES, export_embeddings
+from weighting import WEIGHTINGS, prune_vocabulary, reweight
+from cooccurrence import START_TOKEN, END_TOKEN, tokenize_post, count_windows, compute_sharded_co_occurrence_matrix
+from encoded_corpus import EncodedCorpus
+from instrumentation import configure, log, timed
+
 NUM_SAMPLES = 150
 FULL_CORPUS_SIZE = 843
 
 default_corpus_fname = dir_path + "/samples-love_letters_corpus.json"
+default_encoded_corpus_prefix = dir_path + "/samples-love_letters_corpus"
 default_dict_fname = dir_path + "/samples-word2ind.json"
 default_matrix_fname = dir_path + "/samples-co-occurrence_matrix.npy" 
+default_sparse_matrix_fname = dir_path + "/samples-co-occurrence_matrix"
+default_cache_dir = dir_path + "/cache"
 
 np.random.seed(0)
 random.seed(0)
@@ -41,30 +47,82 @@ random.seed(0)
 # Data Handling 
 # ------------------------------------------
 
-def read_corpus(n_samples=NUM_SAMPLES, corpus_fname = default_corpus_fname):
+def iter_titles_and_bodies(n_samples, store_path=None, posts_fname=love_letters_fname):
+    """ Yield (title, body) pairs of the first n_samples posts, read from a corpus_store directory if one
+        is given (only the title and body columns are touched), otherwise from posts_fname: consolidated_posts.json,
+        or a line-delimited .jsonl file with one {"title": ..., "body": ...} post per line, read one line at a time
+    """
+    if store_path is not None:
+        from corpus_store import CorpusReader
+        reader = CorpusReader(store_path)
+        titles = reader.column("title")
+        bodies = reader.column("body")
+        for i in range(min(n_samples, len(reader))):
+            yield titles[i], bodies[i]
+    elif posts_fname.endswith(".jsonl"):
+        with open(posts_fname, "r") as f:
+            for i, line in enumerate(f):
+                if i >= n_samples:
+                    break
+                post = json.loads(line)
+                yield post['title'], post['body']
+    else:
+        with open(posts_fname, "r") as f:
+            love_letters_dataset = json.load(f)
+        for post in list(love_letters_dataset['post'].values())[:n_samples]:
+            yield post['title'], post['body']
+
+def load_titles_and_bodies(n_samples, store_path=None, posts_fname=love_letters_fname):
+    """ Return (title, body) pairs of the first n_samples posts (see iter_titles_and_bodies) """
+    return list(iter_titles_and_bodies(n_samples, store_path, posts_fname))
+
+@timed("embeddings.read_corpus")
+def read_corpus(n_samples=NUM_SAMPLES, corpus_fname = default_corpus_fname, store_path=None, posts_fname=love_letters_fname):
     """ Read files from Love Letters dataset
+        Params:
+            store_path (string): optional corpus_store directory to read posts from instead of the JSON dataset
+            posts_fname (string): posts file to read when there is no store (see iter_titles_and_bodies)
         Return:
             list of lists, with words from each of the processed files
     """
     
     if os.path.exists(corpus_fname):
-        print("Loading corpus from", corpus_fname)
+        log(1, "Loading corpus from", corpus_fname)
         with open(corpus_fname, "r") as f:
             corpus = json.load(f)
     else:
-        print("reading corpus")
-        # get a list of the first NUM_SAMPLES objects in the love letters dataset
-        files = list(love_letters_dataset['post'].values())[:n_samples]
-        # extract the title and the body from our list of objects.
+        log(1, "reading corpus")
+        # get the title and the body of the first NUM_SAMPLES objects in the love letters dataset
+        files = load_titles_and_bodies(n_samples, store_path, posts_fname)
         # Then perform data cleaning: add start and end tags, convert words to lowercase
-        corpus = [[START_TOKEN] + [re.sub(r'[^\w]', '', w.lower()) for w in (f['title'] + " " + f['body']).split(" ")] + [END_TOKEN] for f in files]
+        corpus = [tokenize_post(title, body) for title, body in files]
 
         with open(corpus_fname, "w") as f:
-            print("Saving corpus to", corpus_fname)
+            log(1, "Saving corpus to", corpus_fname)
             json.dump(corpus, f)
         
     return corpus
 
+@timed("embeddings.read_encoded_corpus")
+def read_encoded_corpus(n_samples=NUM_SAMPLES, prefix=default_encoded_corpus_prefix, store_path=None, posts_fname=love_letters_fname):
+    """ Integer-encoded version of read_corpus (see encoded_corpus.py): tokens as one flat int32 array plus
+        document offsets, with the vocabulary in distinct_words order and each word's corpus frequency.
+        Posts are streamed and tokenized one at a time; a saved corpus is memory-mapped.
+        Params:
+            prefix (string): path prefix of the saved corpus (<prefix>-tokens.npy, -offsets.npy, -vocab.json)
+        Return:
+            EncodedCorpus
+    """
+    if EncodedCorpus.exists(prefix):
+        log(1, "Loading encoded corpus from", prefix)
+        return EncodedCorpus.load(prefix)
+
+    log(1, "encoding corpus")
+    encoded = EncodedCorpus.build(iter_titles_and_bodies(n_samples, store_path, posts_fname))
+    log(1, "Saving encoded corpus of %i documents, %i tokens to %s" % (len(encoded), len(encoded.tokens), prefix))
+    encoded.save(prefix)
+    return encoded
+
 def distinct_words(corpus):
     """ Determine a list of distinct words for the corpus.
         Params:
@@ -91,6 +149,7 @@ def distinct_words(corpus):
 # Produce co-occurence embeddings
 # -------------------------------
 
+@timed("embeddings.compute_co_occurrence_matrix")
 def compute_co_occurrence_matrix(corpus, window_size=4, dict_fname=default_dict_fname, matrix_fname=default_matrix_fname):
     """ Compute co-occurrence matrix for the given corpus and window_size (default of 4).
     
@@ -110,14 +169,14 @@ def compute_co_occurrence_matrix(corpus, window_size=4, dict_fname=default_dict_
             word2ind (dict): dictionary that maps word to index (i.e. row/column number) for matrix M.
     """
     if os.path.exists(dict_fname) and os.path.exists(matrix_fname):
-        print("Loading word2ind dict from", dict_fname)
+        log(1, "Loading word2ind dict from", dict_fname)
         with open(dict_fname, "r") as f:
             word2ind = json.load(f)        
 
-        print("Loading co-occurrence matrix from", matrix_fname)
+        log(1, "Loading co-occurrence matrix from", matrix_fname)
         M = np.load(matrix_fname)
     else:
-        print("computing co-occurence matrix")
+        log(1, "computing co-occurence matrix")
 
         words, n_words = distinct_words(corpus)
         M = None
@@ -145,35 +204,136 @@ def compute_co_occurrence_matrix(corpus, window_size=4, dict_fname=default_dict_
                     M[word2ind[review[word_idx]], word2ind[window_word]] += 1
 
         with open(dict_fname, "w") as f:
-            print("Saving word2ind dict to", dict_fname)
+            log(1, "Saving word2ind dict to", dict_fname)
             json.dump(word2ind, f)
-        print("Saving co-occurrence matrix to", matrix_fname)
+        log(1, "Saving co-occurrence matrix to", matrix_fname)
         np.save(matrix_fname, M)
     return M, word2ind
 
-def reduce_to_k_dim(M, k=2):
+@timed("embeddings.compute_sparse_co_occurrence_matrix")
+def compute_sparse_co_occurrence_matrix(corpus, window_size=4, dict_fname=default_dict_fname, matrix_fname=default_sparse_matrix_fname,
+                                        distance_weighting=False):
+    """ Compute the same co-occurrence counts as compute_co_occurrence_matrix, but as a scipy.sparse CSR matrix.
+
+        Instead of visiting every (center, context) pair in Python, each document is integer-encoded once and
+        concatenated into one flat array. For every offset 1..window_size the flat array is compared against
+        itself shifted by that offset; pairs whose two positions fall in the same document are co-occurrences.
+        Each such pair is counted in both directions, which is exactly what the left and right halves of the
+        window do in the loop version.
+
+        Params:
+            corpus (list of list of strings): corpus of documents
+            window_size (int): size of context window
+            matrix_fname (string): path prefix the matrix is cached under (see artifacts.save_csr); loads are memory-mapped
+            distance_weighting (bool): count a pair offset words apart as 1 / offset instead of 1
+        Return:
+            M (scipy.sparse.csr_matrix of shape (number of unique words in the corpus, number of unique words in the corpus)):
+                Co-occurence matrix of word counts, rows/columns ordered like distinct_words.
+            word2ind (dict): dictionary that maps word to index (i.e. row/column number) for matrix M.
+    """
+    if os.path.exists(dict_fname) and csr_exists(matrix_fname):
+        log(1, "Loading word2ind dict from", dict_fname)
+        with open(dict_fname, "r") as f:
+            word2ind = json.load(f)
+
+        log(1, "Loading sparse co-occurrence matrix from", matrix_fname)
+        M = load_csr(matrix_fname)
+    else:
+        log(1, "computing sparse co-occurence matrix")
+
+        words, n_words = distinct_words(corpus)
+        word2ind = {words[i]:i for i in range(n_words)}
+
+        # integer-encode every document once, then count all windows at once (see cooccurrence.count_windows)
+        lengths = np.array([len(review) for review in corpus], dtype=np.int64)
+        flat = np.fromiter((word2ind[w] for review in corpus for w in review), dtype=np.int64, count=int(lengths.sum()))
+        M = count_windows(flat, lengths, n_words, window_size, distance_weighting)
+
+        with open(dict_fname, "w") as f:
+            log(1, "Saving word2ind dict to", dict_fname)
+            json.dump(word2ind, f)
+        log(1, "Saving sparse co-occurrence matrix to", matrix_fname)
+        save_csr(matrix_fname, M)
+    return M, word2ind
+
+@timed("embeddings.compute_encoded_co_occurrence_matrix")
+def compute_encoded_co_occurrence_matrix(encoded, window_size=4, dict_fname=default_dict_fname, matrix_fname=default_sparse_matrix_fname,
+                                         distance_weighting=False):
+    """ compute_sparse_co_occurrence_matrix for an EncodedCorpus (see read_encoded_corpus), cached the same way.
+        The documents are already integer-encoded and concatenated, so the windows are counted straight off
+        the flat token array without touching a string.
+    """
+    if os.path.exists(dict_fname) and csr_exists(matrix_fname):
+        log(1, "Loading word2ind dict from", dict_fname)
+        with open(dict_fname, "r") as f:
+            word2ind = json.load(f)
+        log(1, "Loading sparse co-occurrence matrix from", matrix_fname)
+        return load_csr(matrix_fname), word2ind
+
+    log(1, "computing sparse co-occurence matrix")
+    word2ind = encoded.word2ind()
+    M = count_windows(encoded.tokens, encoded.lengths, len(word2ind), window_size, distance_weighting)
+    with open(dict_fname, "w") as f:
+        log(1, "Saving word2ind dict to", dict_fname)
+        json.dump(word2ind, f)
+    log(1, "Saving sparse co-occurrence matrix to", matrix_fname)
+    save_csr(matrix_fname, M)
+    return M, word2ind
+
+@timed("embeddings.compute_sharded_co_occurrence_matrix")
+def compute_sharded_co_occurrence_matrix_cached(n_samples, store_path=None, window_size=4, dict_fname=default_dict_fname,
+                                                matrix_fname=default_sparse_matrix_fname, shard_size=256, n_workers=None,
+                                                spill_dir=None, distance_weighting=False, posts_fname=love_letters_fname):
+    """ compute_sparse_co_occurrence_matrix as a map-reduce over worker processes (see cooccurrence.py), cached the same way.
+        The whole tokenized corpus is never held in memory; with a corpus_store the workers read their own posts.
+        Return:
+            (M, word2ind, counts): counts are the corpus word frequencies, or None when M was loaded from the cache
+    """
+    if os.path.exists(dict_fname) and csr_exists(matrix_fname):
+        log(1, "Loading word2ind dict from", dict_fname)
+        with open(dict_fname, "r") as f:
+            word2ind = json.load(f)
+        log(1, "Loading sparse co-occurrence matrix from", matrix_fname)
+        return load_csr(matrix_fname), word2ind, None
+
+    posts = None if store_path is not None else load_titles_and_bodies(n_samples, posts_fname=posts_fname)
+    M, word2ind, counts = compute_sharded_co_occurrence_matrix(posts, store_path, n_samples, window_size, shard_size,
+                                                               n_workers, spill_dir, distance_weighting)
+    with open(dict_fname, "w") as f:
+        log(1, "Saving word2ind dict to", dict_fname)
+        json.dump(word2ind, f)
+    log(1, "Saving sparse co-occurrence matrix to", matrix_fname)
+    save_csr(matrix_fname, M)
+    return M, word2ind, counts
+
+@timed("embeddings.reduce_to_k_dim")
+def reduce_to_k_dim(M, k=2, n_iters=10, n_oversamples=10, n_threads=None, random_state=None):
     """ Reduce a co-occurence count matrix of dimensionality (num_corpus_words, num_corpus_words)
         to a matrix of dimensionality (num_corpus_words, k) using the following SVD function from Scikit-Learn:
             - http://scikit-learn.org/stable/modules/generated/sklearn.decomposition.TruncatedSVD.html
     
         Params:
-            M (numpy matrix of shape (number of unique words in the corpus , number of unique words in the corpus)): co-occurence matrix of word counts
+            M (numpy matrix or scipy.sparse matrix of shape (number of unique words in the corpus , number of unique words in the corpus)): co-occurence matrix of word counts
             k (int): embedding size of each word after dimension reduction
+            n_iters (int): number of randomized SVD (power) iterations
+            n_oversamples (int): extra random directions sampled beyond k; more gives a more accurate SVD for small k
+            n_threads (int): BLAS threads used by the SVD (default: all)
+            random_state (int): seed for the random projection
         Return:
             M_reduced (numpy matrix of shape (number of corpus words, k)): matrix of k-dimensioal word embeddings.
                     In terms of the SVD from math class, this actually returns U * S
     """    
-    print("performing dimensionality reduction")
-    n_iters = 10    # Use this parameter in your call to `TruncatedSVD`
+    log(1, "performing dimensionality reduction")
     M_reduced = None
-    print("Running Truncated SVD over %i words..." % (M.shape[0]))
+    log(1, "Running Truncated SVD over %i words..." % (M.shape[0]))
     
    # create scikitlearn Truncated SVD object to reduce M to k dimensions
-    svd = TruncatedSVD(n_components=k, n_iter=n_iters)
+    svd = TruncatedSVD(n_components=k, n_iter=n_iters, n_oversamples=n_oversamples, random_state=random_state)
     # perform dimensionality reduction using SVD
-    M_reduced = svd.fit_transform(M)
+    with threadpool_limits(limits=n_threads):
+        M_reduced = svd.fit_transform(M)
 
-    print("Done.")
+    log(1, "Done.")
     return M_reduced
 
 
@@ -186,10 +346,11 @@ def load_embedding_model():
         Return:
             wv_from_bin: All 400000 embeddings, each length 200
     """
-    print("load GloVe model")
+    log(1, "load GloVe model")
+    # gensim is only needed for the GloVe download, so the co-occurrence embeddings work without it
     import gensim.downloader as api
     wv_from_bin = api.load("glove-wiki-gigaword-200")
-    print("Loaded vocab size %i" % len(list(wv_from_bin.index_to_key)))
+    log(1, "Loaded vocab size %i" % len(list(wv_from_bin.index_to_key)))
     return wv_from_bin
 
 def get_matrix_of_vectors(wv_from_bin, required_words):
@@ -202,10 +363,10 @@ def get_matrix_of_vectors(wv_from_bin, required_words):
     """
     import random
     words = list(wv_from_bin.index_to_key)
-    print("Shuffling words ...")
+    log(1, "Shuffling words ...")
     random.seed(225)
     random.shuffle(words)
-    print("Putting %i words into word2ind and matrix M..." % len(words))
+    log(1, "Putting %i words into word2ind and matrix M..." % len(words))
     word2ind = {}
     M = []
     curInd = 0
@@ -226,7 +387,78 @@ def get_matrix_of_vectors(wv_from_bin, required_words):
         except KeyError:
             continue
     M = np.stack(M)
-    print("Done.")
+    log(1, "Done.")
+    return M, word2ind
+
+def ingest_glove_subset(glove_fname, vocab, subset_prefix):
+    """ Extract the vectors of the words in vocab from a local GloVe file and save them for fast reloading.
+        The file is streamed line by line, so the 400000 vectors are never all in memory; only the rows
+        that are kept get parsed.
+
+        Params:
+            glove_fname (string): GloVe text file ("word v1 v2 ..." per line). word2vec text files
+                (the same, after a "<count> <dim>" header line) work too.
+            vocab (iterable of strings): words to keep
+            subset_prefix (string): path prefix for the output, <prefix>.npy (float32 matrix) and <prefix>-word2ind.json
+        Return:
+            M: numpy float32 matrix shape (num words found, dim)
+            word2ind: dictionary mapping each word to its row number in M
+    """
+    vocab = set(vocab)
+    log(1, "Extracting %i words from %s ..." % (len(vocab), glove_fname))
+    word2ind = {}
+    M = []
+    with open(glove_fname, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            word, _, rest = line.rstrip().partition(" ")
+            # word2vec text format starts with a "<count> <dim>" header
+            if line_no == 0 and word.isdigit() and rest.isdigit():
+                continue
+            if word in vocab and word not in word2ind:
+                word2ind[word] = len(M)
+                M.append(np.array(rest.split(" "), dtype=np.float32))
+    M = np.stack(M) if M else np.zeros((0, 0), dtype=np.float32)
+
+    log(1, "Saving %i GloVe vectors to %s.npy" % (len(word2ind), subset_prefix))
+    np.save(subset_prefix + ".npy", M)
+    with open(subset_prefix + "-word2ind.json", "w") as f:
+        json.dump(word2ind, f)
+    return M, word2ind
+
+def load_glove_subset(subset_prefix):
+    """ Load a subset written by ingest_glove_subset. The matrix is memory-mapped, not read into RAM. """
+    log(1, "Loading GloVe subset from", subset_prefix)
+    with open(subset_prefix + "-word2ind.json", "r") as f:
+        word2ind = json.load(f)
+    return np.load(subset_prefix + ".npy", mmap_mode="r"), word2ind
+
+def get_glove_embeddings(glove_fname, required_words=[], n_samples=NUM_SAMPLES, store_path=None, artifacts=None,
+                         posts_fname=love_letters_fname):
+    """ GloVe vectors for every word of the love letters corpus plus required_words, read from a local
+        GloVe file once and cached as a float32 matrix. Later calls only memory-map the cached subset.
+
+        Return:
+            M: numpy float32 matrix shape (num words, dim)
+            word2ind: dictionary mapping each word to its row number in M
+    """
+    if artifacts is None:
+        artifacts = ArtifactStore(default_cache_dir)
+
+    # the GloVe file is large and doesn't change, so it's keyed on path/size/mtime rather than hashed
+    stat = os.stat(glove_fname)
+    glove_id = [os.path.abspath(glove_fname), stat.st_size, stat.st_mtime_ns]
+    corpus_key = corpus_key_for(artifacts, n_samples, store_path, posts_fname)
+    subset_key = artifacts.key("glove_subset", glove=glove_id, corpus=corpus_key, required_words=sorted(required_words))
+    subset_prefix = artifacts.path(subset_key)
+
+    if os.path.exists(subset_prefix + ".npy") and os.path.exists(subset_prefix + "-word2ind.json"):
+        artifacts.touch(subset_key)
+        return load_glove_subset(subset_prefix)
+
+    encoded = read_encoded_corpus(n_samples, artifacts.path(corpus_key), store_path, posts_fname)
+    artifacts.record(corpus_key, n_samples=n_samples)
+    M, word2ind = ingest_glove_subset(glove_fname, list(encoded.words) + list(required_words), subset_prefix)
+    artifacts.record(subset_key, glove=glove_id)
     return M, word2ind
 
 # -------------------
@@ -252,39 +484,112 @@ def plot_embeddings(M_reduced, word2ind, words):
         plt.text(x, y, word, fontsize=9)
     plt.show()
 
-def get_co_embeddings(dim=2, n_samples=NUM_SAMPLES):
+def corpus_key_for(artifacts, n_samples, store_path=None, posts_fname=love_letters_fname):
+    """ Artifact key of the tokenized corpus: the dataset's contents plus the number of samples """
+    dataset = file_hash(store_path if store_path is not None else posts_fname)
+    return artifacts.key("corpus", dataset=dataset, n_samples=n_samples)
+
+def get_co_embeddings(dim=2, n_samples=NUM_SAMPLES, dtype=np.float64, window_size=4, n_iters=10, store_path=None, artifacts=None,
+                      weighting="counts", alpha=0.75, distance_weighting=False, min_count=1, n_oversamples=10, n_threads=None,
+                      n_workers=None, shard_size=256, spill_dir=None, posts_fname=love_letters_fname):
     """ Produce a co-occurrence matrix from the love letters dataset
         
         Params:
             dim (integer): the desired dimsnionality of the word vectors. Default is 2, useful for visualization. For more robust analysis, 100 is recommended.
+            dtype: storage type of the returned matrix. np.float32 halves its memory.
+            window_size (integer): co-occurrence window size
+            n_iters (integer): SVD iterations
+            store_path (string): optional corpus_store directory to read posts from
+            posts_fname (string): posts file to read otherwise (consolidated_posts.json, output.json or .jsonl)
+            artifacts (ArtifactStore): cache for the corpus, co-occurrence matrix and SVD output. Every cached
+                file is keyed on the dataset contents and all parameters that went into it.
+            weighting (string): "counts" (raw), "log" (log(1 + count)) or "ppmi" (see weighting.py)
+            alpha (float): PPMI context distribution smoothing exponent
+            distance_weighting (bool): weight co-occurrences by 1 / distance within the window
+            min_count (int): leave out words occurring fewer times than this in the corpus
+            n_oversamples, n_threads: passed on to reduce_to_k_dim
+            n_workers (integer): count co-occurrences in this many worker processes, shard_size posts at a time
+                (default: in this process). spill_dir keeps the shards' partial matrices on disk.
 
         Returns:
             M (n_words x dim matrix): Matrix of word vectors normalized to unit length
             word2ind (dict): dictionary mapping words to rows in the matrix.
 
     """
-    corpus_fname = dir_path + f"/{n_samples}_samples-love_letters_corpus.json"
-    dict_fname = dir_path + f"/{n_samples}_samples-word2ind.json"
-    matrix_fname = dir_path + f"/{n_samples}_samples-co-occurrence_matrix.npy" 
-
-    love_letters_corpus = read_corpus(n_samples, corpus_fname)
-    M_co_occurrence, word2ind_co_occurrence = compute_co_occurrence_matrix(love_letters_corpus, 
-                                                                           dict_fname=dict_fname, 
-                                                                           matrix_fname=matrix_fname)
-    M_reduced_co_occurrence = reduce_to_k_dim(M_co_occurrence, k=dim)
+    if artifacts is None:
+        artifacts = ArtifactStore(default_cache_dir)
+
+    corpus_key = corpus_key_for(artifacts, n_samples, store_path, posts_fname)
+    # distance weighting is left out of the key when off so existing cached matrices stay valid
+    co_occurrence_params = {"window_size": window_size}
+    if distance_weighting:
+        co_occurrence_params["distance_weighting"] = True
+    co_occurrence_key = artifacts.key("co_occurrence", corpus=corpus_key, **co_occurrence_params)
+    svd_params = {"k": dim, "n_iters": n_iters}
+    if (weighting, min_count, n_oversamples) != ("counts", 1, 10):
+        svd_params.update(weighting=weighting, alpha=alpha if weighting == "ppmi" else None,
+                          min_count=min_count, n_oversamples=n_oversamples)
+    svd_key = artifacts.key("svd", co_occurrence=co_occurrence_key, **svd_params)
+
+    co_occurrence_dict_fname = artifacts.path(co_occurrence_key) + "-word2ind.json"
+    # a pruned vocabulary belongs to the SVD output, not to the full co-occurrence matrix
+    dict_fname = artifacts.path(svd_key) + "-word2ind.json" if min_count > 1 else co_occurrence_dict_fname
+    M_reduced_co_occurrence = artifacts.load_array(svd_key) if os.path.exists(dict_fname) else None
+    if M_reduced_co_occurrence is not None:
+        with open(dict_fname, "r") as f:
+            word2ind_co_occurrence = json.load(f)
+        artifacts.touch(co_occurrence_key)
+    else:
+        counts = None
+        if n_workers is None:
+            love_letters_corpus = read_encoded_corpus(n_samples, artifacts.path(corpus_key), store_path, posts_fname)
+            artifacts.record(corpus_key, n_samples=n_samples)
+            M_co_occurrence, word2ind_co_occurrence = compute_encoded_co_occurrence_matrix(love_letters_corpus,
+                                                                                    window_size=window_size,
+                                                                                    dict_fname=co_occurrence_dict_fname,
+                                                                                    matrix_fname=artifacts.path(co_occurrence_key),
+                                                                                    distance_weighting=distance_weighting)
+            counts = love_letters_corpus.word_counts()
+        else:
+            M_co_occurrence, word2ind_co_occurrence, counts = compute_sharded_co_occurrence_matrix_cached(
+                n_samples, store_path, window_size, co_occurrence_dict_fname, artifacts.path(co_occurrence_key),
+                shard_size, n_workers, spill_dir, distance_weighting, posts_fname)
+        artifacts.record(co_occurrence_key, **co_occurrence_params)
+        if min_count > 1:
+            if counts is None:
+                counts = get_word_frequencies(n_samples, store_path, artifacts, posts_fname)
+            M_co_occurrence, word2ind_co_occurrence = prune_vocabulary(M_co_occurrence, word2ind_co_occurrence, counts, min_count)
+            log(1, "Kept %i words occurring at least %i times" % (len(word2ind_co_occurrence), min_count))
+        M_co_occurrence = reweight(M_co_occurrence, weighting, alpha)
+        M_reduced_co_occurrence = reduce_to_k_dim(M_co_occurrence, k=dim, n_iters=n_iters,
+                                                  n_oversamples=n_oversamples, n_threads=n_threads)
+        if min_count > 1:
+            with open(dict_fname, "w") as f:
+                json.dump(word2ind_co_occurrence, f)
+        artifacts.save_array(svd_key, M_reduced_co_occurrence, **svd_params)
 
     # Rescale (normalize) the rows to make them each of unit-length
     M_lengths = np.linalg.norm(M_reduced_co_occurrence, axis=1)
     M_normalized = M_reduced_co_occurrence / M_lengths[:, np.newaxis] # broadcasting
-    return M_normalized, word2ind_co_occurrence
+    return M_normalized.astype(dtype, copy=False), word2ind_co_occurrence
+
+def get_word_frequencies(n_samples=NUM_SAMPLES, store_path=None, artifacts=None, posts_fname=love_letters_fname):
+    """ Number of times each word occurs in the (cached) corpus """
+    if artifacts is None:
+        artifacts = ArtifactStore(default_cache_dir)
+    corpus_key = corpus_key_for(artifacts, n_samples, store_path, posts_fname)
+    encoded = read_encoded_corpus(n_samples, artifacts.path(corpus_key), store_path, posts_fname)
+    artifacts.record(corpus_key, n_samples=n_samples)
+    return encoded.word_counts()
 
 def save_toJSON(filename, word2ind, M):
+    """ {word: vector} written one word at a time (same output as json.dump of the whole dict) """
     with open(filename, "w") as f:
-            print("Saving embeddings to", filename)
-            embeddings = {}
-            for w in word2ind.keys():
-                embeddings[w] = M[word2ind[w]].tolist()
-            json.dump(embeddings, f)
+            log(1, "Saving embeddings to", filename)
+            f.write("{")
+            for i, w in enumerate(word2ind.keys()):
+                f.write((", " if i > 0 else "") + json.dumps(w) + ": " + json.dumps(M[word2ind[w]].tolist()))
+            f.write("}")
 
 # --------------------
 # Visualize embeddings
@@ -298,36 +603,73 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--filename", type=str)
     parser.add_argument("-d", "--dim", type=int, default=2)
     parser.add_argument("-n", "--num_samples", type=int, default=FULL_CORPUS_SIZE)
+    parser.add_argument("--store", type=str, help="read posts from a corpus_store directory instead of consolidated_posts.json")
+    parser.add_argument("--posts", type=str, default=love_letters_fname, help="posts file ({\"post\": {id: post}} JSON, or .jsonl)")
+    parser.add_argument("-w", "--window_size", type=int, default=4)
+    parser.add_argument("-g", "--glove_file", type=str, help="local GloVe (or word2vec text) file; only the corpus vocabulary is extracted and cached")
+    parser.add_argument("--cache_budget_mb", type=float, default=None, help="delete least recently used cached artifacts above this size")
+    parser.add_argument("--weighting", type=str, choices=WEIGHTINGS, default="counts", help="reweighting of the co-occurrence counts before the SVD")
+    parser.add_argument("--alpha", type=float, default=0.75, help="PPMI context distribution smoothing")
+    parser.add_argument("--distance_weighting", action="store_true", help="weight co-occurrences by 1 / distance within the window")
+    parser.add_argument("--min_count", type=int, default=1, help="leave out words occurring fewer times than this")
+    parser.add_argument("--n_iters", type=int, default=10, help="randomized SVD power iterations")
+    parser.add_argument("--n_oversamples", type=int, default=10, help="randomized SVD oversampling")
+    parser.add_argument("--n_threads", type=int, default=None, help="BLAS threads for the SVD")
+    parser.add_argument("--workers", type=int, default=None, help="count co-occurrences as a map-reduce over this many processes")
+    parser.add_argument("--shard_size", type=int, default=256, help="posts per map-reduce shard")
+    parser.add_argument("--spill_dir", type=str, help="keep map-reduce partial matrices on disk here instead of in memory")
+    parser.add_argument("-e", "--export_dir", type=str, help="write quantized vectors, a vocabulary/frequency index and zoom tiles here")
+    parser.add_argument("--export_dtype", type=str, choices=DTYPES, default="float16")
+    parser.add_argument("--tile_levels", type=int, default=5, help="number of zoom levels")
+    parser.add_argument("--words_per_tile", type=int, default=256, help="most frequent words kept per tile below the finest zoom level")
+    parser.add_argument("-v", "--verbosity", type=int, default=None, help="0: quiet, 1: progress (default), 2: detailed")
+    parser.add_argument("--metrics", type=str, default=None, help="append per-step timings and memory as JSON lines to this file")
     args = parser.parse_args()
+    configure(metrics_path=args.metrics, verbosity=args.verbosity)
+
+    budget = None if args.cache_budget_mb is None else int(args.cache_budget_mb * 1e6)
+    artifacts = ArtifactStore(default_cache_dir, budget)
 
     if(args.test):
         test_words = ['movie', 'book', 'love', 'story', 'hate', 'good', 'interesting', 'sorry', 'silly', 'bad']
-        print("Test generate embeddings")
-        print("Will plot the following words:", test_words)
+        log(1, "Test generate embeddings")
+        log(1, "Will plot the following words:", test_words)
 
     ### Generate embeddings from co-occurrence model ###
     if(args.model == "co-occurrence" or args.model == "both"):
-        love_letters_corpus = read_corpus(n_samples=args.num_samples)
-        M_co_occurrence, word2ind_co_occurrence = compute_co_occurrence_matrix(love_letters_corpus)
-        M_reduced_co_occurrence = reduce_to_k_dim(M_co_occurrence, k=args.dim)
-
-        # Rescale (normalize) the rows to make them each of unit-length
-        M_lengths = np.linalg.norm(M_reduced_co_occurrence, axis=1)
-        M_normalized = M_reduced_co_occurrence / M_lengths[:, np.newaxis] # broadcasting
+        M_normalized, word2ind_co_occurrence = get_co_embeddings(args.dim, args.num_samples, window_size=args.window_size,
+                                                                 store_path=args.store, artifacts=artifacts,
+                                                                 weighting=args.weighting, alpha=args.alpha,
+                                                                 distance_weighting=args.distance_weighting,
+                                                                 min_count=args.min_count, n_iters=args.n_iters,
+                                                                 n_oversamples=args.n_oversamples, n_threads=args.n_threads,
+                                                                 n_workers=args.workers, shard_size=args.shard_size,
+                                                                 spill_dir=args.spill_dir, posts_fname=args.posts)
 
         if args.saveJSON:
             save_toJSON(args.filename, word2ind_co_occurrence, M_normalized)
 
+        if args.export_dir:
+            freqs = get_word_frequencies(args.num_samples, args.store, artifacts, args.posts)
+            export_embeddings(args.export_dir, M_normalized, word2ind_co_occurrence, freqs, dtype=args.export_dtype,
+                              n_levels=args.tile_levels, words_per_tile=args.words_per_tile)
+
         if args.test:
             # plot co-occurence embeddings
-            print("Co-occurrence embeddings. Close to continue . . .")
+            log(1, "Co-occurrence embeddings. Close to continue . . .")
             plot_embeddings(M_normalized, word2ind_co_occurrence, test_words)
 
 
     if(args.model == "glove" or args.model == "both"):
         ### Generate GloVe Embeddings ###
-        wv_from_bin = load_embedding_model()
-        glove_M, glove_word2ind = get_matrix_of_vectors(wv_from_bin, test_words)
+        if not args.test:
+            test_words = []
+        if args.glove_file:
+            glove_M, glove_word2ind = get_glove_embeddings(args.glove_file, test_words, args.num_samples,
+                                                           store_path=args.store, artifacts=artifacts, posts_fname=args.posts)
+        else:
+            wv_from_bin = load_embedding_model()
+            glove_M, glove_word2ind = get_matrix_of_vectors(wv_from_bin, test_words)
         glove_M_reduced = reduce_to_k_dim(glove_M, k=2)
 
         # Rescale (normalize) the rows to make them each of unit-length
@@ -335,5 +677,5 @@ if __name__ == "__main__":
         glove_M_reduced_normalized = glove_M_reduced / glove_M_lengths[:, np.newaxis] # broadcasting
 
         # plot glove emeddings
-        print("GloVe embeddings. Close to continue . . .")
+        log(1, "GloVe embeddings. Close to continue . . .")
         plot_embeddings(glove_M_reduced_normalized, glove_word2ind, test_words)
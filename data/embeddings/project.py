@@ -2,6 +2,9 @@ import numpy as np
 from matplotlib import pyplot as plt
 
 import generate as gen
+from artifacts import ArtifactStore
+from instrumentation import log
+from similarity import WordIndex
 
 FULL_CORPUS_SIZE = 843
 
@@ -9,38 +12,106 @@ class ProjViz:
     """ Class for producing a projection map visualization for the love letters corpus
     """
 
-    def __init__(self, dim=2, n_samples=150):
+    def __init__(self, dim=2, n_samples=150, dtype=np.float64, artifacts=None):
         """ set a new ProjViz object with a particular dimensionality
+            dtype=np.float32 stores the embeddings in single precision, halving their memory
+            artifacts (ArtifactStore): cache for the embeddings and the LSH index (default: the cache/ folder)
         """
-        self.M, self.word2ind = gen.get_co_embeddings(dim, n_samples)
+        self.artifacts = ArtifactStore(gen.default_cache_dir) if artifacts is None else artifacts
+        self.M, self.word2ind = gen.get_co_embeddings(dim, n_samples, dtype=dtype, artifacts=self.artifacts)
+        self.index = WordIndex(self.M, self.word2ind)
+        # the LSH index is an artifact of the vectors it was built for
+        self.index_key = self.artifacts.key("lsh_index", vectors=self.index.fingerprint().tolist())
         self.axisLabels = None
         self.axis = None
+        self.axesLabels = None
+        self.axes = None
         self.projections = None
 
+    def word_rows(self, words, skip_unknown=False):
+        """ Look up the rows of 'words' in M all at once.
+            Unknown words are reported together: either one KeyError listing all of them,
+            or (skip_unknown=True) a warning, with those words left out.
+            Return: (array of row indices, list of the words that were found)
+        """
+        unknown = [w for w in words if w not in self.word2ind]
+        if unknown:
+            if not skip_unknown:
+                raise KeyError(f"{len(unknown)} words not in vocabulary: {unknown}")
+            log(1, f"Skipping {len(unknown)} words not in vocabulary: {unknown}")
+            words = [w for w in words if w in self.word2ind]
+        return np.array([self.word2ind[w] for w in words], dtype=np.int64), list(words)
+
     def set_axis(self, word1, word2):
         """ Calculate the vector which will act as the axis for our viz
         """
-        v1 = self.M[self.word2ind[word1]]
-        v2 = self.M[self.word2ind[word2]]
+        rows, _ = self.word_rows([word1, word2])
+        v1, v2 = self.M[rows]
         self.axisLabels = [word1, word2]
         self.axis = v1 - v2
 
         return self.axis
+
+    def set_axes(self, word_pairs):
+        """ Calculate several axes at once, one per (word1, word2) pair, for multi-axis plots
+            Return: (dim x number of pairs) matrix whose columns are the axes
+        """
+        rows, _ = self.word_rows([w for pair in word_pairs for w in pair])
+        vectors = self.M[rows]
+        self.axesLabels = [list(pair) for pair in word_pairs]
+        self.axes = (vectors[0::2] - vectors[1::2]).T
+
+        return self.axes
     
-    def project_words(self, words, save=True):
+    def project_words(self, words, save=True, skip_unknown=False):
         """ Project each word in 'arr' onto presetd axis. Must run set_axis before using this method.
+            The word vectors are gathered with one fancy index and projected with one matrix-vector product.
             Return: array of values produced by projecting word vectors onto axis
         """
         if self.axis is None:
             raise RuntimeError("Axis is unsetd. Make sure to call set_axis before calling project_words")
         
-        proj = np.array([np.dot(self.axis, self.M[self.word2ind[w]]) for w in words])
+        rows, words = self.word_rows(words, skip_unknown)
+        proj = self.M[rows] @ self.axis
         
         if save:
             self.projections = proj
             self.saved_words = words
         return proj
 
+    def project_words_multi(self, words, skip_unknown=False):
+        """ Project each word onto every axis set with set_axes.
+            Return: (number of words x number of axes) matrix of projections, and the words that were projected
+        """
+        if self.axes is None:
+            raise RuntimeError("Axes are unset. Make sure to call set_axes before calling project_words_multi")
+
+        rows, words = self.word_rows(words, skip_unknown)
+        return self.M[rows] @ self.axes, words
+
+    def most_similar(self, word, k=10, approximate=False):
+        """ Find the k words closest to 'word' (cosine similarity).
+            approximate=True answers from an LSH index, which is built once and cached with the embeddings.
+            Return: list of (word, similarity) pairs, closest first
+        """
+        return self.most_similar_batch([word], k, approximate)[0]
+
+    def most_similar_batch(self, words, k=10, approximate=False):
+        """ most_similar for several words at once. Return: one list of (word, similarity) pairs per word
+        """
+        if approximate and self.index.planes is None:
+            self.index.load_or_build_lsh(self.artifacts.path(self.index_key) + ".npz")
+            self.artifacts.touch(self.index_key)
+        return self.index.most_similar_batch(words, k, approximate)
+
+    def top_words_along_axis(self, k=10):
+        """ Find the k words projecting furthest towards each end of the axis. Must run set_axis before using this method.
+            Return: (words towards axisLabels[0], words towards axisLabels[1]), each a list of (word, projection) pairs
+        """
+        if self.axis is None:
+            raise RuntimeError("Axis is unsetd. Make sure to call set_axis before calling top_words_along_axis")
+        return self.index.top_along(self.axis, k)
+
     def plot_projections(self):
         words = self.saved_words
         projections = self.projections
@@ -62,4 +133,7 @@ if __name__ == "__main__":
     viz.project_words(["sorry", "snuggle", "angry", "alcohol", "abused", "abuser", "alone", "anxiety", "calm", "love", "confused", "certain"])
     viz.plot_projections()
 
-    #TODO: Function for finding top words?
\ No newline at end of file
+    towards_first, towards_second = viz.top_words_along_axis(k=20)
+    print(f"Top words towards '{viz.axisLabels[0]}':", [w for w, _ in towards_first])
+    print(f"Top words towards '{viz.axisLabels[1]}':", [w for w, _ in towards_second])
+    print("Most similar to 'love':", viz.most_similar("love", k=10))
\ No newline at end of file
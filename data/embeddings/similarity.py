@@ -0,0 +1,197 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+# shared python packages (instrumentation, ...) live in the parent data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from instrumentation import log
+
+# ------------------------------------------
+# Nearest neighbour queries over word vectors
+# ------------------------------------------
+
+def top_k(scores, k):
+    """ Indices of the k largest values in each row of scores, sorted by decreasing score.
+        Uses argpartition, so only the k winners get sorted, not the whole row.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+class WordIndex:
+    """ Similarity queries over a matrix of (unit length) word vectors, as returned by gen.get_co_embeddings.
+
+        Exact queries multiply the queries against the vocabulary one block of rows at a time and keep a
+        running top-k, so memory stays at (n_queries x block_size) no matter how large the vocabulary is.
+        Approximate queries use random-hyperplane LSH: words whose vectors fall on the same side of
+        n_bits random hyperplanes share a bucket, and only words sharing a bucket with the query in at
+        least one of n_tables tables are scored.
+    """
+
+    def __init__(self, M, word2ind, block_size=4096):
+        self.M = M
+        self.word2ind = word2ind
+        self.ind2word = [None] * len(word2ind)
+        for w, i in word2ind.items():
+            self.ind2word[i] = w
+        self.block_size = block_size
+        self.planes = None
+        self.bucket_codes = None
+        self.bucket_words = None
+
+    # ----- exact -----
+
+    def search(self, Q, k=10, exclude=None):
+        """ Exact top-k by dot product for each row of Q.
+            Params:
+                Q (n_queries x dim matrix): query vectors
+                k (int): number of neighbours per query
+                exclude (list of ints or None): for each query, one row index to leave out (e.g. the query word itself)
+            Return:
+                (indices, scores): two (n_queries x k) arrays, best match first
+        """
+        Q = np.atleast_2d(Q)
+        n_queries = Q.shape[0]
+        best_ind = np.zeros((n_queries, 0), dtype=np.int64)
+        best_scores = np.zeros((n_queries, 0), dtype=Q.dtype)
+        rows = np.arange(n_queries)
+
+        for start in range(0, self.M.shape[0], self.block_size):
+            block = self.M[start:start + self.block_size]
+            scores = Q @ block.T
+            if exclude is not None:
+                for q, ind in enumerate(exclude):
+                    if ind is not None and start <= ind < start + block.shape[0]:
+                        scores[q, ind - start] = -np.inf
+            # merge this block with the running top-k and keep the k best again
+            cand_ind = np.concatenate([best_ind, np.arange(start, start + block.shape[0])[None, :].repeat(n_queries, 0)], axis=1)
+            cand_scores = np.concatenate([best_scores, scores], axis=1)
+            keep = top_k(cand_scores, k)
+            best_ind = cand_ind[rows[:, None], keep]
+            best_scores = cand_scores[rows[:, None], keep]
+
+        return best_ind, best_scores
+
+    # ----- approximate -----
+
+    def build_lsh(self, n_tables=8, n_bits=12, seed=0):
+        """ Build the random-hyperplane LSH tables. For each table, words are sorted by their bucket code
+            so a bucket is one contiguous slice found with searchsorted.
+        """
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, self.M.shape[1], n_bits)).astype(self.M.dtype)
+        codes = self._codes(self.M)
+        self.bucket_words = np.argsort(codes, axis=1, kind="stable")
+        self.bucket_codes = np.take_along_axis(codes, self.bucket_words, axis=1)
+        return self
+
+    def _codes(self, X):
+        """ (n_tables x n_rows) bucket codes: one bit per hyperplane, set when the vector is on its positive side """
+        n_bits = self.planes.shape[2]
+        bits = np.einsum("nd,tdb->tnb", X, self.planes) > 0
+        return bits.astype(np.int64) @ (1 << np.arange(n_bits, dtype=np.int64))
+
+    def search_approximate(self, Q, k=10, exclude=None):
+        """ Like search, but only scores the words that share an LSH bucket with the query.
+            Falls back to an exact search for a query whose buckets hold fewer than k candidates.
+        """
+        if self.planes is None:
+            self.build_lsh()
+        Q = np.atleast_2d(Q)
+        codes = self._codes(Q)
+        n_tables = self.planes.shape[0]
+        ind = np.zeros((Q.shape[0], k), dtype=np.int64)
+        scores = np.full((Q.shape[0], k), -np.inf, dtype=Q.dtype)
+
+        for q in range(Q.shape[0]):
+            candidates = []
+            for t in range(n_tables):
+                lo = np.searchsorted(self.bucket_codes[t], codes[t, q], side="left")
+                hi = np.searchsorted(self.bucket_codes[t], codes[t, q], side="right")
+                candidates.append(self.bucket_words[t, lo:hi])
+            candidates = np.unique(np.concatenate(candidates))
+            if exclude is not None and exclude[q] is not None:
+                candidates = candidates[candidates != exclude[q]]
+
+            if len(candidates) < k:
+                q_ind, q_scores = self.search(Q[q:q + 1], k, None if exclude is None else [exclude[q]])
+            else:
+                cand_scores = (self.M[candidates] @ Q[q])[None, :]
+                keep = top_k(cand_scores, k)
+                q_ind, q_scores = candidates[keep], cand_scores[0, keep]
+            n = q_ind.shape[1]
+            ind[q, :n] = q_ind[0]
+            scores[q, :n] = q_scores[0]
+
+        return ind, scores
+
+    # ----- words -----
+
+    def _unknown(self, words):
+        unknown = [w for w in words if w not in self.word2ind]
+        if unknown:
+            raise KeyError(f"Words not in vocabulary: {unknown}")
+
+    def most_similar_batch(self, words, k=10, approximate=False):
+        """ The k nearest words (by cosine similarity) to each word in words, leaving out the word itself.
+            Return: one list of (word, similarity) pairs per query word
+        """
+        self._unknown(words)
+        rows = [self.word2ind[w] for w in words]
+        search = self.search_approximate if approximate else self.search
+        ind, scores = search(self.M[rows], k, exclude=rows)
+        return [[(self.ind2word[i], float(s)) for i, s in zip(ind[q], scores[q]) if np.isfinite(s)]
+                for q in range(len(words))]
+
+    def most_similar(self, word, k=10, approximate=False):
+        return self.most_similar_batch([word], k, approximate)[0]
+
+    def top_along(self, axis, k=10):
+        """ The k words projecting furthest onto each end of axis.
+            Return: (positive end, negative end), each a list of (word, projection) pairs
+        """
+        proj = (self.M @ axis)[None, :]
+        pos = top_k(proj, k)[0]
+        neg = top_k(-proj, k)[0]
+        return ([(self.ind2word[i], float(proj[0, i])) for i in pos],
+                [(self.ind2word[i], float(proj[0, i])) for i in neg])
+
+    # ----- persistence -----
+
+    def fingerprint(self):
+        """ Identifies the vectors an index was built for, so a stale index on disk is never reused """
+        sample = np.ascontiguousarray(self.M[::max(1, self.M.shape[0] // 1024)])
+        digest = int.from_bytes(hashlib.sha1(sample.tobytes()).digest()[:7], "little")
+        return np.array([self.M.shape[0], self.M.shape[1], digest], dtype=np.int64)
+
+    def save_lsh(self, fname):
+        log(1, "Saving LSH index to", fname)
+        np.savez(fname, planes=self.planes, bucket_codes=self.bucket_codes,
+                 bucket_words=self.bucket_words, fingerprint=self.fingerprint())
+
+    def load_lsh(self, fname):
+        """ Load LSH tables saved by save_lsh. Returns False (and loads nothing) if the file is missing
+            or was built for different vectors.
+        """
+        if not os.path.exists(fname):
+            return False
+        saved = np.load(fname)
+        if not np.array_equal(saved["fingerprint"], self.fingerprint()):
+            log(1, "Ignoring stale LSH index", fname)
+            return False
+        log(1, "Loading LSH index from", fname)
+        self.planes = saved["planes"]
+        self.bucket_codes = saved["bucket_codes"]
+        self.bucket_words = saved["bucket_words"]
+        return True
+
+    def load_or_build_lsh(self, fname, n_tables=8, n_bits=12, seed=0):
+        if not self.load_lsh(fname) or self.planes.shape[0] != n_tables or self.planes.shape[2] != n_bits:
+            self.build_lsh(n_tables, n_bits, seed)
+            self.save_lsh(fname)
+        return self
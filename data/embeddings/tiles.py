@@ -0,0 +1,150 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+# shared python packages (instrumentation, ...) live in the parent data folder
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from instrumentation import log
+
+# ------------------------------------------
+# Compact, tiled export of word embeddings for the front end
+# ------------------------------------------
+#
+# out_dir/
+#   index.json          what's below: word count, dim, dtype, zoom levels, coordinate bounds
+#   vocab.tsv           one "word<TAB>frequency" line per row of the vector matrix
+#   vectors.bin         row-major vectors, float16 or int8
+#   scales.bin          int8 only: float32 scale per row (vector = int8 row * scale)
+#   tiles/z/x/y.json    [[word, x, y, frequency], ...] of the words whose 2-D position falls in tile
+#                       (x, y) of zoom level z (2^z x 2^z tiles over the coordinate bounds), positions
+#                       rounded to 5 decimals. Coarse
+#                       levels keep only the words_per_tile most frequent words of each tile, the
+#                       finest level keeps every word.
+#
+# Every file is written row by row / tile by tile, never as one big in-memory structure.
+
+DTYPES = ["float16", "int8"]
+
+def quantize(M, dtype):
+    """ Return (quantized rows, per-row float32 scales or None) """
+    M = np.asarray(M, dtype=np.float32)
+    if dtype == "float16":
+        return M.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.maximum(np.abs(M).max(axis=1), 1e-12) / 127
+        return np.round(M / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unknown dtype {dtype!r}, expected one of {DTYPES}")
+
+def dequantize(Q, scales=None):
+    Q = Q.astype(np.float32)
+    return Q if scales is None else Q * scales[:, None]
+
+def write_vectors(out_dir, M, words, freqs, dtype="float16", chunk_rows=65536):
+    with open(os.path.join(out_dir, "vocab.tsv"), "w") as f:
+        for word, freq in zip(words, freqs.tolist()):
+            f.write(f"{word}\t{freq}\n")
+    scales_f = open(os.path.join(out_dir, "scales.bin"), "wb") if dtype == "int8" else None
+    with open(os.path.join(out_dir, "vectors.bin"), "wb") as f:
+        for start in range(0, M.shape[0], chunk_rows):
+            Q, scales = quantize(M[start:start + chunk_rows], dtype)
+            f.write(Q.tobytes())
+            if scales_f is not None:
+                scales_f.write(scales.tobytes())
+    if scales_f is not None:
+        scales_f.close()
+
+def read_vectors(out_dir):
+    """ (words, frequencies, float32 vectors) back from an export """
+    with open(os.path.join(out_dir, "index.json"), "r") as f:
+        index = json.load(f)
+    words, freqs = [], []
+    with open(os.path.join(out_dir, "vocab.tsv"), "r") as f:
+        for line in f:
+            word, freq = line.rstrip("\n").split("\t")
+            words.append(word)
+            freqs.append(int(freq))
+    Q = np.fromfile(os.path.join(out_dir, "vectors.bin"), dtype=index["dtype"]).reshape(index["count"], index["dim"])
+    scales = np.fromfile(os.path.join(out_dir, "scales.bin"), dtype=np.float32) if index["dtype"] == "int8" else None
+    return words, np.array(freqs, dtype=np.int64), dequantize(Q, scales)
+
+def tile_members(coords, freqs, bounds, level, words_per_tile=None):
+    """ Yield (x, y, rows) for every non-empty tile of a zoom level, rows sorted by decreasing frequency.
+        With words_per_tile, only that many rows are kept per tile.
+    """
+    n_tiles = 1 << level
+    lo = np.array(bounds[:2])
+    span = np.maximum(np.array(bounds[2:]) - lo, 1e-12)
+    cells = np.clip(((coords - lo) / span * n_tiles).astype(np.int64), 0, n_tiles - 1)
+    tile_ids = cells[:, 0] * n_tiles + cells[:, 1]
+    order = np.lexsort((-freqs, tile_ids))
+    sorted_ids = tile_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    for start, end in zip(starts, ends):
+        if words_per_tile is not None:
+            end = min(end, start + words_per_tile)
+        tile_id = int(sorted_ids[start])
+        yield tile_id // n_tiles, tile_id % n_tiles, order[start:end]
+
+def write_tiles(out_dir, coords, words, freqs, n_levels=5, words_per_tile=256):
+    bounds = [float(v) for v in np.r_[coords.min(axis=0), coords.max(axis=0)]]
+    tile_counts = []
+    for level in range(n_levels):
+        finest = level == n_levels - 1
+        tile_count = 0
+        for x, y, rows in tile_members(coords, freqs, bounds, level, None if finest else words_per_tile):
+            tile_dir = os.path.join(out_dir, "tiles", str(level), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f"{y}.json"), "w") as f:
+                points = np.round(coords[rows], 5).tolist()
+                f.write(json.dumps([[words[i], p[0], p[1], int(freqs[i])] for i, p in zip(rows.tolist(), points)]))
+            tile_count += 1
+        tile_counts.append(tile_count)
+    return bounds, tile_counts
+
+def layout_2d(M):
+    """ 2-D positions for the tiles: the vectors themselves if they are 2-D, else their first two principal components """
+    M = np.asarray(M, dtype=np.float64)
+    if M.shape[1] == 2:
+        return M
+    centered = M - M.mean(axis=0)
+    _, _, Vt = np.linalg.svd(centered, full_matrices=False)
+    return centered @ Vt[:2].T
+
+def export_embeddings(out_dir, M, word2ind, freqs, dtype="float16", n_levels=5, words_per_tile=256, coords=None):
+    """ Write the tiled export of M (rows indexed by word2ind) to out_dir
+        Params:
+            freqs (dict): corpus frequency of each word, used to pick the words shown at coarse zoom levels
+            coords (n_words x 2 matrix): positions for the tiles; defaults to layout_2d(M)
+    """
+    log(1, "Exporting embeddings to", out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    words = [None] * len(word2ind)
+    for w, i in word2ind.items():
+        words[i] = w
+    freq_arr = np.array([freqs.get(w, 0) for w in words], dtype=np.int64)
+
+    write_vectors(out_dir, M, words, freq_arr, dtype)
+    coords = layout_2d(M) if coords is None else np.asarray(coords, dtype=np.float64)
+    bounds, tile_counts = write_tiles(out_dir, coords, words, freq_arr, n_levels, words_per_tile)
+
+    index = {
+        "count": len(words),
+        "dim": int(M.shape[1]),
+        "dtype": dtype,
+        "vocab": "vocab.tsv",
+        "vectors": "vectors.bin",
+        "scales": "scales.bin" if dtype == "int8" else None,
+        "tiles": {
+            "path": "tiles/{z}/{x}/{y}.json",
+            "levels": n_levels,
+            "words_per_tile": words_per_tile,
+            "bounds": bounds,
+            "tile_counts": tile_counts
+        }
+    }
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=4)
+    return index
@@ -0,0 +1,57 @@
+import numpy as np
+import scipy as sp
+import scipy.sparse
+
+# ------------------------------------------
+# Reweighting sparse co-occurrence counts before the SVD
+# ------------------------------------------
+#
+# Raw counts are dominated by <START>/<END> and stop words, which co-occur with everything. Each
+# function here takes and returns a scipy.sparse matrix and only touches its stored entries, so
+# nothing is ever densified.
+
+WEIGHTINGS = ["counts", "log", "ppmi"]
+
+def prune_vocabulary(M, word2ind, counts, min_count):
+    """ Drop the rows and columns of words that occur fewer than min_count times in the corpus
+        Params:
+            counts (dict): corpus frequency of each word
+        Return:
+            (pruned M, word2ind of the kept words, in their original order)
+    """
+    words = sorted(word2ind, key=word2ind.get)
+    keep = np.array([counts.get(w, 0) >= min_count for w in words], dtype=bool)
+    kept = np.flatnonzero(keep)
+    M = sp.sparse.csr_matrix(M)[kept][:, kept]
+    return M, {words[i]: j for j, i in enumerate(kept)}
+
+def log_counts(M):
+    """ log(1 + count) """
+    M = sp.sparse.csr_matrix(M, dtype=np.float64, copy=True)
+    np.log1p(M.data, out=M.data)
+    return M
+
+def ppmi(M, alpha=0.75):
+    """ Positive pointwise mutual information, max(0, log P(w, c) / (P(w) P_alpha(c))).
+        alpha < 1 smooths the context distribution (P_alpha(c) is proportional to count(c)^alpha), which
+        raises the probability of rare contexts and so stops them from getting huge PMI values.
+    """
+    M = sp.sparse.csr_matrix(M, dtype=np.float64)
+    total = M.sum()
+    row_p = np.asarray(M.sum(axis=1)).ravel() / total
+    context_counts = np.asarray(M.sum(axis=0)).ravel() ** alpha
+    context_p = context_counts / context_counts.sum()
+
+    coo = M.tocoo()
+    pmi = np.log(coo.data / total) - np.log(row_p[coo.row]) - np.log(context_p[coo.col])
+    positive = pmi > 0
+    return sp.sparse.csr_matrix((pmi[positive], (coo.row[positive], coo.col[positive])), shape=M.shape)
+
+def reweight(M, weighting="counts", alpha=0.75):
+    if weighting == "counts":
+        return M
+    if weighting == "log":
+        return log_counts(M)
+    if weighting == "ppmi":
+        return ppmi(M, alpha)
+    raise ValueError(f"Unknown weighting {weighting!r}, expected one of {WEIGHTINGS}")
@@ -0,0 +1,106 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+import generate as gen
+from artifacts import ArtifactStore
+from similarity import WordIndex
+from weighting import prune_vocabulary, reweight
+
+# Speed and neighbour quality of each reweighting of the love letters co-occurrence matrix, for
+# several embedding sizes. There is no labelled similarity data for this corpus, so quality is
+# measured two ways:
+#   stop_share:   share of the 10 nearest neighbours of common content words that are stop words
+#                 or <START>/<END> (what raw counts get wrong)
+#   related_rank: median rank of a word's partner among its neighbours, over pairs like boyfriend /
+#                 girlfriend that both occur in the corpus (lower is better)
+
+STOP_WORDS = {gen.START_TOKEN, gen.END_TOKEN, "", "the", "a", "an", "and", "or", "but", "to", "of", "in", "on", "at",
+              "for", "with", "is", "was", "be", "it", "that", "this", "i", "you", "me", "my", "we", "so", "just"}
+QUERY_WORDS = ["love", "miss", "heart", "boyfriend", "girlfriend", "happy", "sad", "mom", "dad", "friend",
+               "home", "life", "sorry", "forever", "kiss", "hurt", "remember", "beautiful", "wedding", "baby"]
+RELATED_PAIRS = [("boyfriend", "girlfriend"), ("husband", "wife"), ("mom", "dad"), ("mother", "father"),
+                 ("happy", "sad"), ("love", "loved"), ("miss", "missing"), ("he", "she"), ("him", "her"),
+                 ("son", "daughter"), ("brother", "sister"), ("today", "tomorrow"), ("always", "never"),
+                 ("heart", "soul"), ("kiss", "hug"), ("month", "year")]
+
+CONFIGS = {
+    "counts": dict(weighting="counts"),
+    "log": dict(weighting="log"),
+    "ppmi": dict(weighting="ppmi"),
+    "ppmi+distance+min_count=2": dict(weighting="ppmi", distance_weighting=True, min_count=2),
+}
+
+def neighbour_quality(M, word2ind, k=10):
+    index = WordIndex(M, word2ind)
+    queries = [w for w in QUERY_WORDS if w in word2ind]
+    neighbours = index.most_similar_batch(queries, k) if queries else []
+    stop_share = np.mean([w in STOP_WORDS for ns in neighbours for w, _ in ns]) if neighbours else float("nan")
+
+    pairs = [(a, b) for a, b in RELATED_PAIRS if a in word2ind and b in word2ind]
+    ranks = []
+    for a, b in pairs:
+        scores = M @ M[word2ind[a]]
+        scores[word2ind[a]] = -np.inf
+        ranks.append(int((scores > scores[word2ind[b]]).sum()) + 1)
+    return float(stop_share), float(np.median(ranks)) if ranks else float("nan")
+
+def run_benchmark(dims, configs, n_samples, window_size, n_iters, n_oversamples, n_threads, store_path=None):
+    artifacts = ArtifactStore(gen.default_cache_dir)
+    corpus_key = gen.corpus_key_for(artifacts, n_samples, store_path)
+    corpus = gen.read_encoded_corpus(n_samples, artifacts.path(corpus_key), store_path)
+    artifacts.record(corpus_key, n_samples=n_samples)
+    counts = corpus.word_counts()
+
+    rows = []
+    for name in configs:
+        config = CONFIGS[name]
+        distance_weighting = config.get("distance_weighting", False)
+        key = artifacts.key("benchmark_co_occurrence", corpus=corpus_key, window_size=window_size,
+                            distance_weighting=distance_weighting)
+        M, word2ind = gen.compute_encoded_co_occurrence_matrix(corpus, window_size, artifacts.path(key) + "-word2ind.json",
+                                                               artifacts.path(key), distance_weighting=distance_weighting)
+        artifacts.record(key, window_size=window_size, distance_weighting=distance_weighting)
+        if config.get("min_count", 1) > 1:
+            M, word2ind = prune_vocabulary(M, word2ind, counts, config["min_count"])
+
+        start = time.perf_counter()
+        W = reweight(M, config["weighting"])
+        weight_seconds = time.perf_counter() - start
+
+        for dim in dims:
+            dim = min(dim, W.shape[0] - 1)
+            start = time.perf_counter()
+            M_reduced = gen.reduce_to_k_dim(W, k=dim, n_iters=n_iters, n_oversamples=n_oversamples,
+                                            n_threads=n_threads, random_state=0)
+            svd_seconds = time.perf_counter() - start
+            M_normalized = M_reduced / np.maximum(np.linalg.norm(M_reduced, axis=1), 1e-12)[:, np.newaxis]
+            stop_share, related_rank = neighbour_quality(M_normalized, word2ind)
+
+            row = {"weighting": name, "k": dim, "words": W.shape[0], "weight_s": round(weight_seconds, 3),
+                   "svd_s": round(svd_seconds, 3), "stop_share": round(stop_share, 3), "related_rank": related_rank}
+            print(f"{name:>28} k={dim:<4} {W.shape[0]} words | reweight {weight_seconds:.3f}s | svd {svd_seconds:.3f}s"
+                  f" | stop words in neighbours {stop_share:.1%} | median related rank {related_rank}")
+            rows.append(row)
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dims", type=int, nargs="+", default=[2, 50, 100, 300])
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("-n", "--num_samples", type=int, default=gen.FULL_CORPUS_SIZE)
+    parser.add_argument("--store", type=str, help="read posts from a corpus_store directory")
+    parser.add_argument("-w", "--window_size", type=int, default=4)
+    parser.add_argument("--n_iters", type=int, default=10)
+    parser.add_argument("--n_oversamples", type=int, default=10)
+    parser.add_argument("--n_threads", type=int, default=None)
+    parser.add_argument("--output", type=str, help="also save the results table as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.dims, args.configs, args.num_samples, args.window_size, args.n_iters,
+                            args.n_oversamples, args.n_threads, args.store)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,7 @@
+""" Timers, memory snapshots, optional cProfile dumps and JSON-lines metrics for the pipeline scripts.
+
+    Wrap a step in `with stage("name"):` or decorate a function with `@timed()`; each writes a
+    record to the metrics file (PIPELINE_METRICS). `log(level, ...)` replaces the scripts' prints
+    so large dumps only show up at PIPELINE_VERBOSITY=2.
+"""
+from .metrics import configure, log, peak_rss_mb, stage, timed, verbosity
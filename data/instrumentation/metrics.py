@@ -0,0 +1,171 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Every stage() block writes one JSON line to the metrics file:
+#   {"stage", "parent", "script", "pid", "started", "seconds", "cpu_seconds", "peak_rss_mb", ...}
+# plus "traced_mb" / "traced_peak_mb" (Python allocations inside the block) when tracemalloc is on,
+# "profile" (a cProfile dump of the block, open with pstats or snakeviz) when profiling is on, and any
+# fields the caller adds. Functions decorated with @timed(summary=True) are called too often for a
+# line per call, so their calls and total seconds are written as one line when the process exits.
+#
+# Settings come from configure() or, so that the pipeline runner can switch them on for every
+# script at once, from these environment variables:
+#   PIPELINE_METRICS      JSON-lines file to append to (default: no metrics are written)
+#   PIPELINE_PROFILE_DIR  write <dir>/<stage>-<pid>.prof for every stage
+#   PIPELINE_TRACEMALLOC  "1" to trace Python allocations
+#   PIPELINE_VERBOSITY    0: quiet, 1: progress messages (default), 2: also dump matrices, vocabularies, ...
+
+_settings = {
+    "metrics_path": os.environ.get("PIPELINE_METRICS") or None,
+    "profile_dir": os.environ.get("PIPELINE_PROFILE_DIR") or None,
+    "trace_memory": os.environ.get("PIPELINE_TRACEMALLOC", "") not in ("", "0"),
+    "verbosity": int(os.environ.get("PIPELINE_VERBOSITY", "1")),
+}
+_stack = []
+# [peak bytes] of every open stage that traces memory, innermost last (see stage())
+_traced_peaks = []
+_summaries = {}
+
+def configure(metrics_path=None, profile_dir=None, trace_memory=None, verbosity=None):
+    """ Override the environment settings; arguments left as None keep their current value """
+    for key, value in [("metrics_path", metrics_path), ("profile_dir", profile_dir),
+                       ("trace_memory", trace_memory), ("verbosity", verbosity)]:
+        if value is not None:
+            _settings[key] = value
+
+def verbosity():
+    return _settings["verbosity"]
+
+def log(level, *args, **kwargs):
+    """ print(*args) if the verbosity is at least level (1: progress, 2: detailed dumps) """
+    if _settings["verbosity"] >= level:
+        print(*args, **kwargs)
+
+def peak_rss_mb():
+    """ Peak resident memory of this process so far, or None where it can't be read """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3)
+
+def write_record(record):
+    if _settings["metrics_path"] is None:
+        return
+    directory = os.path.dirname(_settings["metrics_path"])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # one write per line in append mode, so several processes can share the file
+    with open(_settings["metrics_path"], "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+@contextmanager
+def stage(name, **fields):
+    """ Measure a block: with stage("nmf.fit", topics=15): ...
+        Yields a dict; keys added to it inside the block end up in the record.
+    """
+    extra = dict(fields)
+    tracing = _settings["trace_memory"]
+    if tracing:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if hasattr(tracemalloc, "reset_peak"):
+            # resetting wipes the peak of the enclosing stages too, so hand it to them first
+            peak_so_far = tracemalloc.get_traced_memory()[1]
+            for enclosing_peak in _traced_peaks:
+                enclosing_peak[0] = max(enclosing_peak[0], peak_so_far)
+            tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        traced_peak = [0]
+        _traced_peaks.append(traced_peak)
+    # one profiler at a time: nested stages are part of their outermost stage's profile
+    profiler = cProfile.Profile() if _settings["profile_dir"] is not None and not _stack else None
+
+    parent = _stack[-1] if _stack else None
+    _stack.append(name)
+    started = time.time()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield extra
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record = {
+            "stage": name,
+            "parent": parent,
+            "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+            "pid": os.getpid(),
+            "started": round(started, 3),
+            "seconds": round(time.perf_counter() - start, 6),
+            "cpu_seconds": round(time.process_time() - cpu_start, 6),
+            "peak_rss_mb": None if resource is None else round(peak_rss_mb(), 1),
+        }
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            _traced_peaks.pop()
+            record["traced_mb"] = round((current - traced_before) / 1e6, 3)
+            record["traced_peak_mb"] = round(max(peak, traced_peak[0]) / 1e6, 3)
+            if started_tracing:
+                tracemalloc.stop()
+        if profiler is not None:
+            os.makedirs(_settings["profile_dir"], exist_ok=True)
+            profile_path = os.path.join(_settings["profile_dir"], f"{name}-{os.getpid()}.prof")
+            profiler.dump_stats(profile_path)
+            record["profile"] = profile_path
+        record.update(extra)
+        _stack.pop()
+        write_record(record)
+
+def timed(name=None, summary=False):
+    """ Decorator: run every call of the function inside stage(name) (default: the function's qualified name).
+        With summary=True the calls are only counted and timed, and written as one record at exit.
+    """
+    def decorate(function):
+        stage_name = name or function.__module__ + "." + function.__qualname__
+
+        if summary:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    totals = _summaries.setdefault(stage_name, [0, 0.0])
+                    totals[0] += 1
+                    totals[1] += time.perf_counter() - start
+            return wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+@atexit.register
+def _write_summaries():
+    for stage_name, (calls, seconds) in _summaries.items():
+        write_record({
+            "stage": stage_name,
+            "parent": None,
+            "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+            "pid": os.getpid(),
+            "calls": calls,
+            "seconds": round(seconds, 6),
+            "mean_seconds": round(seconds / calls, 6) if calls else None,
+        })
@@ -0,0 +1,9 @@
+""" Runs the data pipeline as a DAG of stages.
+
+    Each stage is a script with the files it reads and writes. Dependencies come from the files
+    (a stage depends on whichever stage writes one of its inputs), a stage is skipped when the
+    content of its inputs and its command are unchanged since it last succeeded, and independent
+    stages run in parallel.
+"""
+from .dag import Pipeline, Stage, StageState
+from .stages import STAGES, build_pipeline
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+
+from instrumentation import configure
+
+from .dag import StageState
+from .stages import REPO_ROOT, build_pipeline
+
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, "data", "pipeline", "cache")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m pipeline")
+    parser.add_argument("stages", nargs="*", help="stages to bring up to date, with what they depend on (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="stages running at the same time (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="run the selected stages even if they are up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only print which stages would run")
+    parser.add_argument("--list", action="store_true", help="print the stages and their dependencies")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="where the state file and stage logs are kept")
+    parser.add_argument("--report", type=str, default=None, help="where to write the timing/memory report (default: <cache-dir>/report.json)")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="JSON-lines file the stages append their step metrics to (default: <cache-dir>/metrics.jsonl)")
+    parser.add_argument("--profile", action="store_true", help="have every instrumented step write a cProfile dump to <cache-dir>/profiles")
+    parser.add_argument("--tracemalloc", action="store_true", help="record Python allocations of every instrumented step")
+    parser.add_argument("--verbosity", type=int, default=1,
+                        help="runner and stage output: 0 quiet (only the report), 1 progress, 2 detailed dumps")
+    args = parser.parse_args()
+
+    configure(verbosity=args.verbosity)
+    pipeline = build_pipeline()
+    if args.list:
+        for name in pipeline.order:
+            dependencies = pipeline.dependencies[name]
+            print(name + (" <- " + ", ".join(dependencies) if dependencies else ""))
+        raise SystemExit(0)
+
+    # settings read by data/instrumentation in every stage
+    env = {
+        "PIPELINE_METRICS": os.path.abspath(args.metrics or os.path.join(args.cache_dir, "metrics.jsonl")),
+        "PIPELINE_VERBOSITY": str(args.verbosity),
+    }
+    if args.profile:
+        env["PIPELINE_PROFILE_DIR"] = os.path.abspath(os.path.join(args.cache_dir, "profiles"))
+    if args.tracemalloc:
+        env["PIPELINE_TRACEMALLOC"] = "1"
+
+    state = StageState(os.path.join(args.cache_dir, "state.json"), REPO_ROOT)
+    report = pipeline.run(args.stages, workers=args.workers, force=args.force, state=state,
+                          log_dir=os.path.join(args.cache_dir, "logs"), dry_run=args.dry_run, env=env)
+
+    for name, result in report["stages"].items():
+        seconds = f"{result['seconds']:8.2f}s" if "seconds" in result else " " * 9
+        rss = f"{result['peak_rss_mb']:8.1f} MB" if result.get("peak_rss_mb") is not None else ""
+        print(f"{name:>24}  {result['status']:<9} {seconds} {rss}")
+    print(f"wall {report['wall_seconds']:.2f}s, critical path {report['critical_path_seconds']:.2f}s: "
+          + " -> ".join(report["critical_path"]))
+
+    if not args.dry_run:
+        report_path = args.report or os.path.join(args.cache_dir, "report.json")
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to {report_path}")
+
+    if any(result["status"] in ("failed", "blocked") for result in report["stages"].values()):
+        raise SystemExit(1)
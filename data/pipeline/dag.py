@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import log
+
+# Stages name the files they read (inputs) and write (outputs), relative to the repository root.
+# A stage's fingerprint hashes its command, working directory and the contents of its inputs; after a
+# successful run it is stored in the state file together with the size/mtime of every output. The
+# next run skips the stage if the fingerprint is the same and the outputs are untouched. Because
+# fingerprints are computed only once a stage's upstream stages have finished, a stage whose
+# upstream reran but wrote byte-identical files is skipped too.
+#
+# Each stage that runs gets a log file, and the run writes a report: status (ran, skipped, failed,
+# blocked by a failed upstream stage, or "would run" for a dry run), seconds and peak RSS of every
+# stage, plus the critical path (the longest chain of dependent stages that ran).
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Stage:
+    """ One script of the pipeline
+        Params:
+            command (list of strings): what to run, from cwd
+            cwd (string): working directory, relative to the repository root
+            inputs, outputs (lists of strings): files read and written, relative to the repository root
+    """
+
+    def __init__(self, name, command, cwd, inputs, outputs):
+        self.name = name
+        self.command = list(command)
+        self.cwd = cwd
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+class StageState:
+    """ What each stage last succeeded with, kept between runs in a JSON file.
+        Content hashes are remembered per (path, size, mtime), so unchanged files aren't rehashed.
+    """
+
+    def __init__(self, path, root):
+        self.path = path
+        self.root = root
+        self.hashes = {}
+        self.stages = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                saved = json.load(f)
+            self.hashes = saved["hashes"]
+            self.stages = saved["stages"]
+
+    def _stat(self, relpath):
+        stat = os.stat(os.path.join(self.root, relpath))
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def hash(self, relpath):
+        stat = self._stat(relpath)
+        cached = self.hashes.get(relpath)
+        if cached is None or cached[:2] != stat:
+            cached = stat + [file_hash(os.path.join(self.root, relpath))]
+            self.hashes[relpath] = cached
+        return cached[2]
+
+    def fingerprint(self, stage):
+        payload = {
+            "command": stage.command,
+            "cwd": stage.cwd,
+            "inputs": [[relpath, self.hash(relpath)] for relpath in stage.inputs]
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def is_fresh(self, stage, fingerprint):
+        saved = self.stages.get(stage.name)
+        if saved is None or saved["fingerprint"] != fingerprint:
+            return False
+        for relpath in stage.outputs:
+            if not os.path.exists(os.path.join(self.root, relpath)) or saved["outputs"].get(relpath) != self._stat(relpath):
+                return False
+        return True
+
+    def record(self, stage, fingerprint):
+        self.stages[stage.name] = {
+            "fingerprint": fingerprint,
+            "outputs": {relpath: self._stat(relpath) for relpath in stage.outputs}
+        }
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"hashes": self.hashes, "stages": self.stages}, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+def run_stage(stage, root, log_path, env=None):
+    """ Run one stage as a subprocess, with its output going to log_path and env added to its environment.
+        Return its result: status, returncode, seconds and peak RSS (MB, None where os.wait4 doesn't exist)
+    """
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    start = time.perf_counter()
+    peak_rss_mb = None
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(stage.command, cwd=os.path.join(root, stage.cwd), stdout=log, stderr=subprocess.STDOUT,
+                                   env=dict(os.environ, **env) if env else None)
+        if hasattr(os, "wait4"):
+            # wait4 gives the resource usage of this child alone, even with other stages running
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            peak_rss_mb = usage.ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3)
+        else:
+            process.wait()
+    seconds = time.perf_counter() - start
+
+    result = {"status": "ran", "returncode": process.returncode, "seconds": round(seconds, 3),
+              "peak_rss_mb": None if peak_rss_mb is None else round(peak_rss_mb, 1), "log": log_path}
+    if process.returncode != 0:
+        result["status"] = "failed"
+        result["error"] = f"exited with {process.returncode}"
+    else:
+        missing = [relpath for relpath in stage.outputs if not os.path.exists(os.path.join(root, relpath))]
+        if missing:
+            result["status"] = "failed"
+            result["error"] = f"did not write {', '.join(missing)}"
+    return result
+
+class Pipeline:
+    """ Stages wired together by the files they share """
+
+    def __init__(self, stages, root):
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name {stage.name!r}")
+            self.stages[stage.name] = stage
+        self.root = root
+
+        producers = {}
+        for stage in stages:
+            for relpath in stage.outputs:
+                if relpath in producers:
+                    raise ValueError(f"{relpath} is written by both {producers[relpath]!r} and {stage.name!r}")
+                producers[relpath] = stage.name
+        self.dependencies = {
+            stage.name: sorted({producers[relpath] for relpath in stage.inputs if relpath in producers} - {stage.name})
+            for stage in stages
+        }
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order = []
+        visiting = set()
+        done = set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError("Stages depend on each other in a cycle: " + " -> ".join(path + [name]))
+            visiting.add(name)
+            for dependency in self.dependencies[name]:
+                visit(dependency, path + [name])
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def upstream(self, names):
+        """ The given stages and every stage they depend on """
+        selected = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name!r}, expected one of {list(self.stages)}")
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.dependencies[name])
+        return selected
+
+    def critical_path(self, results):
+        """ The chain of dependent stages that ran with the largest total run time """
+        best = {}
+        for name in self.order:
+            if name not in results:
+                continue
+            previous = max((best[d] for d in self.dependencies[name] if d in best), key=lambda b: b[0], default=(0, []))
+            if results[name]["status"] == "ran":
+                best[name] = (previous[0] + results[name]["seconds"], previous[1] + [name])
+            else:
+                best[name] = previous
+        return max(best.values(), key=lambda b: b[0], default=(0, []))
+
+    def run(self, targets=None, workers=None, force=False, state=None, log_dir=None, dry_run=False, env=None):
+        """ Run the targets (default: every stage) and what they depend on, independent stages in parallel
+            Params:
+                workers (int): stages running at the same time (default: one per CPU)
+                force (bool): run every selected stage even if it is up to date
+                state (StageState): where fingerprints are kept between runs (default: nowhere)
+                dry_run (bool): only report which stages would run
+                env (dict): extra environment variables for the stages (e.g. the instrumentation settings)
+            Return:
+                the report: {"wall_seconds", "critical_path", "critical_path_seconds", "stages": {name: result}}
+        """
+        selected = self.upstream(targets) if targets else set(self.stages)
+        if state is None:
+            state = StageState(None, self.root)
+        if log_dir is None:
+            log_dir = os.path.join(self.root, "data", "pipeline", "cache", "logs")
+
+        pending = [name for name in self.order if name in selected]
+        results = {}
+        running = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            while pending or running:
+                # start every stage whose dependencies are done; deciding one can unblock the next
+                progress = True
+                while progress:
+                    progress = False
+                    for name in list(pending):
+                        statuses = [results[d]["status"] if d in results else None for d in self.dependencies[name] if d in selected]
+                        if None in statuses:
+                            continue
+                        pending.remove(name)
+                        progress = True
+                        stage = self.stages[name]
+                        if "failed" in statuses or "blocked" in statuses:
+                            results[name] = {"status": "blocked"}
+                            continue
+                        missing = [relpath for relpath in stage.inputs if not os.path.exists(os.path.join(self.root, relpath))]
+                        if missing and not (dry_run and "would run" in statuses):
+                            results[name] = {"status": "failed", "error": f"missing input {', '.join(missing)}"}
+                            continue
+                        if dry_run and "would run" in statuses:
+                            results[name] = {"status": "would run"}
+                            continue
+                        fingerprint = state.fingerprint(stage)
+                        if not force and state.is_fresh(stage, fingerprint):
+                            results[name] = {"status": "skipped"}
+                        elif dry_run:
+                            results[name] = {"status": "would run"}
+                        else:
+                            log(1, f"[pipeline] running {name}: {' '.join(stage.command)}")
+                            future = executor.submit(run_stage, stage, self.root, os.path.join(log_dir, name + ".log"), env)
+                            running[future] = (name, fingerprint, time.perf_counter() - start)
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, fingerprint, started = running.pop(future)
+                    result = future.result()
+                    result["started"] = round(started, 3)
+                    results[name] = result
+                    log(1, f"[pipeline] {name} {result['status']} in {result['seconds']:.2f}s" +
+                           (f" ({result['error']}, see {result['log']})" if result["status"] == "failed" else ""))
+                    if result["status"] == "ran":
+                        # outputs changed, so their cached hashes are recomputed on next use
+                        state.record(self.stages[name], fingerprint)
+                        state.save()
+
+        critical_seconds, critical_path = self.critical_path(results)
+        return {
+            "wall_seconds": round(time.perf_counter() - start, 3),
+            "critical_path": critical_path,
+            "critical_path_seconds": round(critical_seconds, 3),
+            "stages": {name: results[name] for name in self.order if name in results}
+        }
@@ -0,0 +1,107 @@
+import os
+import sys
+
+from .dag import Pipeline, Stage
+
+# The repository's pipeline. Paths are what each script reads and writes from its own folder
+# (e.g. topic-modeling scripts read ../output.json), written relative to the repository root.
+#
+#   json-creation -> preprocess -> nmf -> clean-topic-assignments
+#                                      -> layout-pca
+#                                      -> layout-tsne
+#                 -> sentiment -> merge -> aggregate
+#                                       -> search-index (+ preprocess)
+#                 -> embeddings
+#
+# results/topics_NMF_15.json (the hand-labelled topics), main.json and topic.json aren't written by
+# any stage, so they are plain inputs.
+
+REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+
+DATA = "app/public/data"
+PROCESSING = DATA + "/processing"
+COMBINE = PROCESSING + "/combine-data"
+TOPICS = DATA + "/topic-modeling"
+SENTIMENT = DATA + "/sentiment-analysis"
+EMBEDDINGS = "data/embeddings"
+
+def _layout_stage(method, output, extra_args=()):
+    return Stage(
+        f"layout-{method}",
+        [sys.executable, "layout.py", "--methods", method] + list(extra_args),
+        TOPICS,
+        inputs=[TOPICS + "/results/topic-weights.npz", TOPICS + "/layout.py", TOPICS + "/topic_weights.py"],
+        outputs=[TOPICS + f"/results/{output}.json", TOPICS + f"/results/{output}.state.npz"])
+
+STAGES = [
+    Stage(
+        "json-creation",
+        [sys.executable, "json-creation.py", "--csv", "uncleaned-data.csv", "--output", "../output.json"],
+        PROCESSING,
+        inputs=[PROCESSING + "/uncleaned-data.csv", PROCESSING + "/json-creation.py"],
+        outputs=[DATA + "/output.json"]),
+    Stage(
+        "preprocess",
+        [sys.executable, "preprocess-data.py"],
+        TOPICS,
+        inputs=[DATA + "/output.json", TOPICS + "/preprocess-data.py", TOPICS + "/preprocess_cache.py"],
+        outputs=[DATA + "/cleaned-root-words.json", DATA + "/cleaned-bag-of-words.txt"]),
+    Stage(
+        "nmf",
+        [sys.executable, "NMF-topic-modeling.py"],
+        TOPICS,
+        inputs=[DATA + "/cleaned-root-words.json", TOPICS + "/NMF-topic-modeling.py", TOPICS + "/topic_weights.py",
+                TOPICS + "/topic_model_store.py"],
+        outputs=[TOPICS + "/results/top_topics_with_weights.json", TOPICS + "/results/topic-weights.npz",
+                 TOPICS + "/results/nmf-model.joblib", DATA + "/topics_NMF_15.json"]),
+    Stage(
+        "clean-topic-assignments",
+        [sys.executable, "clean-topic-assignments.py"],
+        TOPICS,
+        inputs=[TOPICS + "/results/topic-weights.npz", TOPICS + "/results/topics_NMF_15.json",
+                TOPICS + "/clean-topic-assignments.py", TOPICS + "/topic_weights.py"],
+        outputs=[TOPICS + "/results/final-topic-assignments.json"]),
+    _layout_stage("pca", "reduced-data"),
+    _layout_stage("tsne", "tsne-reduced-data"),
+    Stage(
+        "sentiment",
+        [sys.executable, "analysis.py", "--posts", "../output.json", "--output", "../processing/combine-data/sentiment.json"],
+        SENTIMENT,
+        inputs=[DATA + "/output.json", SENTIMENT + "/analysis.py", SENTIMENT + "/afinn_sentiment.py",
+                SENTIMENT + "/sentiment_cache.py"],
+        outputs=[COMBINE + "/sentiment.json"]),
+    Stage(
+        "merge",
+        [sys.executable, "cleanup.py", "--inputs", "main.json", "sentiment.json", "topic.json",
+         "--output", "../../consolidated_posts.json"],
+        COMBINE,
+        inputs=[COMBINE + "/main.json", COMBINE + "/sentiment.json", COMBINE + "/topic.json", COMBINE + "/cleanup.py"],
+        outputs=[DATA + "/consolidated_posts.json"]),
+    Stage(
+        "aggregate",
+        [sys.executable, "aggregate.py", "--posts", "../consolidated_posts.json", "--index", "../post-index.json",
+         "--rollups", "../rollups.json"],
+        PROCESSING,
+        inputs=[DATA + "/consolidated_posts.json", PROCESSING + "/aggregate.py"],
+        outputs=[DATA + "/post-index.json", DATA + "/rollups.json"]),
+    Stage(
+        "search-index",
+        # incremental builds never update posts that are already indexed, and this stage only reruns when
+        # the posts (or their lemmas) changed, so it always starts a fresh index
+        [sys.executable, "-m", "search", "build", "search/index", "--posts", "../" + DATA + "/consolidated_posts.json",
+         "--root-words", "../" + DATA + "/cleaned-root-words.json", "--rebuild"],
+        "data",
+        inputs=[DATA + "/consolidated_posts.json", DATA + "/cleaned-root-words.json",
+                "data/search/index.py", "data/search/__main__.py"],
+        outputs=["data/search/index/manifest.json"]),
+    Stage(
+        "embeddings",
+        [sys.executable, "generate.py", "--posts", "../../app/public/data/output.json", "-s", "-f", "../../app/public/data/embeddings.json"],
+        EMBEDDINGS,
+        inputs=[DATA + "/output.json"] + [EMBEDDINGS + "/" + f for f in
+                                          ["generate.py", "artifacts.py", "cooccurrence.py", "encoded_corpus.py", "weighting.py"]],
+        outputs=[DATA + "/embeddings.json"]),
+]
+
+def build_pipeline(root=REPO_ROOT):
+    return Pipeline(STAGES, root)
@@ -0,0 +1,7 @@
+""" Full-text search over the love letters corpus.
+
+    An inverted index (raw title, body and comment tokens plus body lemmas) with positional postings stored as
+    memory-mapped NumPy segments, and BM25 queries with phrases and topic / date filters.
+"""
+from .index import IndexWriter, SearchIndex, build_index, compact, post_fields, tokenize
+from .query import Searcher, parse_query
@@ -0,0 +1,94 @@
+import argparse
+import json
+import shutil
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from instrumentation import log
+
+from .index import DEFAULT_SEGMENT_SIZE, SearchIndex, build_index, compact
+from .query import Searcher
+
+def serve(searcher, port):
+    """ GET /search?q=...&k=10&topic=3&topic=5&after=2023-01-01&before=2023-07-01 -> JSON results """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path != "/search" or "q" not in params:
+                self.send_error(404, "expected /search?q=...")
+                return
+            start = time.perf_counter()
+            try:
+                results = searcher.search(params["q"][0], k=int(params.get("k", ["10"])[0]),
+                                          topics=[int(t) for t in params["topic"]] if "topic" in params else None,
+                                          after=params.get("after", [None])[0], before=params.get("before", [None])[0])
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            body = json.dumps({"results": [{"post_id": post_id, "score": round(score, 4)} for post_id, score in results],
+                               "ms": round((time.perf_counter() - start) * 1000, 3)}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Searching {len(searcher.index)} posts on http://127.0.0.1:{port}/search?q=...")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m search")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="create an index, or add the posts it doesn't have yet")
+    build_parser.add_argument("index", type=str)
+    build_parser.add_argument("--posts", type=str, required=True, help="output.json or consolidated_posts.json")
+    build_parser.add_argument("--root-words", type=str, help="cleaned-root-words.json (lemmas of the post bodies)")
+    build_parser.add_argument("--topics", type=str, help="post-keyed topic_idx file (topic.json), for posts files without topics")
+    build_parser.add_argument("--segment-size", type=int, default=DEFAULT_SEGMENT_SIZE, help="posts per segment")
+    build_parser.add_argument("--rebuild", action="store_true", help="start a new index instead of adding to an existing one (needed when indexed posts changed)")
+    build_parser.add_argument("--compact", action="store_true", help="merge the segments into one afterwards")
+
+    compact_parser = subparsers.add_parser("compact", help="merge the segments of an index into one")
+    compact_parser.add_argument("index", type=str)
+
+    for name, help in [("query", "print the top posts for a query"), ("serve", "answer queries over HTTP")]:
+        query_parser = subparsers.add_parser(name, help=help)
+        query_parser.add_argument("index", type=str)
+        if name == "query":
+            query_parser.add_argument("query", type=str, help='words and "quoted phrases"')
+            query_parser.add_argument("-k", type=int, default=10)
+            query_parser.add_argument("--topic", type=int, nargs="+", help="only posts with one of these topic_idx")
+            query_parser.add_argument("--after", type=str, help="only posts created on or after this date (e.g. 2023-01-01)")
+            query_parser.add_argument("--before", type=str, help="only posts created before this date")
+        else:
+            query_parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.rebuild and SearchIndex.exists(args.index):
+            shutil.rmtree(args.index)
+        added = build_index(args.index, args.posts, args.root_words, args.topics, args.segment_size)
+        if args.compact:
+            compact(args.index)
+        log(1, f"{added} posts added to {args.index}")
+    elif args.command == "compact":
+        compact(args.index)
+        log(1, f"{args.index} compacted")
+    else:
+        start = time.perf_counter()
+        searcher = Searcher(SearchIndex(args.index))
+        print(f"Opened {len(searcher.index)} posts in {time.perf_counter() - start:.2f}s")
+        if args.command == "serve":
+            serve(searcher, args.port)
+        else:
+            start = time.perf_counter()
+            results = searcher.search(args.query, args.k, args.topic, args.after, args.before)
+            print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.2f} ms")
+            for post_id, score in results:
+                print(f"{score:10.4f}  {post_id}")
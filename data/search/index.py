@@ -0,0 +1,376 @@
+import json
+import os
+import re
+import shutil
+from array import array
+
+import numpy as np
+
+from corpus_store.store import StringColumn, StringColumnWriter
+
+# On-disk layout of a search index directory:
+#
+#   manifest.json                 format version, vocabulary size, segments in order
+#   seg-00000/, seg-00001/, ...   one segment per batch of added posts (incremental adds write a new one)
+#
+# Documents are posts: the raw tokens of the title, the raw tokens of the body, the body's lemmas from
+# cleaned-root-words.json (if it has any), then the raw tokens of every comment. Query words are only
+# tokenized, so the raw body is what "loved" or "letters" match, and the lemmas are what "love" or
+# "letter" match in a body that only has the inflected form. Field boundaries leave a one-position gap,
+# so a phrase never spans two fields.
+#
+# Term ids are global: each segment stores the terms it added to the vocabulary (new_terms.bytes /
+# .offsets.npy), so the vocabulary is every segment's new terms in order. Inside a segment:
+#
+#   post_id.bytes + .offsets.npy  the posts, local doc id = row
+#   doc_length.npy, topic.npy, created.npy
+#                                 tokens per post, topic_idx (-1 if none), createdAt in epoch seconds
+#   term_offsets.npy              postings of term t are rows term_offsets[t]:term_offsets[t + 1] of
+#   docs.npy, tf.npy              (local doc id, term frequency), sorted by doc
+#   term_positions.npy            positions of term t are term_positions[t]:term_positions[t + 1] of
+#   positions.npy                 positions.npy, grouped by posting (tf of them each) in the same order
+#
+# docs, tf and positions use the narrowest unsigned dtype that holds their largest value. Everything
+# is opened with mmap, so a query only reads the postings of its own terms.
+
+FORMAT_VERSION = 2
+MISSING_DATE = np.iinfo(np.int64).min
+NON_WORD = re.compile(r"[^\w]")
+DEFAULT_SEGMENT_SIZE = 100000
+
+def tokenize(text):
+    """ Raw tokens: lowercased words with non-word characters removed (like the embeddings' tokenize_post) """
+    tokens = (NON_WORD.sub("", word.lower()) for word in text.split())
+    return [token for token in tokens if token]
+
+def post_fields(post, lemmas=None):
+    """ The token lists a post is indexed with: title, body, the body's lemmas if there are any, each comment """
+    fields = [tokenize(post.get("title") or ""), tokenize(post.get("body") or "")]
+    if lemmas:
+        fields.append(lemmas)
+    fields.extend(tokenize(comment.get("body") or "") for comment in post.get("comments", []))
+    return fields
+
+def _narrowest(values):
+    largest = int(values.max()) if len(values) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if largest <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint64)
+
+def _epoch_seconds(created_at):
+    if not created_at:
+        return MISSING_DATE
+    date = np.datetime64(created_at.rstrip("Z"), "ms")
+    return MISSING_DATE if np.isnat(date) else int(date.astype("datetime64[s]").astype(np.int64))
+
+def _write_string_column(path, name, values):
+    writer = StringColumnWriter(path, name)
+    for value in values:
+        writer.append(value)
+    writer.close()
+
+def _write_segment(path, terms, docs, positions, n_terms, post_ids, doc_length, topic, created, new_terms):
+    """ Write one segment from its token occurrences (term id, local doc id, position); the occurrences
+        of each term must come in (doc, position) order
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    # stable, so every term's occurrences stay in (doc, position) order
+    order = np.argsort(terms, kind="stable")
+    terms, docs, positions = terms[order], docs[order], positions[order]
+    # one posting per run of equal (term, doc)
+    starts = np.flatnonzero(np.concatenate([[True], (terms[1:] != terms[:-1]) | (docs[1:] != docs[:-1])])) \
+        if len(terms) else np.zeros(0, dtype=np.int64)
+    tf = np.diff(np.append(starts, len(terms)))
+    posting_terms = terms[starts]
+
+    np.save(os.path.join(tmp_path, "term_offsets.npy"), np.searchsorted(posting_terms, np.arange(n_terms + 1)).astype(np.int64))
+    np.save(os.path.join(tmp_path, "term_positions.npy"), np.searchsorted(terms, np.arange(n_terms + 1)).astype(np.int64))
+    np.save(os.path.join(tmp_path, "docs.npy"), _narrowest(docs[starts]))
+    np.save(os.path.join(tmp_path, "tf.npy"), _narrowest(tf))
+    np.save(os.path.join(tmp_path, "positions.npy"), _narrowest(positions))
+    np.save(os.path.join(tmp_path, "doc_length.npy"), np.asarray(doc_length, dtype=np.int32))
+    np.save(os.path.join(tmp_path, "topic.npy"), np.asarray(topic, dtype=np.int16))
+    np.save(os.path.join(tmp_path, "created.npy"), np.asarray(created, dtype=np.int64))
+    _write_string_column(tmp_path, "post_id", post_ids)
+    _write_string_column(tmp_path, "new_terms", new_terms)
+    os.replace(tmp_path, path)
+
+class Segment:
+    """ Read-only, memory-mapped view of one segment """
+
+    def __init__(self, path):
+        self.path = path
+        load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        self.term_offsets = load("term_offsets")
+        self.term_positions = load("term_positions")
+        self.docs = load("docs")
+        self.tf = load("tf")
+        self.positions = load("positions")
+        self.doc_length = load("doc_length")
+        self.topic = load("topic")
+        self.created = load("created")
+        self.post_ids = StringColumn(path, "post_id")
+        self.new_terms = StringColumn(path, "new_terms")
+
+    def __len__(self):
+        return len(self.doc_length)
+
+    def postings(self, term_id):
+        """ (local doc ids, term frequencies) of a term, as memory-mapped views """
+        if term_id + 1 >= len(self.term_offsets):
+            return self.docs[:0], self.tf[:0]
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.docs[start:end], self.tf[start:end]
+
+    def occurrences(self, term_id, docs):
+        """ Every occurrence of a term in the given local docs (sorted, all containing the term), as one
+            sorted int64 key per occurrence: local doc id << 32 | position
+        """
+        term_docs, term_tf = self.postings(term_id)
+        term_tf = np.asarray(term_tf, dtype=np.int64)
+        selected = np.searchsorted(term_docs, docs)
+        # where each selected posting's positions start, and how many it has
+        starts = self.term_positions[term_id] + np.cumsum(term_tf) - term_tf
+        starts, counts = starts[selected], term_tf[selected]
+        index = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+        return (np.repeat(docs.astype(np.int64), counts) << 32) | self.positions[index].astype(np.int64)
+
+class SearchIndex:
+    """ An inverted index over the corpus, made of segments.
+
+        Opening an index loads the vocabulary and the per-post arrays (length, topic, date: a few bytes
+        per post); postings and positions stay memory-mapped. Queries go through search.query.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version {self.manifest['version']} in {path}")
+        self.segments = [Segment(os.path.join(path, s["name"])) for s in self.manifest["segments"]]
+
+        self.vocab = {}
+        for segment in self.segments:
+            for term in segment.new_terms:
+                self.vocab[term] = len(self.vocab)
+        # global doc id = segment base + local doc id
+        self.bases = np.cumsum([0] + [len(segment) for segment in self.segments])
+        concat = lambda name, dtype: np.concatenate([np.asarray(getattr(s, name)) for s in self.segments] + [np.zeros(0, dtype)])
+        self.doc_length = concat("doc_length", np.int32)
+        self.topic = concat("topic", np.int16)
+        self.created = concat("created", np.int64)
+        self._post_ids = None
+
+    def __len__(self):
+        return int(self.bases[-1])
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    def post_id(self, doc):
+        s = int(np.searchsorted(self.bases, doc, side="right")) - 1
+        return self.segments[s].post_ids[int(doc - self.bases[s])]
+
+    def post_ids(self):
+        """ Every indexed post id, in doc id order (read once, then kept) """
+        if self._post_ids is None:
+            self._post_ids = [post_id for segment in self.segments for post_id in segment.post_ids]
+        return self._post_ids
+
+    def postings(self, term):
+        """ (global doc ids, term frequencies) of a term over every segment """
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        docs, tfs = [], []
+        for base, segment in zip(self.bases, self.segments):
+            d, tf = segment.postings(term_id)
+            docs.append(d.astype(np.int64) + base)
+            tfs.append(tf.astype(np.int64))
+        return np.concatenate(docs), np.concatenate(tfs)
+
+    def phrase_docs(self, terms):
+        """ (global doc ids, phrase frequencies) of the docs where terms occur one right after the other """
+        term_ids = [self.vocab.get(term) for term in terms]
+        if not terms or None in term_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        docs, counts = [], []
+        for base, segment in zip(self.bases, self.segments):
+            # only the docs that contain every term, starting from the rarest
+            postings = sorted((segment.postings(term_id)[0] for term_id in set(term_ids)), key=len)
+            common = np.asarray(postings[0], dtype=np.int64)
+            for term_docs in postings[1:]:
+                if len(common) == 0:
+                    break
+                found = np.minimum(np.searchsorted(term_docs, common), len(term_docs) - 1)
+                common = common[term_docs[found] == common]
+            if len(common) == 0:
+                continue
+            # keep the starts of the phrase: occurrences of term 0 followed by term i at +i
+            starts = segment.occurrences(term_ids[0], common)
+            for i, term_id in enumerate(term_ids[1:], 1):
+                following = segment.occurrences(term_id, common) - i
+                found = np.minimum(np.searchsorted(following, starts), len(following) - 1)
+                starts = starts[following[found] == starts]
+            local, count = np.unique(starts >> 32, return_counts=True)
+            docs.append(local + base)
+            counts.append(count)
+        return np.concatenate(docs + [np.zeros(0, dtype=np.int64)]), np.concatenate(counts + [np.zeros(0, dtype=np.int64)])
+
+class IndexWriter:
+    """ Adds posts to an index (creating it if needed). Posts already in the index are skipped, so
+        re-running on a grown corpus only indexes the new posts. A skipped post keeps the tokens, topic and
+        date it was first indexed with, even if it has been edited since: rebuild the index for that.
+        Every segment_size posts, and on close, the pending posts are written out as a new segment.
+    """
+
+    def __init__(self, path, segment_size=DEFAULT_SEGMENT_SIZE):
+        self.path = path
+        self.segment_size = segment_size
+        os.makedirs(path, exist_ok=True)
+        if SearchIndex.exists(path):
+            index = SearchIndex(path)
+            self.manifest = index.manifest
+            self.vocab = index.vocab
+            self.indexed = set(index.post_ids())
+        else:
+            self.manifest = {"version": FORMAT_VERSION, "n_terms": 0, "n_docs": 0, "n_tokens": 0, "next_segment": 0,
+                             "segments": []}
+            self.vocab = {}
+            self.indexed = set()
+        self.added = 0
+        self._reset()
+
+    def _reset(self):
+        self.terms = array("i")
+        self.docs = array("I")
+        self.positions = array("I")
+        self.post_ids = []
+        self.doc_length = []
+        self.topic = []
+        self.created = []
+        self.new_terms = []
+
+    def add(self, post_id, fields, topic=None, created_at=None):
+        """ Add a post from its token lists (see post_fields). Return False if it was already indexed. """
+        if post_id in self.indexed:
+            return False
+        self.indexed.add(post_id)
+        doc = len(self.post_ids)
+        position = 0
+        length = 0
+        for tokens in fields:
+            for token in tokens:
+                term_id = self.vocab.get(token)
+                if term_id is None:
+                    term_id = self.vocab[token] = len(self.vocab)
+                    self.new_terms.append(token)
+                self.terms.append(term_id)
+                self.docs.append(doc)
+                self.positions.append(position)
+                position += 1
+            length += len(tokens)
+            # the gap between fields
+            position += 1
+        self.post_ids.append(post_id)
+        self.doc_length.append(length)
+        self.topic.append(-1 if topic is None else int(topic))
+        self.created.append(_epoch_seconds(created_at))
+        self.added += 1
+        if len(self.post_ids) >= self.segment_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        """ Write the pending posts as a new segment and commit it to the manifest """
+        if not self.post_ids:
+            return
+        name = _segment_name(self.manifest)
+        _write_segment(os.path.join(self.path, name), np.frombuffer(self.terms, dtype=np.int32),
+                       np.frombuffer(self.docs, dtype=np.uint32), np.frombuffer(self.positions, dtype=np.uint32),
+                       len(self.vocab), self.post_ids, self.doc_length, self.topic, self.created, self.new_terms)
+        self.manifest["segments"].append({"name": name, "n_docs": len(self.post_ids), "n_tokens": len(self.terms)})
+        self.manifest["next_segment"] += 1
+        self.manifest["n_terms"] = len(self.vocab)
+        self.manifest["n_docs"] += len(self.post_ids)
+        self.manifest["n_tokens"] += len(self.terms)
+        _write_manifest(self.path, self.manifest)
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+
+def build_index(index_path, posts_json, root_words_json=None, topics_json=None, segment_size=DEFAULT_SEGMENT_SIZE):
+    """ Add the posts of a posts file (output.json with its "post" wrapper, or a post-keyed file like
+        consolidated_posts.json) that aren't indexed yet; return how many were added. Posts that are
+        already indexed are not updated.
+        Topics come from the posts' topic_idx, or from a post-keyed topics file like topic.json.
+    """
+    with open(posts_json, "r") as f:
+        posts = json.load(f)
+    if set(posts.keys()) == {"post"}:
+        posts = posts["post"]
+    root_words = {}
+    if root_words_json is not None:
+        with open(root_words_json, "r") as f:
+            root_words = json.load(f)
+    topics = {}
+    if topics_json is not None:
+        with open(topics_json, "r") as f:
+            topics = {post_id: entry.get("topic_idx") for post_id, entry in json.load(f).items()}
+
+    with IndexWriter(index_path, segment_size) as writer:
+        for post_id, post in posts.items():
+            writer.add(post_id, post_fields(post, root_words.get(post_id)), topics.get(post_id, post.get("topic_idx")),
+                       post.get("createdAt"))
+    return writer.added
+
+def _segment_name(manifest):
+    return f"seg-{manifest['next_segment']:05d}"
+
+def _write_manifest(path, manifest):
+    tmp_path = os.path.join(path, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, os.path.join(path, "manifest.json"))
+
+def compact(path):
+    """ Merge every segment of an index into one (fewer segments means fewer slices per query term) """
+    index = SearchIndex(path)
+    if len(index.segments) <= 1:
+        return
+    n_terms = len(index.vocab)
+    terms, docs, positions = [], [], []
+    for base, segment in zip(index.bases, index.segments):
+        term_positions = np.asarray(segment.term_positions)
+        terms.append(np.repeat(np.arange(len(term_positions) - 1, dtype=np.int32), np.diff(term_positions)))
+        docs.append(np.repeat(np.asarray(segment.docs, dtype=np.int64) + base, np.asarray(segment.tf, dtype=np.int64)))
+        positions.append(np.asarray(segment.positions, dtype=np.uint32))
+    # segments are in doc order, so every term's occurrences still are once concatenated
+    terms, docs, positions = np.concatenate(terms), np.concatenate(docs), np.concatenate(positions)
+
+    vocab = sorted(index.vocab, key=index.vocab.get)
+    name = _segment_name(index.manifest)
+    _write_segment(os.path.join(path, name), terms, docs, positions, n_terms, index.post_ids(),
+                   index.doc_length, index.topic, index.created, vocab)
+    old = [s["name"] for s in index.manifest["segments"]]
+    manifest = dict(index.manifest, segments=[{"name": name, "n_docs": len(index), "n_tokens": len(terms)}],
+                    next_segment=index.manifest["next_segment"] + 1)
+    del index
+    _write_manifest(path, manifest)
+    for name in old:
+        shutil.rmtree(os.path.join(path, name))
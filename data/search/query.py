@@ -0,0 +1,118 @@
+import math
+import re
+
+import numpy as np
+
+from .index import MISSING_DATE, tokenize
+
+# BM25 over a SearchIndex.
+#
+# A query is words and "quoted phrases": 'miss you "long distance"'. Words are optional and ranked
+# by BM25; every phrase is required (the post must contain its tokens next to each other) and adds
+# the BM25 score of its phrase frequency. Filters (topics, a date range) only keep posts that match.
+#
+# Words are tokenized like the indexed raw tokens. Post bodies are indexed both as written and by lemma,
+# so "loved" finds the bodies that say "loved" and "love" also finds the ones that say "loving".
+
+K1 = 1.2
+B = 0.75
+PHRASE = re.compile(r'"([^"]*)"')
+
+def parse_query(text):
+    """ (words, phrases): the unquoted tokens and the token lists of the quoted phrases """
+    phrases = [tokenize(phrase) for phrase in PHRASE.findall(text)]
+    words = tokenize(PHRASE.sub(" ", text))
+    return words, [phrase for phrase in phrases if phrase]
+
+def _date_seconds(date):
+    return int(np.datetime64(date, "s").astype(np.int64))
+
+class Searcher:
+    """ Answers queries on an open SearchIndex; keeps the BM25 length normalization of every post """
+
+    def __init__(self, index):
+        self.index = index
+        n_docs = len(index)
+        self.average_length = float(index.doc_length.mean()) if n_docs else 0.0
+        # the part of the BM25 denominator that only depends on the post
+        self.norm = (K1 * (1 - B + B * index.doc_length / max(self.average_length, 1e-9))).astype(np.float32)
+
+    def idf(self, df):
+        n_docs = len(self.index)
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def _bm25(self, docs, tf):
+        tf = tf.astype(np.float32)
+        return self.idf(len(docs)) * tf * (K1 + 1) / (tf + self.norm[docs])
+
+    def _filter(self, candidates, topics, after, before):
+        if topics is not None:
+            candidates = candidates[np.isin(self.index.topic[candidates], np.asarray(topics, dtype=np.int16))]
+        if after is not None or before is not None:
+            created = self.index.created[candidates]
+            keep = created != MISSING_DATE
+            if after is not None:
+                keep &= created >= _date_seconds(after)
+            if before is not None:
+                keep &= created < _date_seconds(before)
+            candidates = candidates[keep]
+        return candidates
+
+    def search(self, text, k=10, topics=None, after=None, before=None):
+        """ Top k posts for a query, best first
+            Params:
+                topics (list of ints): only posts whose topic_idx is one of these
+                after, before (strings, e.g. "2023-01-01"): only posts created in [after, before)
+            Return:
+                list of (post id, score)
+        """
+        words, phrases = parse_query(text)
+        docs, scores = [], []
+        for word in dict.fromkeys(words):
+            d, tf = self.index.postings(word)
+            if len(d):
+                docs.append(d)
+                scores.append(self._bm25(d, tf))
+
+        required = None
+        for phrase in phrases:
+            d, count = self.index.phrase_docs(phrase)
+            required = d if required is None else np.intersect1d(required, d, assume_unique=True)
+            if len(d):
+                docs.append(d)
+                scores.append(self._bm25(d, count))
+
+        if not docs or (required is not None and len(required) == 0):
+            return []
+        if sum(len(d) for d in docs) * 16 > len(self.index):
+            # many matches: add the scores up in one array over every post
+            every_total = np.zeros(len(self.index), dtype=np.float32)
+            for d, s in zip(docs, scores):
+                every_total[d] += s
+            if required is not None:
+                candidates = required
+            elif len(docs) == 1:
+                candidates = docs[0]
+            else:
+                # (nonzero is much faster on booleans than on the float totals)
+                matched = np.zeros(len(self.index), dtype=bool)
+                for d in docs:
+                    matched[d] = True
+                candidates = np.flatnonzero(matched)
+            candidates = self._filter(candidates, topics, after, before)
+            total = every_total[candidates]
+        else:
+            candidates = self._filter(np.unique(np.concatenate(docs)) if required is None else required, topics, after, before)
+            # few matches: look the candidates up in every word's / phrase's postings (they are sorted)
+            total = np.zeros(len(candidates), dtype=np.float32)
+            for d, s in zip(docs, scores):
+                found = np.searchsorted(d, candidates)
+                hit = found < len(d)
+                hit[hit] = d[found[hit]] == candidates[hit]
+                total[hit] += s[found[hit]]
+        if len(candidates) == 0:
+            return []
+
+        top = np.argpartition(-total, k - 1)[:k] if len(total) > k else np.arange(len(total))
+        top = top[np.lexsort((candidates[top], -total[top]))]
+        return [(self.index.post_id(candidates[i]), float(total[i])) for i in top]
@@ -0,0 +1,19 @@
+import os
+import sys
+
+# The pipeline code isn't installed as a package: the shared packages live in data/, generate.py and its
+# helpers in data/embeddings/, and the app's scripts are loaded by path (see load_script below).
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for directory in [os.path.join(REPO_ROOT, "data"), os.path.join(REPO_ROOT, "data", "embeddings")]:
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+import pytest
+
+def load_script(*path):
+    """ Import a pipeline script by its path under the repo root, skipping the test if its packages aren't installed """
+    from benchmarks.cases import Skip, load_script as load
+    try:
+        return load(os.path.join(REPO_ROOT, *path))
+    except Skip as e:
+        pytest.skip(str(e))
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from conftest import load_script
+
+@pytest.fixture(scope="module")
+def aggregate():
+    return load_script("app", "public", "data", "processing", "aggregate.py")
+
+def post(created_at, topic, score, comments):
+    return {"createdAt": created_at, "topic_idx": topic, "topic_label": f"topic {topic}",
+            "bodySentiment": {"score": score}, "numberOfComments": comments}
+
+POSTS = {
+    "p1": post("2022-05-02T10:00:00.000Z", 0, 1, 2),   # Monday
+    "p2": post("2022-05-08T23:59:59.000Z", 1, 3, 0),   # Sunday of the same week
+    "p3": post("2022-05-09T00:00:00.000Z", 0, -2, 5),  # next Monday
+    "p4": post("2022-06-15T12:00:00.000Z", 0, 5, 1),
+    "p5": post("", None, None, 0),                     # no date: in the index, not in the rollups
+}
+
+def run(aggregate, directory, posts, full=False):
+    (directory / "posts.json").write_text(json.dumps(posts))
+    n_changed = aggregate.aggregate(str(directory / "posts.json"), str(directory / "index.json"),
+                                    str(directory / "rollups.json"), full=full)
+    return n_changed, json.loads((directory / "index.json").read_text()), json.loads((directory / "rollups.json").read_text())
+
+def test_index_and_rollups(aggregate, tmp_path):
+    n_changed, index, rollups = run(aggregate, tmp_path, POSTS)
+    assert n_changed == 5
+    assert index["id"] == ["p1", "p2", "p3", "p4", "p5"]
+    assert index["createdAt"][0] == 1651485600 and index["createdAt"][4] is None
+    assert index["topic"] == [0, 1, 0, 0, -1]
+
+    month = rollups["month"]["total"]
+    assert month["period"] == ["2022-05", "2022-06"]
+    assert month["posts"] == [3, 1]
+    assert month["mean_score"] == [round(2 / 3, 3), 5.0]
+    assert month["median_score"] == [1.0, 5.0]
+    assert month["comments"] == [7, 1]
+
+    week = rollups["week"]["total"]
+    assert week["period"] == ["2022-05-02", "2022-05-09", "2022-06-13"]
+    assert week["posts"] == [2, 1, 1]
+
+    by_topic = rollups["month"]["by_topic"]
+    assert list(zip(by_topic["period"], by_topic["topic"], by_topic["posts"])) == [("2022-05", 0, 2), ("2022-05", 1, 1), ("2022-06", 0, 1)]
+    assert rollups["topics"] == {"0": "topic 0", "1": "topic 1"}
+
+def test_incremental_matches_full(aggregate, tmp_path):
+    run(aggregate, tmp_path, POSTS)
+    posts = dict(POSTS)
+    # one edited post moving to another month, one new post
+    posts["p2"] = post("2022-06-01T08:00:00.000Z", 1, -4, 3)
+    posts["p6"] = post("2022-07-04T08:00:00.000Z", 2, 0, 0)
+    n_changed, _, _ = run(aggregate, tmp_path, posts)
+    assert n_changed == 2
+    incremental = [(tmp_path / name).read_text() for name in ("index.json", "rollups.json")]
+
+    run(aggregate, tmp_path, posts, full=True)
+    assert [(tmp_path / name).read_text() for name in ("index.json", "rollups.json")] == incremental
+
+def test_removed_post_rebuilds(aggregate, tmp_path):
+    run(aggregate, tmp_path, POSTS)
+    posts = {post_id: p for post_id, p in POSTS.items() if post_id != "p4"}
+    _, _, rollups = run(aggregate, tmp_path, posts)
+    assert rollups["month"]["total"]["period"] == ["2022-05"]
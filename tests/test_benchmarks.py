@@ -0,0 +1,18 @@
+import pytest
+
+from benchmarks.cases import CASES, Skip
+from benchmarks.synthetic import SyntheticCorpus
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    return SyntheticCorpus(str(tmp_path_factory.mktemp("corpus")), 120, vocab_size=400)
+
+@pytest.mark.parametrize("case", CASES, ids=[case.name for case in CASES])
+def test_case_runs(case, corpus, tmp_path):
+    try:
+        run = case.setup(corpus, str(tmp_path))
+    except Skip as e:
+        pytest.skip(str(e))
+    # twice: a run mustn't reuse (or trip over) what the previous one left in the work dir
+    run()
+    run()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from conftest import load_script
+from cooccurrence import compute_sharded_co_occurrence_matrix, count_windows, tokenize_post
+
+# the dense triple loop compute_co_occurrence_matrix used to count with, kept as the reference
+def loop_counts(corpus, window_size):
+    words = sorted({w for doc in corpus for w in doc})
+    word2ind = {w: i for i, w in enumerate(words)}
+    M = np.zeros((len(words), len(words)))
+    for review in corpus:
+        for word_idx in range(len(review)):
+            min_index = 0 if word_idx - window_size < 0 else word_idx - window_size
+            max_index = len(review) - 1 if word_idx + window_size > len(review) - 1 else word_idx + window_size
+            for window_word in review[min_index:word_idx]:
+                M[word2ind[review[word_idx]], word2ind[window_word]] += 1
+            for window_word in review[word_idx + 1: max_index + 1]:
+                M[word2ind[review[word_idx]], word2ind[window_word]] += 1
+    return M, word2ind
+
+def random_corpus(seed, n_docs=40):
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i}" for i in range(30)]
+    # includes empty and one-word documents, and documents shorter than the window
+    return [[vocab[i] for i in rng.integers(0, len(vocab), rng.integers(0, 25))] for _ in range(n_docs)] + [[], ["w1"]]
+
+def encode(corpus, word2ind):
+    lengths = np.array([len(doc) for doc in corpus], dtype=np.int64)
+    flat = np.array([word2ind[w] for doc in corpus for w in doc], dtype=np.int64)
+    return flat, lengths
+
+@pytest.mark.parametrize("window_size", [1, 4, 7, 20])
+def test_count_windows_matches_loop(window_size):
+    corpus = random_corpus(window_size)
+    expected, word2ind = loop_counts(corpus, window_size)
+    flat, lengths = encode(corpus, word2ind)
+    M = count_windows(flat, lengths, len(word2ind), window_size)
+    np.testing.assert_array_equal(M.toarray(), expected)
+
+def test_count_windows_distance_weighting():
+    M = count_windows(np.array([0, 1, 2]), np.array([3]), 3, window_size=4, distance_weighting=True).toarray()
+    assert M[0, 1] == 1 and M[0, 2] == 0.5 and M[1, 0] == 1 and M[2, 0] == 0.5
+
+def test_count_windows_only_empty_documents():
+    M = count_windows(np.zeros(0, dtype=np.int64), np.array([0, 0]), 3, window_size=4)
+    assert M.shape == (3, 3) and M.nnz == 0
+
+def test_sharded_matches_loop():
+    posts = [(f"title {i}", " ".join(f"w{j % 7} w{(i * j) % 11}" for j in range(i % 9))) for i in range(50)]
+    expected, word2ind = loop_counts([tokenize_post(title, body) for title, body in posts], 4)
+    M, sharded_word2ind, _ = compute_sharded_co_occurrence_matrix(posts, window_size=4, shard_size=8, n_workers=2)
+    assert sharded_word2ind == word2ind
+    np.testing.assert_array_equal(M.toarray(), expected)
+
+def test_sharded_spill_keeps_other_files(tmp_path):
+    posts = [(f"title {i}", " ".join(f"w{j % 5}" for j in range(i % 6))) for i in range(30)]
+    expected, _ = compute_sharded_co_occurrence_matrix(posts, window_size=3, shard_size=4, n_workers=1)[:2]
+    # files that happen to look like spill files belong to the user and must survive
+    (tmp_path / "tokens-0.npz").write_text("mine")
+    (tmp_path / "partial-0-0.npz").write_text("mine")
+    M, _, _ = compute_sharded_co_occurrence_matrix(posts, window_size=3, shard_size=4, n_workers=2, spill_dir=str(tmp_path))
+    np.testing.assert_array_equal(M.toarray(), expected.toarray())
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["partial-0-0.npz", "tokens-0.npz"]
+
+def test_compute_sparse_co_occurrence_matrix_matches_loop(tmp_path):
+    generate = load_script("data", "embeddings", "generate.py")
+    corpus = random_corpus(0)
+    expected, expected_word2ind = loop_counts(corpus, 4)
+    M, word2ind = generate.compute_sparse_co_occurrence_matrix(corpus, 4, str(tmp_path / "word2ind.json"),
+                                                               str(tmp_path / "co-occurrence"))
+    assert word2ind == expected_word2ind
+    np.testing.assert_array_equal(M.toarray(), expected)
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+from conftest import REPO_ROOT, load_script
+from corpus_store import CorpusReader, CorpusWriter, build_store, export_posts, export_root_words
+
+PROCESSING = ("app", "public", "data", "processing")
+
+@pytest.fixture(scope="module")
+def json_creation():
+    return load_script(*PROCESSING, "json-creation.py")
+
+@pytest.fixture(scope="module")
+def cleanup():
+    return load_script(*PROCESSING, "combine-data", "cleanup.py")
+
+@pytest.fixture(scope="module")
+def posts(json_creation):
+    return json_creation.process_csv_to_json(os.path.join(REPO_ROOT, *PROCESSING, "uncleaned-data.csv"))
+
+def test_store_round_trips_output_json(posts, tmp_path):
+    (tmp_path / "output.json").write_text(json.dumps(posts, indent=4))
+    root_words = {post_id: post["title"].lower().split() for post_id, post in list(posts["post"].items())[::3]}
+    (tmp_path / "root-words.json").write_text(json.dumps(root_words, indent=4))
+    build_store(str(tmp_path / "store"), str(tmp_path / "output.json"), str(tmp_path / "root-words.json"))
+
+    reader = CorpusReader(str(tmp_path / "store"))
+    export_posts(reader, str(tmp_path / "exported.json"), indent=4, wrap="post")
+    export_root_words(reader, str(tmp_path / "exported-root-words.json"))
+    assert (tmp_path / "exported.json").read_text() == (tmp_path / "output.json").read_text()
+    assert (tmp_path / "exported-root-words.json").read_text() == (tmp_path / "root-words.json").read_text()
+
+    # single fields by post id
+    post_id, post = list(posts["post"].items())[len(posts["post"]) // 2]
+    assert reader.get(post_id, "body") == post["body"]
+    assert reader.get(post_id, "upVotes") == post["upVotes"]
+    assert reader.comments(post_id) == post["comments"]
+    assert list(reader.column("body")) == [post["body"] for post in posts["post"].values()]
+
+def test_absent_fields_stay_absent(tmp_path):
+    posts = {"sparse": {"title": "hi", "body": "x", "comments": [{"body": "c"}]},
+             "bare": {"bodySentiment": {"score": 1}},
+             "full": {"title": "t", "body": "", "createdAt": "", "upVotes": 0, "comments": []}}
+    with CorpusWriter(str(tmp_path / "store")) as writer:
+        for post_id, post in posts.items():
+            writer.add_post(post_id, post)
+
+    reader = CorpusReader(str(tmp_path / "store"))
+    assert dict(reader.iter_posts()) == posts
+    assert reader.get("full", "createdAt") == "" and reader.get("full", "upVotes") == 0
+    with pytest.raises(KeyError):
+        reader.get("sparse", "createdAt")
+    with pytest.raises(KeyError):
+        reader.get("bare", "comments")
+
+def test_failed_write_closes_the_column_files(tmp_path):
+    with pytest.raises(ValueError):
+        with CorpusWriter(str(tmp_path / "store")) as writer:
+            writer.add_post("a", {"title": "a"})
+            writer.add_post("a", {"title": "again"})
+    assert writer.post_ids.file.closed and all(column.file.closed for column in writer.post_columns.values())
+    assert not os.path.exists(tmp_path / "store" / "manifest.json")
+
+def test_json_creation_writes_store(json_creation, posts, tmp_path):
+    json_creation.write_store(posts, str(tmp_path / "store"))
+    assert dict(CorpusReader(str(tmp_path / "store")).iter_posts()) == posts["post"]
+
+@pytest.mark.parametrize("strategy", ["overwrite", "combine"])
+def test_cleanup_merges_store_inputs(cleanup, tmp_path, strategy):
+    main = {"a": {"title": "A", "body": "x", "comments": [{"body": "hi", "username": "u"}]},
+            "b": {"title": "B", "body": "y", "comments": []}}
+    sentiment = {"b": {"bodySentiment": {"score": 2}}, "c": {"bodySentiment": {"score": -1}}}
+    (tmp_path / "main.json").write_text(json.dumps(main))
+    (tmp_path / "sentiment.json").write_text(json.dumps(sentiment))
+    build_store(str(tmp_path / "main-store"), str(tmp_path / "main.json"))
+    export_posts(CorpusReader(str(tmp_path / "main-store")), str(tmp_path / "main-exported.json"), indent=None)
+
+    # merging a store is merging what it exports
+    from_json = [str(tmp_path / "main-exported.json"), str(tmp_path / "sentiment.json")]
+    from_store = [str(tmp_path / "main-store"), str(tmp_path / "sentiment.json")]
+    expected = cleanup.merge_posts(from_json, strategy)
+    assert cleanup.merge_posts(from_store, strategy) == expected
+    assert expected["a"]["comments"][0]["body"] == "hi" and expected["b"]["bodySentiment"] == {"score": 2}
+
+    output = tmp_path / "consolidated.json"
+    cleanup.merge_posts_partitioned(from_store, str(output), conflict_strategy=strategy, n_partitions=2, n_workers=1,
+                                    work_dir=str(tmp_path / "work"))
+    assert output.read_text() == json.dumps(expected, indent=4)
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import REPO_ROOT
+from instrumentation import configure, log, metrics, stage, timed
+
+@pytest.fixture
+def settings(tmp_path):
+    saved = dict(metrics._settings)
+    configure(metrics_path=str(tmp_path / "metrics.jsonl"), verbosity=1)
+    yield tmp_path / "metrics.jsonl"
+    metrics._settings.update(saved)
+
+def records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_log_verbosity(settings, capsys):
+    log(1, "progress")
+    log(2, "matrix dump")
+    configure(verbosity=0)
+    log(1, "quiet")
+    assert capsys.readouterr().out == "progress\n"
+
+def test_nested_stages_write_one_record_each(settings):
+    with stage("outer", letters=3) as outer:
+        with stage("inner"):
+            pass
+        outer["iterations"] = 7
+    inner, outer = records(settings)
+    assert (inner["stage"], inner["parent"]) == ("inner", "outer")
+    assert (outer["stage"], outer["parent"], outer["letters"], outer["iterations"]) == ("outer", None, 3, 7)
+    assert outer["seconds"] >= inner["seconds"] >= 0
+
+def test_timed_and_tracemalloc(settings):
+    configure(trace_memory=True)
+
+    @timed("allocate")
+    def allocate():
+        return bytearray(5_000_000)
+    allocate()
+    record, = records(settings)
+    assert record["stage"] == "allocate" and record["traced_peak_mb"] >= 5
+
+def test_nested_stage_keeps_the_enclosing_peak(settings):
+    configure(trace_memory=True)
+    with stage("outer"):
+        data = bytearray(20_000_000)
+        del data
+        with stage("inner"):
+            small = bytearray(1_000_000)
+        with stage("second inner"):
+            pass
+        del small
+    inner, second_inner, outer = records(settings)
+    assert 1 <= inner["traced_peak_mb"] < 20
+    assert second_inner["traced_peak_mb"] < 20
+    assert outer["traced_peak_mb"] >= 20
+
+def test_stage_errors_are_still_recorded(settings):
+    with pytest.raises(ValueError):
+        with stage("failing"):
+            raise ValueError()
+    assert records(settings)[0]["stage"] == "failing"
+
+@pytest.mark.parametrize("verbosity, quiet", [("0", True), ("1", False)])
+def test_pipeline_scripts_are_quiet_at_verbosity_0(tmp_path, verbosity, quiet):
+    posts = tmp_path / "posts.json"
+    posts.write_text(json.dumps({"p1": {"createdAt": "2022-05-02T10:00:00.000Z", "topic_idx": 0}}))
+    output = subprocess.run([sys.executable, os.path.join(REPO_ROOT, "app", "public", "data", "processing", "aggregate.py"),
+                             "--posts", str(posts), "--index", str(tmp_path / "index.json"), "--rollups", str(tmp_path / "rollups.json")],
+                            capture_output=True, text=True, check=True, env=dict(os.environ, PIPELINE_VERBOSITY=verbosity))
+    assert (output.stdout == "") == quiet
@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import load_script
+
+@pytest.fixture(scope="module")
+def layout():
+    return load_script("app", "public", "data", "topic-modeling", "layout.py")
+
+@pytest.fixture
+def letters(layout, tmp_path, monkeypatch):
+    from topic_weights import TOPIC_WEIGHTS_FILEPATH, saveTopicWeights, topK
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "results").mkdir()
+    rng = np.random.default_rng(0)
+    # whitened, so every direction has the same variance and the two PCA solvers pick different components
+    weights = rng.standard_normal((60, 6))
+    weights -= weights.mean(axis=0)
+    weights = (weights @ np.linalg.inv(np.linalg.cholesky(np.cov(weights.T))).T).astype(np.float32)
+
+    def save(postIds, weights):
+        saveTopicWeights(TOPIC_WEIGHTS_FILEPATH, postIds, weights, topK(weights, 2)[0])
+    postIds = [f"p{i}" for i in range(len(weights))]
+    save(postIds, weights)
+    outputs = {method: str(tmp_path / "results" / f"{method}.json") for method in layout.OUTPUT_FILEPATHS}
+    return postIds, weights, save, outputs
+
+# (t-SNE starts from the PCA layout, so with tsne first "pca" only reuses it after randomized-pca has run)
+@pytest.mark.parametrize("methods", [["pca", "randomized-pca"], ["tsne", "randomized-pca", "pca"], ["tsne", "knn-graph"]])
+def test_place_new_lands_copies_on_their_originals(layout, letters, methods):
+    postIds, weights, save, outputs = letters
+    layout.run(methods, cacheDir=None, perplexity=5, outputFilepaths=outputs)
+    before = {method: json.load(open(outputs[method])) for method in methods}
+
+    # two new letters with the same weights as letters 3 and 17
+    save(postIds + ["new-a", "new-b"], np.vstack([weights, weights[[3, 17]]]))
+    layout.runPlacement(methods, outputFilepaths=outputs)
+
+    for method in methods:
+        points = json.load(open(outputs[method]))
+        assert points[:60] == before[method]
+        for placed, original in [(points[60], points[3]), (points[61], points[17])]:
+            assert placed == pytest.approx(original, abs=1e-5)
+        delta = json.load(open(layout.deltaPath(outputs[method])))
+        assert [(d["index"], d["post_id"]) for d in delta] == [(60, "new-a"), (61, "new-b")]
+
+def test_place_new_rejects_changed_letters(layout, letters):
+    postIds, weights, save, outputs = letters
+    layout.run(["pca"], cacheDir=None, outputFilepaths=outputs)
+    save(["other"] + postIds[1:], weights)
+    with pytest.raises(ValueError):
+        layout.runPlacement(["pca"], outputFilepaths=outputs)
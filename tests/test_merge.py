@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from conftest import load_script
+
+@pytest.fixture(scope="module")
+def cleanup():
+    return load_script("app", "public", "data", "processing", "combine-data", "cleanup.py")
+
+def write_inputs(directory):
+    inputs = [
+        {"b": {"title": "B", "tags": ["x"]}, "a": {"title": "A", "tags": ["x"], "meta": {"n": 1}}},
+        {"a": {"title": "A2", "tags": ["x", "y"], "meta": {"m": 2}, "score": 3}, "c": {"title": "C"}},
+        {"d": {"title": "D"}, "b": {"score": 1}},
+    ]
+    files = []
+    for i, data in enumerate(inputs):
+        path = directory / f"input-{i}.json"
+        path.write_text(json.dumps(data))
+        files.append(str(path))
+    return files
+
+def test_conflict_strategies(cleanup, tmp_path):
+    files = write_inputs(tmp_path)
+    overwrite = cleanup.merge_posts(files, "overwrite")
+    keep = cleanup.merge_posts(files, "keep_original")
+    combine = cleanup.merge_posts(files, "combine")
+
+    assert overwrite["a"] == {"title": "A2", "tags": ["x", "y"], "meta": {"m": 2}, "score": 3}
+    assert keep["a"] == {"title": "A", "tags": ["x"], "meta": {"n": 1}, "score": 3}
+    assert combine["a"] == {"title": "A2", "tags": ["x", "y"], "meta": {"n": 1, "m": 2}, "score": 3}
+    # fields only one input has are always kept
+    assert keep["b"] == {"title": "B", "tags": ["x"], "score": 1}
+
+def test_unknown_strategy(cleanup, tmp_path):
+    with pytest.raises(ValueError):
+        cleanup.merge_posts(write_inputs(tmp_path), "newest")
+
+@pytest.mark.parametrize("strategy", ["overwrite", "keep_original", "combine"])
+@pytest.mark.parametrize("indent, n_workers", [(None, 1), (4, 1), (4, 2)])
+def test_partitioned_merge_matches_merge_posts(cleanup, tmp_path, strategy, indent, n_workers):
+    files = write_inputs(tmp_path)
+    output = tmp_path / "consolidated.json"
+    cleanup.merge_posts_partitioned(files, str(output), conflict_strategy=strategy, n_partitions=3, n_workers=n_workers,
+                                    work_dir=str(tmp_path / "work"), indent=indent)
+
+    expected = cleanup.merge_posts(files, strategy)
+    # same posts, in first-seen order, formatted like json.dump
+    assert list(json.loads(output.read_text())) == ["b", "a", "c", "d"]
+    assert output.read_text() == json.dumps(expected, indent=indent)
+
+def test_partitioned_merge_reuses_work_dir(cleanup, tmp_path):
+    files = write_inputs(tmp_path)
+    work_dir = tmp_path / "work"
+    cleanup.merge_posts_partitioned(files, str(tmp_path / "first.json"), n_partitions=2, n_workers=1, work_dir=str(work_dir))
+    reduced = sorted(work_dir.glob("reduce/*/part-*.jsonl"))
+    mtimes = [path.stat().st_mtime_ns for path in reduced]
+
+    cleanup.merge_posts_partitioned(files, str(tmp_path / "second.json"), n_partitions=2, n_workers=1, work_dir=str(work_dir))
+    assert [path.stat().st_mtime_ns for path in reduced] == mtimes
+    assert (tmp_path / "first.json").read_text() == (tmp_path / "second.json").read_text()
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from conftest import load_script
+
+TOPIC_MODELING = ("app", "public", "data", "topic-modeling")
+
+@pytest.fixture(scope="module")
+def preprocess_cache():
+    return load_script(*TOPIC_MODELING, "preprocess_cache.py")
+
+def test_cache_hits_edits_and_versions(preprocess_cache, tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = preprocess_cache.PreprocessCache(path, "1")
+    assert not cache.has("p1", "i miss you")
+    cache.put("p1", "i miss you", ["miss"])
+    cache.close()
+
+    cache = preprocess_cache.PreprocessCache(path, "1")
+    assert cache.has("p1", "i miss you")
+    assert cache.get("p1", "i miss you") == ["miss"]
+    # an edited body is a miss, and storing it drops the old entry
+    assert not cache.has("p1", "i still miss you")
+    cache.put("p1", "i still miss you", ["miss"])
+    assert cache.get("p1", "i miss you") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "entries": 1, "bytes": len('["miss"]')}
+    cache.close()
+
+    # a new pipeline version never sees the old entries
+    cache = preprocess_cache.PreprocessCache(path, "2")
+    assert not cache.has("p1", "i still miss you")
+    cache.close()
+
+def test_cache_evicts_least_recently_used(preprocess_cache):
+    cache = preprocess_cache.PreprocessCache(":memory:", "1")
+    for i in range(4):
+        cache.put(f"p{i}", "body", ["word"] * 10)
+    assert cache.has("p0", "body")  # p0 is now the most recently used
+    size = cache.stats()["bytes"] // 4
+
+    assert cache.evict(maxBytes=2 * size) == 2
+    assert cache.has("p0", "body") and cache.has("p3", "body")
+    assert cache.get("p1", "body") is None and cache.get("p2", "body") is None
+    assert cache.evict(maxAgeDays=0) == 2
+    assert cache.stats()["entries"] == 0
+
+POSTS = {
+    "p1": {"title": "a", "body": "I can’t stop thinking about you. I love you!"},
+    "p2": {"title": "b", "body": "URL: https://example.com"},
+    "p3": {"title": "c", "body": ""},
+    "p4": {"title": "d", "body": "We walked by the ocean every evening."},
+}
+
+@pytest.fixture(scope="module")
+def preprocess():
+    return load_script(*TOPIC_MODELING, "preprocess-data.py")
+
+def run(preprocess, directory, postsFilepath=None, storePath=None):
+    cache = preprocess.PreprocessCache(str(directory / "cache.sqlite"), preprocess.PIPELINE_VERSION)
+    preprocess.run(postsFilepath, str(directory / "bag.txt"), str(directory / "root-words.json"),
+                   batchSize=2, cache=cache, storePath=storePath)
+    cache.close()
+    return (directory / "root-words.json").read_text(), (directory / "bag.txt").read_text()
+
+def test_run_from_posts_file_or_store(preprocess, tmp_path):
+    from corpus_store import build_store
+    postsFilepath = tmp_path / "output.json"
+    postsFilepath.write_text(json.dumps({"post": POSTS}))
+    build_store(str(tmp_path / "store"), str(postsFilepath))
+
+    (tmp_path / "json").mkdir()
+    (tmp_path / "store-run").mkdir()
+    fromJson = run(preprocess, tmp_path / "json", postsFilepath=str(postsFilepath))
+    # the store run never looks at a posts file
+    fromStore = run(preprocess, tmp_path / "store-run", storePath=str(tmp_path / "store"))
+
+    rootWords = json.loads(fromJson[0])
+    assert list(rootWords) == ["p1", "p4"]
+    assert rootWords["p1"] == preprocess.processText(POSTS["p1"]["body"])
+    assert fromJson[0] == json.dumps(rootWords, indent=4)
+    assert fromStore == fromJson
+
+def test_rerun_only_processes_changed_posts(preprocess, tmp_path):
+    postsFilepath = tmp_path / "output.json"
+    postsFilepath.write_text(json.dumps({"post": POSTS}))
+    first = run(preprocess, tmp_path, postsFilepath=str(postsFilepath))
+
+    cache = preprocess.PreprocessCache(str(tmp_path / "cache.sqlite"), preprocess.PIPELINE_VERSION)
+    assert cache.has("p1", POSTS["p1"]["body"]) and cache.has("p4", POSTS["p4"]["body"])
+    cache.close()
+    assert run(preprocess, tmp_path, postsFilepath=str(postsFilepath)) == first
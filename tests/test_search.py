@@ -0,0 +1,156 @@
+import json
+import math
+import os
+import subprocess
+
+import numpy as np
+import pytest
+
+from conftest import REPO_ROOT
+from pipeline.stages import STAGES
+from search import SearchIndex, Searcher, build_index, compact, post_fields
+from search.query import B, K1
+
+def make_posts(n_posts=120, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = ["i", "love", "you", "miss", "long", "distance", "heart", "forever", "my", "the"]
+    def text(n):
+        return " ".join(vocab[i] for i in rng.zipf(1.3, n) % len(vocab))
+    posts = {}
+    for i in range(n_posts):
+        posts[f"p{i:03d}"] = {
+            "title": text(int(rng.integers(1, 5))),
+            "body": text(int(rng.integers(0, 30))),
+            "comments": [{"body": text(int(rng.integers(1, 8)))} for _ in range(int(rng.integers(0, 3)))],
+            "topic_idx": int(i % 4),
+            "createdAt": f"2023-{i % 12 + 1:02d}-15T12:00:00.000Z",
+        }
+    return posts
+
+def write_posts(path, posts):
+    path.write_text(json.dumps(posts))
+    return str(path)
+
+def brute_force(posts, words=(), phrases=(), topics=None, after=None, before=None):
+    """ BM25 straight from the definition, scanning every post """
+    fields = {post_id: post_fields(post) for post_id, post in posts.items()}
+    tokens = {post_id: [t for field in f for t in field] for post_id, f in fields.items()}
+    n_docs = len(posts)
+    average_length = sum(len(t) for t in tokens.values()) / n_docs
+    scores = {}
+
+    def add(counts):
+        df = len(counts)
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for post_id, tf in counts.items():
+            norm = K1 * (1 - B + B * len(tokens[post_id]) / average_length)
+            scores[post_id] = scores.get(post_id, 0) + idf * tf * (K1 + 1) / (tf + norm)
+
+    for word in dict.fromkeys(words):
+        add({post_id: t.count(word) for post_id, t in tokens.items() if word in t})
+    required = None
+    for phrase in phrases:
+        counts = {}
+        for post_id, f in fields.items():
+            count = sum(field[i:i + len(phrase)] == phrase for field in f for i in range(len(field) - len(phrase) + 1))
+            if count:
+                counts[post_id] = count
+        add(counts)
+        required = set(counts) if required is None else required & set(counts)
+
+    def keep(post_id):
+        post = posts[post_id]
+        created = post["createdAt"][:10]
+        return ((required is None or post_id in required) and (topics is None or post["topic_idx"] in topics)
+                and (after is None or created >= after) and (before is None or created < before))
+    return sorted(((post_id, s) for post_id, s in scores.items() if keep(post_id)), key=lambda item: (-item[1], item[0]))
+
+QUERIES = [
+    ("love", dict(words=["love"]), {}),
+    ("miss you forever", dict(words=["miss", "you", "forever"]), {}),
+    ('"i love you"', dict(phrases=[["i", "love", "you"]]), {}),
+    ('heart "long distance"', dict(words=["heart"], phrases=[["long", "distance"]]), {}),
+    ('"you you" "love you"', dict(phrases=[["you", "you"], ["love", "you"]]), {}),
+    ("love heart", dict(words=["love", "heart"]), dict(topics=[1, 3])),
+    ("love", dict(words=["love"]), dict(after="2023-03-01", before="2023-06-01")),
+    ("unknownword", dict(words=["unknownword"]), {}),
+]
+
+@pytest.fixture(scope="module")
+def posts():
+    return make_posts()
+
+@pytest.fixture(scope="module")
+def searcher(posts, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("search")
+    build_index(str(directory / "index"), write_posts(directory / "posts.json", posts))
+    return Searcher(SearchIndex(str(directory / "index")))
+
+def assert_same_results(results, expected):
+    assert [post_id for post_id, _ in results] == [post_id for post_id, _ in expected]
+    np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], rtol=1e-4)
+
+@pytest.mark.parametrize("query, terms, filters", QUERIES)
+def test_search_matches_brute_force(posts, searcher, query, terms, filters):
+    assert_same_results(searcher.search(query, k=20, **filters), brute_force(posts, **terms, **filters)[:20])
+
+def test_phrase_needs_adjacent_tokens_in_one_field(tmp_path):
+    posts = {
+        "adjacent": {"title": "", "body": "i really miss you", "comments": []},
+        "apart": {"title": "", "body": "miss the old you", "comments": []},
+        "across_fields": {"title": "i miss", "body": "you", "comments": []},
+    }
+    build_index(str(tmp_path / "index"), write_posts(tmp_path / "posts.json", posts))
+    searcher = Searcher(SearchIndex(str(tmp_path / "index")))
+    assert [post_id for post_id, _ in searcher.search('"miss you"')] == ["adjacent"]
+
+def test_body_matches_as_written_and_by_lemma(tmp_path):
+    posts = {"letter": {"title": "", "body": "I loved your letters", "comments": []},
+             "other": {"title": "", "body": "see you soon", "comments": []}}
+    (tmp_path / "root-words.json").write_text(json.dumps({"letter": ["love", "letter"], "other": ["see"]}))
+    build_index(str(tmp_path / "index"), write_posts(tmp_path / "posts.json", posts), str(tmp_path / "root-words.json"))
+    searcher = Searcher(SearchIndex(str(tmp_path / "index")))
+    for query in ["letters", "loved", "letter", "love", '"loved your letters"']:
+        assert [post_id for post_id, _ in searcher.search(query)] == ["letter"], query
+
+def test_incremental_and_compacted_index_match_full_build(posts, searcher, tmp_path):
+    items = list(posts.items())
+    index_path = str(tmp_path / "index")
+    # three segments of 25 posts, then the rest
+    assert build_index(index_path, write_posts(tmp_path / "first.json", dict(items[:50])), segment_size=25) == 50
+    assert build_index(index_path, write_posts(tmp_path / "all.json", posts), segment_size=25) == len(posts) - 50
+    assert build_index(index_path, str(tmp_path / "all.json")) == 0
+
+    incremental = Searcher(SearchIndex(index_path))
+    assert len(incremental.index.segments) > 1
+    for query, _, filters in QUERIES:
+        assert_same_results(incremental.search(query, k=20, **filters), searcher.search(query, k=20, **filters))
+
+    compact(index_path)
+    compacted = Searcher(SearchIndex(index_path))
+    assert len(compacted.index.segments) == 1
+    for query, _, filters in QUERIES:
+        assert_same_results(compacted.search(query, k=20, **filters), searcher.search(query, k=20, **filters))
+
+def test_search_index_stage_picks_up_edited_posts(tmp_path):
+    stage = next(stage for stage in STAGES if stage.name == "search-index")
+
+    posts = {"a": {"title": "", "body": "i love you", "comments": [], "topic_idx": 1},
+             "b": {"title": "", "body": "hello", "comments": [], "topic_idx": 0}}
+    posts_path = write_posts(tmp_path / "posts.json", posts)
+    (tmp_path / "root-words.json").write_text("{}")
+    # the stage's own command, pointed at temporary files
+    paths = {"search/index": str(tmp_path / "index"), stage.command[stage.command.index("--posts") + 1]: posts_path,
+             stage.command[stage.command.index("--root-words") + 1]: str(tmp_path / "root-words.json")}
+    command = [paths.get(arg, arg) for arg in stage.command]
+
+    subprocess.run(command, cwd=os.path.join(REPO_ROOT, stage.cwd), check=True)
+    posts["a"]["topic_idx"] = 3
+    posts["a"]["comments"].append({"body": "goodbye"})
+    write_posts(tmp_path / "posts.json", posts)
+    subprocess.run(command, cwd=os.path.join(REPO_ROOT, stage.cwd), check=True)
+
+    searcher = Searcher(SearchIndex(str(tmp_path / "index")))
+    assert [post_id for post_id, _ in searcher.search("love", topics=[3])] == ["a"]
+    assert [post_id for post_id, _ in searcher.search("goodbye")] == ["a"]
+    assert len(searcher.index) == 2
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from conftest import load_script
+
+SENTIMENT_ANALYSIS = ("app", "public", "data", "sentiment-analysis")
+
+@pytest.fixture(scope="module")
+def afinn_sentiment():
+    pytest.importorskip("afinn")
+    module = load_script(*SENTIMENT_ANALYSIS, "afinn_sentiment.py")
+    module.loadLexicon()
+    return module
+
+@pytest.fixture(scope="module")
+def analysis(afinn_sentiment):
+    return load_script(*SENTIMENT_ANALYSIS, "analysis.py")
+
+def result(score, comparative, calculation, tokens, words, positive, negative):
+    return {"score": score, "comparative": comparative, "calculation": calculation, "tokens": tokens,
+            "words": words, "positive": positive, "negative": negative}
+
+# What the npm sentiment package (v5) returns from sentiment.analyze(text), worked out by hand from
+# AFINN-165 (good 3, happy 3, love 3, bad -3, hate -3)
+EXPECTED = {
+    # a negator right before a word flips its score
+    "I do not love this.": result(-3, -0.6, [{"love": -3}], ["i", "do", "not", "love", "this"],
+                                  ["love"], [], ["love"]),
+    "don't hate it": result(3, 1, [{"hate": 3}], ["don't", "hate", "it"], ["hate"], ["hate"], []),
+    # ... but not one two words back
+    "not very good": result(3, 1, [{"good": 3}], ["not", "very", "good"], ["good"], ["good"], []),
+    # tokens are walked from last to first
+    "Good, bad and happy!": result(3, 0.75, [{"happy": 3}, {"bad": -3}, {"good": 3}],
+                                   ["good", "bad", "and", "happy"], ["happy", "bad", "good"],
+                                   ["happy", "good"], ["bad"]),
+    "": result(0, 0, [], [""], [], [], []),
+}
+
+@pytest.mark.parametrize("text", list(EXPECTED))
+def test_analyze_matches_the_npm_package(afinn_sentiment, text):
+    assert afinn_sentiment.analyze(text) == EXPECTED[text]
+
+def test_whole_numbers_are_written_like_json_stringify(afinn_sentiment, analysis):
+    # 9 / 3 tokens: JSON.stringify writes 3, not 3.0
+    assert json.dumps(afinn_sentiment.analyze("Love love love")["comparative"]) == "3"
+    assert json.dumps(afinn_sentiment.analyze("love it")["comparative"]) == "1.5"
+
+    post = {"title": "", "body": "", "comments": [{"body": "good"}, {"body": "happy"}]}
+    results = {text: afinn_sentiment.analyze(text) for text in ["", "good", "happy", "bad"]}
+    assert json.dumps(analysis.postSentiment(post, results)["averageCommentScore"]) == "3"
+    post["comments"].append({"body": "bad"})
+    assert json.dumps(analysis.postSentiment(post, results)["averageCommentScore"]) == "1"
+    post["comments"].append({"body": ""})
+    assert json.dumps(analysis.postSentiment(post, results)["averageCommentScore"]) == "0.75"
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+from artifacts import ArtifactStore
+from similarity import WordIndex, top_k
+
+def unit_vectors(n_words=500, dim=16, seed=0):
+    M = np.random.default_rng(seed).standard_normal((n_words, dim))
+    M /= np.linalg.norm(M, axis=1, keepdims=True)
+    return M, {f"w{i}": i for i in range(n_words)}
+
+def brute_force(M, row, k):
+    scores = M @ M[row]
+    scores[row] = -np.inf
+    return np.argsort(-scores, kind="stable")[:k]
+
+def test_top_k_is_sorted_and_exact():
+    scores = np.random.default_rng(1).random((4, 50))
+    np.testing.assert_array_equal(top_k(scores, 5), np.argsort(-scores, axis=1)[:, :5])
+
+def test_exact_search_matches_brute_force_across_blocks():
+    M, word2ind = unit_vectors()
+    # blocks smaller than k, so the running top-k is merged many times
+    index = WordIndex(M, word2ind, block_size=7)
+    results = index.most_similar_batch(["w0", "w42", "w499"], k=10)
+    for word, result in zip(["w0", "w42", "w499"], results):
+        expected = brute_force(M, word2ind[word], 10)
+        assert [w for w, _ in result] == [f"w{i}" for i in expected]
+        assert word not in [w for w, _ in result]
+
+def test_approximate_search_recall():
+    M, word2ind = unit_vectors()
+    index = WordIndex(M, word2ind).build_lsh(n_tables=16, n_bits=6)
+    words = [f"w{i}" for i in range(0, 500, 25)]
+    exact = index.most_similar_batch(words, k=10)
+    approximate = index.most_similar_batch(words, k=10, approximate=True)
+    recall = np.mean([len({w for w, _ in a} & {w for w, _ in e}) / 10 for a, e in zip(approximate, exact)])
+    assert recall >= 0.8
+    # the scores of what it does find are the true similarities
+    for word, result in zip(words, approximate):
+        for w, s in result:
+            assert s == pytest.approx(float(M[word2ind[w]] @ M[word2ind[word]]))
+
+def test_unknown_word():
+    M, word2ind = unit_vectors(10)
+    with pytest.raises(KeyError):
+        WordIndex(M, word2ind).most_similar("missing")
+
+def test_lsh_index_is_cached_and_rebuilt_for_other_vectors(tmp_path):
+    artifacts = ArtifactStore(str(tmp_path / "cache"))
+    M, word2ind = unit_vectors()
+    index = WordIndex(M, word2ind)
+    key = artifacts.key("lsh_index", vectors=index.fingerprint().tolist())
+    fname = artifacts.path(key) + ".npz"
+    index.load_or_build_lsh(fname)
+    artifacts.touch(key)
+    assert os.path.exists(fname) and os.path.basename(fname) in artifacts.manifest[key]["files"]
+
+    loaded = WordIndex(M, word2ind)
+    assert loaded.load_lsh(fname)
+    np.testing.assert_array_equal(loaded.bucket_words, index.bucket_words)
+
+    # other vectors never pick up this index
+    other, _ = unit_vectors(seed=1)
+    assert not WordIndex(other, word2ind).load_lsh(fname)
@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import REPO_ROOT, load_script
+
+TOPIC_MODELING = os.path.join(REPO_ROOT, "app", "public", "data", "topic-modeling")
+SCRIPTS = ["update-topics.py", "LDA-topic-modeling.py", "topic_model_store.py", "topic_weights.py"]
+
+def root_words(post_ids, seed):
+    rng = np.random.default_rng(seed)
+    themes = [["miss", "distance", "call", "far", "plane"], ["love", "heart", "forever", "kiss", "ring"]]
+    return {post_id: [str(w) for w in rng.choice(themes[i % 2], 12)] for i, post_id in enumerate(post_ids)}
+
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    """ A copy of the topic-modeling folder (scripts linked, results empty) with an LDA model fit on 40 letters """
+    data = tmp_path_factory.mktemp("data")
+    scripts = data / "topic-modeling"
+    (scripts / "results").mkdir(parents=True)
+    for name in SCRIPTS:
+        os.symlink(os.path.join(TOPIC_MODELING, name), scripts / name)
+    (data / "cleaned-root-words.json").write_text(json.dumps(root_words([f"p{i}" for i in range(40)], 0)))
+    subprocess.run([sys.executable, "LDA-topic-modeling.py"], cwd=scripts, check=True,
+                   env=dict(os.environ, PIPELINE_VERBOSITY="0"))
+    return data
+
+@pytest.fixture(scope="module")
+def update_topics(workdir):
+    return load_script(str(workdir / "topic-modeling" / "update-topics.py"))
+
+def test_drift_is_measured_with_the_saved_model(workdir, update_topics, monkeypatch):
+    from topic_model_store import driftError, loadModel
+    modelFilepath = str(workdir / "topic-modeling" / "results" / "lda-model.joblib")
+    rootWords = root_words([f"p{i}" for i in range(48)], 0)
+    rootWordsFilepath = workdir / "grown-root-words.json"
+    rootWordsFilepath.write_text(json.dumps(rootWords))
+
+    saved = loadModel(modelFilepath)
+    dtm = saved["vectorizer"].transform([" ".join(rootWords[f"p{i}"]) for i in range(40, 48)])
+    expected = driftError("lda", saved["model"], dtm, saved["model"].transform(dtm)) / saved["baseline_error"]
+
+    measured = []
+    measureDrift = update_topics.measureDrift
+    def spy(*args):
+        measured.append(measureDrift(*args))
+        return measured[-1]
+    monkeypatch.setattr(update_topics, "measureDrift", spy)
+    assert update_topics.update(modelFilepath, str(rootWordsFilepath), maxErrorRatio=100) == "appended"
+    assert measured[0][1] == pytest.approx(expected)
+    # the update is kept only after the drift check passed
+    assert loadModel(modelFilepath)["n_docs"] == 48
+
+def test_refit_reads_the_given_root_words(workdir, update_topics):
+    modelFilepath = str(workdir / "topic-modeling" / "results" / "lda-model.joblib")
+    rootWordsFilepath = workdir / "elsewhere" / "root-words.json"
+    rootWordsFilepath.parent.mkdir()
+    rootWordsFilepath.write_text(json.dumps(root_words([f"q{i}" for i in range(30)], 1)))
+
+    assert update_topics.update(modelFilepath, str(rootWordsFilepath), maxOOVRate=-1) == "refit"
+    with open(workdir / "topic-modeling" / "results" / "lda_top_topics_with_weights.json") as f:
+        assert [post["post_id"] for post in json.load(f)] == [f"q{i}" for i in range(30)]